@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_body.py
+ * @description Cost of one email per event as the stderr tail grows: rendering the body
+ * (and the gzip attachment), building the MIME message and serializing it as it goes on
+ * the wire. Unlimited (ERRMAIL_BODY_MAX_BYTES=0, the whole tail inline) vs the default
+ * 64KB budget with the full tail attached gzip-compressed.
+ *
+ * Reported per event: time, tracemalloc peak, message size, inline body size and the
+ * attachment size.
+ *
+ * Usage:
+ *   python benchmarks/bench_body.py [--events 5] [--budget 65536]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.config import load_config  # noqa: E402
+from errmail.mailer import TAIL_ATTACHMENT, MailPayload, _build_message, render_body, tail_attachment  # noqa: E402
+from errmail.utils import TailSnapshot  # noqa: E402
+
+# (tail lines, bytes per line)
+_CASES = ((200, 120), (2000, 120), (2000, 4096), (10000, 2048))
+
+_EXCERPT = 'Traceback (most recent call last):\n  File "app.py", line 10, in <module>\n    main()\nValueError: bad input\n'
+
+
+def make_tail(n: int, width: int) -> TailSnapshot:
+    """/**
+     * @param {number} n lines
+     * @param {number} width bytes per line
+     * @returns {TailSnapshot} shaped like the detector's ring buffer
+     */"""
+
+    return TailSnapshot(
+        tuple(f"2024-01-01T00:00:{i % 60:02d} WARN worker-{i % 16} request={i:08d} " + "x" * width + "\n" for i in range(n))
+    )
+
+
+def one_event(tail: TailSnapshot, budget: int) -> tuple[int, int, int]:
+    """/**
+     * @returns {[number, number, number]} (message bytes, inline body bytes, attachment bytes)
+     */"""
+
+    body, clipped = render_body(
+        service="bench",
+        command=["python", "app.py"],
+        cwd="/srv/app",
+        pid=1234,
+        exit_code=None,
+        kind="python-traceback",
+        fp="abc",
+        message="ValueError: bad input",
+        excerpt=_EXCERPT,
+        tail=tail,
+        max_bytes=budget,
+        attachment=TAIL_ATTACHMENT if budget else "",
+    )
+    attachments = (tail_attachment(tail),) if clipped else ()
+    msg = _build_message(load_config(service="bench"), MailPayload(subject="bench", body=body, attachments=attachments))
+    wire = msg.as_bytes()
+    return len(wire), len(body.encode("utf-8")), sum(len(data) for _, data in attachments)
+
+
+def run(tail: TailSnapshot, budget: int, events: int) -> tuple[float, int, tuple[int, int, int]]:
+    """/**
+     * @returns {[number, number, Array<number>]} (seconds per event, peak bytes per event, sizes)
+     */"""
+
+    one_event(tail, budget)  # warm up imports
+    t0 = time.perf_counter()
+    for _ in range(events):
+        sizes = one_event(tail, budget)
+    secs = (time.perf_counter() - t0) / events
+    tracemalloc.start()
+    peak = 0
+    for _ in range(events):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        one_event(tail, budget)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return secs, peak, sizes
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=5)
+    ap.add_argument("--budget", type=int, default=64 * 1024, help="ERRMAIL_BODY_MAX_BYTES to compare with unlimited")
+    args = ap.parse_args()
+
+    print(f"per event: render + gzip attachment + MIME build + serialize; budget {args.budget} bytes vs unlimited")
+    print(
+        f"  {'tail':>12} {'mode':<9} {'ms':>8} {'peak KB':>9} {'message KB':>11} {'inline KB':>10} {'attach KB':>10}"
+    )
+    for n, width in _CASES:
+        tail = make_tail(n, width)
+        label = f"{n}x{width}B"
+        for mode, budget in (("unlimited", 0), ("budget", args.budget)):
+            secs, peak, (wire, inline, attached) = run(tail, budget, args.events)
+            print(
+                f"  {label:>12} {mode:<9} {secs * 1000:8.2f} {peak / 1024:9.1f} {wire / 1024:11.1f}"
+                f" {inline / 1024:10.1f} {attached / 1024:10.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_cooldown.py
+ * @description Cooldown store checks: memory growth with many distinct fingerprints,
+ * per-lookup cost on the hot path, and a crash-looping service restarted N times.
+ *
+ * Usage:
+ *   python benchmarks/bench_cooldown.py [--keys 200000] [--restarts 5]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+from pathlib import Path
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.cooldown import MemoryCooldownStore, SqliteCooldownStore  # noqa: E402
+
+
+class _DictStore:
+    """/**
+     * @class _DictStore
+     * @description The previous unbounded dict, for comparison.
+     */"""
+
+    def __init__(self) -> None:
+        self._last: dict[str, float] = {}
+
+    def should_send(self, key: str, now: float, cooldown: float) -> bool:
+        if now - self._last.get(key, 0.0) < cooldown:
+            return False
+        self._last[key] = now
+        return True
+
+
+def _growth(store, n_keys: int) -> int:
+    """/**
+     * @description One new fingerprint per simulated second, cooldown 300s.
+     * @returns {number} retained bytes
+     */"""
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for i in range(n_keys):
+        store.should_send(f"svc:{i:012x}", 1_000_000.0 + i, 300)
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return size
+
+
+def _hot_path(store, n: int) -> float:
+    """/**
+     * @description Error storm: the same few fingerprints again and again (all suppressed).
+     * @returns {number} ns per lookup
+     */"""
+
+    keys = [f"svc:{i:012x}" for i in range(8)]
+    now = time.time()
+    for k in keys:
+        store.should_send(k, now, 300)
+    t0 = time.perf_counter()
+    for i in range(n):
+        store.should_send(keys[i & 7], now, 300)
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def _one_run(path: str, out) -> None:
+    """/**
+     * @description Child process: a service that logs the same crash then dies.
+     */"""
+
+    store = SqliteCooldownStore(path)
+    out.put(store.should_send("svc:crash", time.time(), 300))
+    store.close()
+
+
+def _crash_loop(path: str, restarts: int) -> int:
+    """/**
+     * @returns {number} emails that would have been sent
+     */"""
+
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_one_run, args=(path, out)) for _ in range(restarts)]
+    for p in procs:
+        p.start()
+    sent = sum(1 for _ in procs if out.get())
+    for p in procs:
+        p.join()
+    return sent
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--keys", type=int, default=200_000)
+    ap.add_argument("--restarts", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = str(Path(tmp) / "cooldown.sqlite3")
+        stores = {
+            "dict": _DictStore,
+            "memory": lambda: MemoryCooldownStore(max_entries=10000, ttl_seconds=300),
+            "sqlite": lambda: SqliteCooldownStore(db, max_entries=10000, ttl_seconds=300),
+        }
+        print(f"{args.keys} distinct fingerprints, one per second, cooldown 300s")
+        for name, make in stores.items():
+            keys = args.keys if name != "sqlite" else min(args.keys, 20_000)
+            size = _growth(make(), keys)
+            ns = _hot_path(make(), 200_000)
+            print(f"  {name:<7} retained {size / 1024:9.1f} KB after {keys} keys   hot-path {ns:6.0f} ns/lookup")
+
+        sent = _crash_loop(str(Path(tmp) / "crash.sqlite3"), args.restarts)
+        print(f"crash loop: {args.restarts} concurrent restarts -> {sent} email(s) with sqlite store "
+              f"(memory store would send {args.restarts})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_detector.py
+ * @description Micro-benchmark for StderrDetector: prefilter rejection rate and per-line cost.
+ *
+ * Usage:
+ *   python benchmarks/bench_detector.py [--lines 200000] [--error-ratio 0.01]
+ *
+ * Compares the current detector against a copy of the pre-prefilter implementation
+ * (every line runs the per-rule regexes) on the same synthetic workload, and the
+ * per-line API (push_line) against the batched one (push_chunk on 64KB buffers).
+ */"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail import detector as det  # noqa: E402
+from errmail.detector import StderrDetector  # noqa: E402
+from errmail.utils import RingBuffer, fingerprint  # noqa: E402
+
+_RE_PY_TRACEBACK_START = re.compile(r"^Traceback \(most recent call last\):\s*$")
+
+
+class LegacyDetector:
+    """/**
+     * @class LegacyDetector
+     * @description push_line as it was before the keyword prefilter (reference for timing).
+     */"""
+
+    def __init__(self, tail_lines: int = 200) -> None:
+        self._tail = RingBuffer(max_lines=tail_lines)
+        self._in_tb = False
+        self._tb_lines: list[str] = []
+
+    def push_line(self, line: str):
+        self._tail.push(line)
+        if _RE_PY_TRACEBACK_START.match(line.rstrip("\n")):
+            self._in_tb = True
+            self._tb_lines = [line]
+            return None
+        if self._in_tb:
+            self._tb_lines.append(line)
+            if det._RE_PY_EXCEPTION_LINE.match(line.strip()):
+                excerpt = "".join(self._tb_lines[-40:])
+                self._in_tb = False
+                self._tb_lines = []
+                return ("python-traceback", fingerprint(excerpt))
+            return None
+        stripped = line.strip()
+        if not stripped:
+            return None
+        if det._RE_GENERIC_ERROR.search(stripped) or det._RE_PY_EXCEPTION_LINE.match(stripped):
+            return ("stderr-line", fingerprint(stripped + "\n"))
+        return None
+
+
+_NOISE = [
+    "2024-01-01 12:00:00,000 INFO worker.handler request id={n} path=/api/v1/items status=200 took={n}ms\n",
+    "2024-01-01 12:00:00,000 DEBUG db.pool checkout conn={n} idle=4 busy=12\n",
+    "[2024-01-01T12:00:00Z] info: GET /healthz 200 {n}us\n",
+    "    127.0.0.1 - - \"POST /api/v1/jobs HTTP/1.1\" 201 {n}\n",
+]
+_ERRORS = [
+    "2024-01-01 12:00:00,000 ERROR worker.handler upstream timeout id={n}\n",
+    "ValueError: invalid literal for int() with base 10: 'x{n}'\n",
+    "2024-01-01 12:00:00,000 CRITICAL scheduler lost lease {n}\n",
+]
+
+
+def make_workload(n_lines: int, error_ratio: float, seed: int = 0) -> list[str]:
+    """/**
+     * @param {number} n_lines
+     * @param {number} error_ratio
+     * @param {number} seed
+     * @returns {Array<string>}
+     */"""
+
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n_lines):
+        pool = _ERRORS if rnd.random() < error_ratio else _NOISE
+        out.append(rnd.choice(pool).format(n=i))
+    return out
+
+
+def _time(detector, lines: list[str]) -> tuple[float, int]:
+    """/**
+     * @returns {[number, number]} (seconds, events)
+     */"""
+
+    push = detector.push_line
+    events = 0
+    t0 = time.perf_counter()
+    for line in lines:
+        if push(line) is not None:
+            events += 1
+    return time.perf_counter() - t0, events
+
+
+def _time_chunks(detector, chunks: list[bytes]) -> tuple[float, int]:
+    """/**
+     * @returns {[number, number]} (seconds, events)
+     */"""
+
+    push = detector.push_chunk
+    events = 0
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        events += len(push(chunk))
+    events += len(detector.finish())
+    return time.perf_counter() - t0, events
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=200_000)
+    ap.add_argument("--error-ratio", type=float, default=0.01)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    lines = make_workload(args.lines, args.error_ratio)
+    rejected = sum(1 for ln in lines if not det._prefilter(ln))
+    print(f"{len(lines)} lines, error ratio {args.error_ratio:.3f}")
+    print(f"prefilter rejection rate: {rejected / len(lines) * 100:.2f}%")
+
+    results = {}
+    for name, factory in (("legacy", LegacyDetector), ("prefilter", StderrDetector)):
+        best = min(_time(factory(tail_lines=200), lines) for _ in range(args.repeat))
+        results[name] = best
+        secs, events = best
+        print(f"  {name:<10} {secs / len(lines) * 1e9:8.0f} ns/line  events={events}")
+    data = "".join(lines).encode("utf-8")
+    chunks = [data[i : i + 65536] for i in range(0, len(data), 65536)]
+    best = min(_time_chunks(StderrDetector(tail_lines=200), chunks) for _ in range(args.repeat))
+    results["push_chunk"] = best
+    print(f"  {'push_chunk':<10} {best[0] / len(lines) * 1e9:8.0f} ns/line  events={best[1]}")
+
+    speedup = results["legacy"][0] / max(results["prefilter"][0], 1e-9)
+    print(f"prefilter speedup: {speedup:.2f}x")
+    batch = results["prefilter"][0] / max(results["push_chunk"][0], 1e-9)
+    print(f"push_chunk vs push_line: {batch:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_fingerprint.py
+ * @description Fingerprinting: legacy three-pass normalizer vs the single-pass one,
+ * uncached and memoized. That both give identical fingerprints is checked by
+ * tests/test_utils.py.
+ *
+ * Usage:
+ *   python benchmarks/bench_fingerprint.py
+ */"""
+
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+import re
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.utils import fingerprint, normalize_for_fingerprint  # noqa: E402
+
+_RE_HEX_ADDR = re.compile(r"0x[0-9a-fA-F]+")
+_RE_LINE_NO = re.compile(r"\bline\s+\d+\b")
+_RE_INT = re.compile(r"\b\d+\b")
+
+
+def legacy_normalize(text: str) -> str:
+    """/**
+     * @description The normalizer as it was before the single-pass rewrite.
+     * @param {string} text
+     * @returns {string}
+     */"""
+
+    s = text.strip()
+    s = _RE_HEX_ADDR.sub("0x?", s)
+    s = _RE_LINE_NO.sub("line ?", s)
+    s = _RE_INT.sub("?", s)
+    return s
+
+
+def legacy_fingerprint(text: str) -> str:
+    """/**
+     * @param {string} text
+     * @returns {string}
+     */"""
+
+    return hashlib.sha1(legacy_normalize(text).encode("utf-8", errors="replace")).hexdigest()[:12]
+
+
+def realistic_excerpts() -> list[str]:
+    """/**
+     * @returns {Array<string>}
+     */"""
+
+    out = []
+    for i in range(50):
+        out.append(
+            "Traceback (most recent call last):\n"
+            f'  File "/srv/app/worker.py", line {100 + i}, in handle\n'
+            f"    conn = pool.get(timeout={i})\n"
+            f"  File \"/srv/app/pool.py\", line {40 + i}, in get\n"
+            f"    raise TimeoutError(f'pool exhausted after {i * 7} ms at 0x7f{i:08x}')\n"
+            f"TimeoutError: pool exhausted after {i * 7} ms at 0x7f{i:08x}\n"
+        )
+    return out
+
+
+def _time(fn, inputs: list[str], repeat: int) -> float:
+    """/**
+     * @returns {number} microseconds per call
+     */"""
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for s in inputs:
+            fn(s)
+    return (time.perf_counter() - t0) / (repeat * len(inputs)) * 1e6
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    excerpts = realistic_excerpts()
+    legacy = _time(legacy_fingerprint, excerpts, 200)
+    single = _time(lambda s: hashlib.sha1(normalize_for_fingerprint(s).encode()).hexdigest()[:12], excerpts, 200)
+    fingerprint.cache_clear()
+    # Error storm: the same few excerpts repeat, as with a crash loop or a hot retry path.
+    cached = _time(fingerprint, excerpts[:5], 2000)
+    print(f"  legacy 3-pass     {legacy:7.2f} us/excerpt")
+    print(f"  single pass       {single:7.2f} us/excerpt  ({legacy / single:.1f}x)")
+    print(f"  memoized repeats  {cached:7.2f} us/excerpt  ({legacy / cached:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_json.py
+ * @description JSON-lines stderr: detector cost per line with ERRMAIL_INPUT_FORMAT=text vs
+ * json, and how many lines json mode actually hands to json.loads (only lines the prefix
+ * check flags). The workload has info lines whose message mentions "ERROR" (text mode
+ * alerts on them, json mode must not).
+ *
+ * Usage:
+ *   python benchmarks/bench_json.py [--lines 200000] [--error-ratio 0.01]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail import structured  # noqa: E402
+from errmail.detector import StderrDetector  # noqa: E402
+
+_CHUNK = 64 * 1024
+
+
+def make_workload(n: int, error_ratio: float) -> tuple[bytes, int]:
+    """/**
+     * @param {number} n lines
+     * @param {number} error_ratio share of level=error records
+     * @returns {[bytes, number]} (data, number of error records)
+     */"""
+
+    rng = random.Random(0)
+    lines = []
+    errors = 0
+    for i in range(n):
+        r = rng.random()
+        if r < error_ratio:
+            errors += 1
+            rec = {"ts": 1714564800 + i, "level": "error", "logger": "app.jobs", "msg": f"job {i % 7} failed",
+                   "exception": "Traceback (most recent call last):\n  File \"jobs.py\", line 9\nTimeoutError: upstream"}
+        elif r < 0.05:
+            rec = {"ts": 1714564800 + i, "level": "info", "logger": "app.retry", "msg": "retrying after ERROR 502"}
+        else:
+            rec = {"ts": 1714564800 + i, "level": "info", "logger": "app.http", "msg": "request done",
+                   "req": {"id": f"r{i}", "path": "/api/v1/items"}, "status": 200, "took_ms": 12}
+        lines.append(json.dumps(rec) + "\n")
+    return "".join(lines).encode(), errors
+
+
+def run(data: bytes, input_format: str) -> tuple[float, int]:
+    """/**
+     * @returns {[number, number]} (seconds, events)
+     */"""
+
+    det = StderrDetector(input_format=input_format)
+    events = 0
+    t0 = time.perf_counter()
+    for off in range(0, len(data), _CHUNK):
+        events += len(det.push_chunk(data[off : off + _CHUNK]))
+    events += len(det.finish())
+    return time.perf_counter() - t0, events
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=200_000)
+    ap.add_argument("--error-ratio", type=float, default=0.01)
+    args = ap.parse_args()
+
+    data, errors = make_workload(args.lines, args.error_ratio)
+    text_s, text_events = run(data, "text")
+
+    parsed = 0
+    loads = structured.json.loads
+
+    def counting_loads(s, *a, **kw):
+        nonlocal parsed
+        parsed += 1
+        return loads(s, *a, **kw)
+
+    structured.json.loads = counting_loads
+    try:
+        json_s, json_events = run(data, "json")
+    finally:
+        structured.json.loads = loads
+    if json_events != errors:
+        print(f"MISMATCH: json mode {json_events} events, workload has {errors} error records")
+        return 1
+
+    print(f"{args.lines} JSON lines, {errors} error records")
+    print(f"  text mode  {text_s / args.lines * 1e9:6.0f} ns/line  {text_events:>6} events")
+    print(f"  json mode  {json_s / args.lines * 1e9:6.0f} ns/line  {json_events:>6} events  json.loads on {parsed} lines")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_pty.py
+ * @description Alert latency with pipes vs pseudo-terminals (ERRMAIL_PTY): time from the
+ * child writing an error line to the event reaching Notifier.enqueue, for both runners.
+ *
+ * The child logs through a stream opened on fd 2 with default buffering, like most
+ * runtimes' stdio: block-buffered on a pipe, line-buffered on a terminal. It writes a
+ * few INFO lines every --interval seconds and every 10th batch an ERROR line stamped with
+ * its write time. It also checks that stdout and stderr arrive on the right streams.
+ *
+ * Usage:
+ *   python benchmarks/bench_pty.py [--errors 20] [--interval 0.02]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import replace
+import os
+from pathlib import Path
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.config import load_config  # noqa: E402
+from errmail.notifier import Notifier  # noqa: E402
+from errmail.runner import run_command  # noqa: E402
+
+_CHILD = r"""
+import io, sys, time
+errors, interval = int(sys.argv[1]), float(sys.argv[2])
+log = io.open(2, "w", closefd=False)  # line-buffered only on a terminal
+for i in range(errors * 10):
+    log.write("INFO request id=%d path=/api/v1/items status=200 took=12ms\n" % i)
+    print("stdout line %d" % i)
+    if i % 10 == 9:
+        log.write("ERROR job %d failed ts=%.6f\n" % (i, time.time()))
+    time.sleep(interval)
+log.flush()
+"""
+
+_RE_TS = re.compile(r"ts=(\d+\.\d+)")
+
+
+class _LatencyNotifier(Notifier):
+    """/**
+     * @class _LatencyNotifier
+     * @description Records child-write -> enqueue latency instead of queueing.
+     */"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.latencies: list[float] = []
+
+    def enqueue(self, event, **kwargs) -> None:
+        m = _RE_TS.search(event.message)
+        if m:
+            self.latencies.append((time.time() - float(m.group(1))) * 1000.0)
+
+
+def _pick(samples: list[float], q: float) -> float:
+    """/**
+     * @param {Array<number>} samples sorted
+     * @param {number} q
+     * @returns {number}
+     */"""
+
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def run(runner: str, pty: bool, errors: int, interval: float) -> tuple[list[float], int, int]:
+    """/**
+     * @returns {[Array<number>, number, number]} (sorted latencies ms, stdout lines, stderr lines)
+     */"""
+
+    cfg = replace(load_config(service="bench"), runner=runner, pty=pty)
+    command = [sys.executable, "-c", _CHILD, str(errors), str(interval)]
+    notifier = _LatencyNotifier(cfg, command=command, cwd=os.getcwd())
+    # Capture what errmail forwards to fd 1 / fd 2.
+    saved = os.dup(1), os.dup(2)
+    out_file, err_file = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    os.dup2(out_file.fileno(), 1)
+    os.dup2(err_file.fileno(), 2)
+    try:
+        run_command(command, cfg=cfg, notifier=notifier)
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved:
+            os.close(fd)
+    captured = []
+    for f in (out_file, err_file):
+        with f:
+            f.seek(0)
+            captured.append(f.read().decode())
+    stdout_ok = sum(1 for ln in captured[0].splitlines() if ln.startswith("stdout line "))
+    stderr_ok = sum(1 for ln in captured[1].splitlines() if ln.startswith(("INFO ", "ERROR ")))
+    if "INFO " in captured[0] or "stdout line" in captured[1] or "\r" in captured[0] + captured[1]:
+        raise SystemExit(f"stream mix-up with runner={runner} pty={pty}")
+    return sorted(notifier.latencies), stdout_ok, stderr_ok
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--errors", type=int, default=20)
+    ap.add_argument("--interval", type=float, default=0.02)
+    args = ap.parse_args()
+
+    lines = args.errors * 10
+    print(f"{args.errors} errors among {lines} INFO lines, one line every {args.interval * 1000:.0f} ms")
+    print(f"{'runner':>8} {'stdio':>6} {'p50 ms':>9} {'p90 ms':>9} {'max ms':>9} {'events':>7} {'stdout':>7} {'stderr':>7}")
+    for runner in ("asyncio", "thread"):
+        for pty in (False, True):
+            lat, n_out, n_err = run(runner, pty, args.errors, args.interval)
+            if not lat:
+                print(f"{runner:>8} {'pty' if pty else 'pipe':>6}  no events")
+                return 1
+            print(
+                f"{runner:>8} {'pty' if pty else 'pipe':>6} {_pick(lat, 0.5):9.1f} {_pick(lat, 0.9):9.1f} "
+                f"{lat[-1]:9.1f} {len(lat):>7} {n_out:>7} {n_err:>7}"
+            )
+            if n_out != lines or n_err != lines + args.errors:
+                print(f"  lost output: stdout {n_out}/{lines}, stderr {n_err}/{lines + args.errors}")
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_pump.py
+ * @description Compare wrapper CPU per MB forwarded: legacy text pump vs binary chunk pump.
+ *
+ * Usage:
+ *   python benchmarks/bench_pump.py [--mb 50] [--repeat 3]
+ *
+ * The child streams a pre-generated log file to its stderr; the wrapper side runs the
+ * stderr pump in-process with fd 2 redirected to /dev/null, and we report
+ * process CPU seconds (user+sys) per MB forwarded.
+ */"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.detector import StderrDetector  # noqa: E402
+from errmail.runner import _pump_stderr, _pump_stderr_binary  # noqa: E402
+
+
+_CHILD = "import shutil, sys; shutil.copyfileobj(open(sys.argv[1], 'rb'), sys.stderr.buffer, 1 << 20)"
+
+
+def _make_log(path: str, mb: int) -> int:
+    """/**
+     * @description Write ~mb MB of mostly-noise log lines (1 ERROR per 1000 lines).
+     * @param {string} path
+     * @param {number} mb
+     * @returns {number} bytes written
+     */"""
+
+    line = "2024-01-01 12:00:00,000 INFO worker.handler request id=12345 path=/api/v1/items status=200 took=3ms\n"
+    err = "2024-01-01 12:00:00,000 ERROR worker.handler upstream timeout id=12345\n"
+    block = (line * 999 + err).encode("utf-8")
+    total = 0
+    with open(path, "wb") as f:
+        while total < mb * 1024 * 1024:
+            f.write(block)
+            total += len(block)
+    return total
+
+
+def _run_once(mode: str, log_path: str) -> tuple[float, float, int]:
+    """/**
+     * @param {string} mode "text" or "binary"
+     * @param {string} log_path
+     * @returns {[number, number, number]} (cpu_seconds, wall_seconds, events)
+     */"""
+
+    if mode == "text":
+        p = subprocess.Popen(  # noqa: S603
+            [sys.executable, "-c", _CHILD, log_path],
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            errors="replace",
+        )
+        pump = _pump_stderr
+    else:
+        p = subprocess.Popen(  # noqa: S603
+            [sys.executable, "-c", _CHILD, log_path],
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        pump = _pump_stderr_binary
+
+    events = 0
+
+    def on_event(_evt) -> None:
+        nonlocal events
+        events += 1
+
+    detector = StderrDetector(tail_lines=200)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    saved_fd = os.dup(2)
+    saved_stderr = sys.stderr
+    os.dup2(devnull, 2)
+    sys.stderr = open(os.devnull, "w", encoding="utf-8")  # noqa: SIM115
+    try:
+        cpu0 = time.process_time()
+        wall0 = time.perf_counter()
+        pump(p.stderr, detector, on_event)
+        cpu = time.process_time() - cpu0
+        wall = time.perf_counter() - wall0
+    finally:
+        sys.stderr.close()
+        sys.stderr = saved_stderr
+        os.dup2(saved_fd, 2)
+        os.close(saved_fd)
+        os.close(devnull)
+    p.wait()
+    return cpu, wall, events
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=int, default=50, help="MB of stderr to forward per run")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "stderr.log")
+        size = _make_log(log_path, args.mb)
+        mb = size / (1024 * 1024)
+        print(f"forwarding {mb:.1f} MB per run, best of {args.repeat}")
+        results: dict[str, tuple[float, float, int]] = {}
+        for mode in ("text", "binary"):
+            runs = [_run_once(mode, log_path) for _ in range(args.repeat)]
+            results[mode] = min(runs)
+            cpu, wall, events = results[mode]
+            print(
+                f"  {mode:<7} cpu={cpu:7.3f}s  cpu/MB={cpu / mb * 1000:7.2f}ms  "
+                f"wall={wall:7.3f}s  throughput={mb / wall:7.1f} MB/s  events={events}"
+            )
+        ratio = results["text"][0] / max(results["binary"][0], 1e-9)
+        print(f"binary pump uses {ratio:.2f}x less CPU per MB than text mode")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_routes.py
+ * @description Route isolation: alerts for a slow recipient domain (the stub SMTP server
+ * stalls on RCPT for it) and for a fast one are enqueued interleaved. Each route has its
+ * own queue and worker, so the fast route's queue latency should stay near the plain
+ * send time however far the slow route falls behind. Reported per route: mean queue
+ * latency (errmail_route_queue_seconds) and the time until its last email arrived.
+ *
+ * ERRMAIL_SMTP_CONCURRENCY=1 lets only one send reach the server at a time, which is
+ * about the single-worker behaviour from before routes: the fast route's emails wait
+ * behind the slow ones.
+ *
+ * Usage:
+ *   python benchmarks/bench_routes.py [--fast 50] [--slow 10] [--rcpt-delay 0.2]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import replace
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.config import load_config  # noqa: E402
+from errmail.detector import ErrorEvent  # noqa: E402
+from errmail.metrics import METRICS  # noqa: E402
+from errmail.notifier import Notifier  # noqa: E402
+from errmail.rules import RuleSet, parse_rules  # noqa: E402
+from smtp_stub import StubSmtpServer  # noqa: E402
+
+_RULES = """
+route kind=batch-*  to=ops@slow.example
+route kind=api-*    to=dev@fast.example
+"""
+
+
+def run(n_fast: int, n_slow: int, rcpt_delay: float, concurrency: int) -> dict[str, tuple[float, float, int]]:
+    """/**
+     * @returns {Object<string, [number, number, number]>} per route: (mean queue latency,
+     *   seconds until its last email arrived, delivered)
+     */"""
+
+    routes = RuleSet(parse_rules(_RULES, "bench")).routes
+    with tempfile.TemporaryDirectory() as tmp, StubSmtpServer(rcpt_delay={"slow.example": rcpt_delay}) as srv:
+        cfg = replace(
+            load_config(service="bench"),
+            transport="smtp",
+            smtp_host="127.0.0.1",
+            smtp_port=srv.port,
+            smtp_tls=False,
+            smtp_ssl=False,
+            smtp_user=None,
+            smtp_pass=None,
+            mail_from="errmail@localhost",
+            mail_to="oncall@localhost",
+            smtp_concurrency=concurrency,
+            rate_limit_per_hour=0,
+            digest_seconds=0,
+            spool=True,
+            spool_dir=os.path.join(tmp, "spool"),
+        )
+        want = {"fast.example": n_fast, "slow.example": n_slow}
+        names = {"fast.example": "dev@fast.example", "slow.example": "ops@slow.example"}
+        hists = {d: METRICS.labeled_histogram("errmail_route_queue_seconds", "", "route", n) for d, n in names.items()}
+        before = {d: (h.count, h.total) for d, h in hists.items()}
+
+        notifier = Notifier(cfg, command=["bench"], cwd=tmp, routes=routes)
+        t0 = time.perf_counter()
+        done: dict[str, float] = {}
+        for i in range(max(n_fast, n_slow)):
+            for kind, n in (("batch-job", n_slow), ("api-error", n_fast)):
+                if i < n:
+                    event = ErrorEvent(kind=kind, fp=f"{kind}{i}", message=f"{kind} {i}", excerpt=f"{kind} {i}\n", ts=time.time())
+                    notifier.enqueue(event, pid=1, exit_code=None, tail="")
+        deadline = t0 + 30 + n_slow * rcpt_delay
+        while len(done) < len(want) and time.perf_counter() < deadline:
+            with srv.lock:
+                got = dict(srv.by_domain)
+            for domain, n in want.items():
+                if domain not in done and got.get(domain, 0) >= n:
+                    done[domain] = time.perf_counter() - t0
+            time.sleep(0.002)
+        with srv.lock:
+            got = dict(srv.by_domain)
+        notifier.close()
+
+    out: dict[str, tuple[float, float, int]] = {}
+    for domain, h in hists.items():
+        count, total = h.count - before[domain][0], h.total - before[domain][1]
+        out[domain] = (total / max(count, 1), done.get(domain, float("nan")), got.get(domain, 0))
+    return out
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fast", type=int, default=50, help="alerts for the fast route")
+    ap.add_argument("--slow", type=int, default=10, help="alerts for the slow route")
+    ap.add_argument("--rcpt-delay", type=float, default=0.2, help="seconds the slow domain stalls per message")
+    args = ap.parse_args()
+
+    print(f"{args.fast} fast-route + {args.slow} slow-route alerts, slow domain stalls {args.rcpt_delay * 1000:.0f}ms/message")
+    print(f"  {'concurrency':<12} {'route':<14} {'mean queue ms':>14} {'last arrived s':>15} {'delivered':>10}")
+    failed = False
+    for concurrency in (1, 4):
+        res = run(args.fast, args.slow, args.rcpt_delay, concurrency)
+        for domain, n in (("fast.example", args.fast), ("slow.example", args.slow)):
+            mean, last, got = res[domain]
+            print(f"  {concurrency:<12} {domain:<14} {mean * 1000:14.1f} {last:15.2f} {got:>6}/{n}")
+            failed |= got != n
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_runner.py
+ * @description Compare the thread runner with the asyncio runner: wall latency,
+ * peak wrapper thread count and context switches per wrapped command.
+ *
+ * Usage:
+ *   python benchmarks/bench_runner.py [--repeat 5] [--mb 10]
+ *
+ * Workloads: `true` (pure wrapper latency) and a child that streams N MB to stderr.
+ * Output of the child is sent to /dev/null; SMTP is not configured so no mail is sent.
+ */"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import replace
+import os
+from pathlib import Path
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.config import load_config  # noqa: E402
+from errmail.runner import run_command  # noqa: E402
+
+
+_STREAM_CHILD = (
+    "import sys\n"
+    "line = b'2024-01-01 12:00:00 INFO worker ok id=12345 path=/api/v1/items status=200\\n'\n"
+    "block = line * 1000\n"
+    "for _ in range(int(sys.argv[1]) * 1024 * 1024 // len(block)):\n"
+    "    sys.stderr.buffer.write(block)\n"
+)
+
+
+class _ThreadSampler:
+    """/**
+     * @class _ThreadSampler
+     * @description Sample threading.active_count() every ms, relative to the count at start
+     * (excluding the sampler itself and daemon threads left over by earlier runs).
+     */"""
+
+    def __init__(self) -> None:
+        self.peak = 0
+        self._base = threading.active_count()
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count() - 1 - self._base)
+            time.sleep(0.001)
+
+    def __enter__(self) -> "_ThreadSampler":
+        self._t.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._stop.set()
+        self._t.join()
+
+
+def _measure(runner: str, command: list[str]) -> dict[str, float]:
+    """/**
+     * @param {string} runner "thread" or "asyncio"
+     * @param {Array<string>} command
+     * @returns {Object<string, number>}
+     */"""
+
+    cfg = replace(load_config(service="bench"), runner=runner, smtp_host=None)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    saved = (os.dup(1), os.dup(2))
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    try:
+        ru0 = resource.getrusage(resource.RUSAGE_SELF)
+        t0 = time.perf_counter()
+        with _ThreadSampler() as sampler:
+            run_command(command, cfg=cfg)
+        wall = time.perf_counter() - t0
+        ru1 = resource.getrusage(resource.RUSAGE_SELF)
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in (*saved, devnull):
+            os.close(fd)
+    return {
+        "wall_ms": wall * 1000,
+        "cpu_ms": ((ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime)) * 1000,
+        "threads": float(sampler.peak + 1),  # + the main thread
+        "ctx_switches": float((ru1.ru_nvcsw - ru0.ru_nvcsw) + (ru1.ru_nivcsw - ru0.ru_nivcsw)),
+    }
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--mb", type=int, default=10)
+    args = ap.parse_args()
+
+    workloads = {
+        "true": ["true"],
+        f"stream-{args.mb}MB": [sys.executable, "-c", _STREAM_CHILD, str(args.mb)],
+    }
+    for name, command in workloads.items():
+        print(f"workload {name} (median of {args.repeat})")
+        for runner in ("thread", "asyncio"):
+            runs = [_measure(runner, command) for _ in range(args.repeat)]
+            med = {k: sorted(r[k] for r in runs)[len(runs) // 2] for k in runs[0]}
+            print(
+                f"  {runner:<8} wall={med['wall_ms']:8.1f}ms  cpu={med['cpu_ms']:8.1f}ms  "
+                f"peak_threads={med['threads']:.0f}  ctx_switches={med['ctx_switches']:.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
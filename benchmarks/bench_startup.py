@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_startup.py
+ * @description Startup cost of `errmail run -- true`: what every cron job and short CLI
+ * wrapped by errmail pays before and after its own work.
+ *
+ * - wall time (median of --runs) of `true`, `python -c pass` (interpreter floor) and
+ *   `python -m errmail run -- true`; the overhead over `true` is checked against
+ *   --budget-ms (exit code 1 when over budget)
+ * - `python -X importtime` of the run path: the slowest imports by cumulative time
+ * - modules that must not be loaded by a run that sends no mail (smtplib, email, ...)
+ *
+ * Usage:
+ *   python benchmarks/bench_startup.py [--runs 20] [--budget-ms 200] [--top 15]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Loaded only on first send (mailer.py) or when ERRMAIL_PROFILE is set (profiling.py).
+LAZY_MODULES = ("smtplib", "email.message", "email.mime", "tracemalloc", "pickle")
+
+_RUN_TRUE = f"""
+import sys
+from errmail.cli import main
+code = main(["run", "--", "true"])
+print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))
+sys.exit(code)
+"""
+
+
+def _env() -> dict[str, str]:
+    """/**
+     * @returns {Object<string, string>} environment without ERRMAIL_* overrides (e.g. ERRMAIL_PROFILE)
+     */"""
+
+    env = {k: v for k, v in os.environ.items() if not k.startswith("ERRMAIL_")}
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(ROOT), env.get("PYTHONPATH")) if p)
+    return env
+
+
+def wall_ms(cmd: list[str], runs: int) -> float:
+    """/**
+     * @param {Array<string>} cmd
+     * @param {number} runs
+     * @returns {number} median wall time in milliseconds
+     */"""
+
+    env = _env()
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000
+
+
+def import_times(top: int) -> list[tuple[int, int, str]]:
+    """/**
+     * @param {number} top
+     * @returns {Array<[number, number, string]>} (self us, cumulative us, module), slowest first
+     */"""
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import errmail.cli, errmail.runner"],
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:") :].split("|")
+        rows.append((int(self_us), int(cum_us), name.rstrip()))
+    rows.sort(key=lambda r: r[1], reverse=True)
+    return rows[:top]
+
+
+def loaded_lazy_modules() -> list[str]:
+    """/**
+     * @returns {Array<string>} LAZY_MODULES that `errmail run -- true` loaded anyway
+     */"""
+
+    proc = subprocess.run([sys.executable, "-c", _RUN_TRUE], env=_env(), capture_output=True, text=True, check=True)
+    out = proc.stdout.strip().splitlines()
+    return [m for m in (out[-1] if out else "").split(",") if m]
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20)
+    ap.add_argument("--budget-ms", type=float, default=200.0, help="max overhead of `errmail run -- true` over `true`")
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    print(f"slowest imports on the run path (python -X importtime, top {args.top}):")
+    print(f"  {'self ms':>8} {'cumul ms':>9}  module")
+    for self_us, cum_us, name in import_times(args.top):
+        print(f"  {self_us / 1000:8.1f} {cum_us / 1000:9.1f}  {name}")
+
+    true_ms = wall_ms(["true"], args.runs)
+    python_ms = wall_ms([sys.executable, "-c", "pass"], args.runs)
+    import_ms = wall_ms([sys.executable, "-c", "import errmail.cli, errmail.runner"], args.runs)
+    run_ms = wall_ms([sys.executable, "-m", "errmail", "run", "--", "true"], args.runs)
+    overhead = run_ms - true_ms
+    print(f"\nwall time, median of {args.runs}:")
+    print(f"  true                          {true_ms:7.1f} ms")
+    print(f"  python -c pass                {python_ms:7.1f} ms")
+    print(f"  python -c 'import errmail'    {import_ms:7.1f} ms")
+    print(f"  errmail run -- true           {run_ms:7.1f} ms  (overhead {overhead:.1f} ms, budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    loaded = loaded_lazy_modules()
+    if loaded:
+        print(f"FAIL: `errmail run -- true` loaded {', '.join(loaded)}")
+        failed = True
+    if overhead > args.budget_ms:
+        print(f"FAIL: overhead {overhead:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
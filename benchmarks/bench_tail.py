@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_tail.py
+ * @description Cost per detected event of capturing the stderr tail: eager "".join
+ * (tail_text) vs lazy snapshot handles (tail_snapshot), during an error storm where
+ * cooldown suppresses almost every event.
+ *
+ * Usage:
+ *   python benchmarks/bench_tail.py [--tail-lines 2000] [--events 5000]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import replace
+from pathlib import Path
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.config import load_config  # noqa: E402
+from errmail.detector import StderrDetector  # noqa: E402
+from errmail.notifier import Notifier  # noqa: E402
+
+
+def _storm(n_events: int, tail_lines: int, lazy: bool, trace: bool) -> tuple[float, int, int]:
+    """/**
+     * @returns {[number, number, number]} (seconds, peak traced bytes, tail bytes materialized)
+     */"""
+
+    cfg = replace(load_config(service="bench"), tail_lines=tail_lines, cooldown_seconds=3600, smtp_host=None)
+    detector = StderrDetector(tail_lines=tail_lines)
+    detector.push_lines([f"INFO warm-up line {i} " + "x" * 80 + "\n" for i in range(tail_lines)])
+    notifier = Notifier(cfg, command=["bench"], cwd="/")
+    notifier._deliver = lambda *_args: None  # type: ignore[assignment]
+    # One new error line per event: each event sees a different tail, 3 distinct fingerprints.
+    lines = [f"ERROR upstream failure kind={'abc'[i % 3]}\n" for i in range(n_events)]
+    built = 0
+    snaps = []
+
+    if trace:
+        tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0] if trace else 0
+    t0 = time.perf_counter()
+    for line in lines:
+        for evt in detector.push_lines([line]):
+            if lazy:
+                tail = detector.tail_snapshot
+            else:
+                tail = detector.tail_text()
+                built += len(tail)
+            notifier.enqueue(evt, pid=1, exit_code=None, tail=tail)
+            snaps.append(detector._tail._snap)
+    elapsed = time.perf_counter() - t0
+    peak = (tracemalloc.get_traced_memory()[1] - base) if trace else 0
+    if trace:
+        tracemalloc.stop()
+    notifier.flush(timeout_seconds=2.0)
+    if lazy:
+        # Only snapshots that reached an email were ever joined.
+        built = sum(len(s._text) for s in {id(s): s for s in snaps if s is not None}.values() if s._text is not None)
+    return elapsed, peak, built
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tail-lines", type=int, default=2000)
+    ap.add_argument("--events", type=int, default=5000)
+    args = ap.parse_args()
+
+    print(f"{args.events} events, tail {args.tail_lines} lines, cooldown suppresses all but 3")
+    results = {}
+    n = args.events
+    for name, lazy in (("eager-join", False), ("snapshot", True)):
+        secs = min(_storm(n, args.tail_lines, lazy, trace=False)[0] for _ in range(3))
+        _, peak, built = _storm(n, args.tail_lines, lazy, trace=True)
+        results[name] = secs
+        print(
+            f"  {name:<10} {secs / n * 1e6:7.1f} us/event  tail text built {built / n / 1024:8.2f} KB/event  "
+            f"peak traced {peak / 1024:8.1f} KB"
+        )
+    print(f"snapshot speedup: {results['eager-join'] / max(results['snapshot'], 1e-9):.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""/**
+ * @file bench_transport.py
+ * @description End-to-end delivery throughput per transport (ERRMAIL_TRANSPORT): distinct
+ * errors go through Notifier (rendering, spool, transport) and the receiving side counts
+ * what arrived, so this doubles as an end-to-end check with zero network.
+ *
+ * - smtp / lmtp: local stub servers (benchmarks/smtp_stub.py), TCP and a Unix socket
+ * - sendmail: a stand-in script that reads the message and records the call
+ * - maildir / mbox: files in a temporary directory
+ *
+ * Usage:
+ *   python benchmarks/bench_transport.py [--messages 300] [--transport maildir ...]
+ */"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import replace
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from errmail.config import load_config  # noqa: E402
+from errmail.detector import ErrorEvent  # noqa: E402
+from errmail.notifier import Notifier  # noqa: E402
+from smtp_stub import StubLmtpServer, StubSmtpServer  # noqa: E402
+from errmail.transports import TRANSPORTS  # noqa: E402
+
+_FAKE_SENDMAIL = """#!/bin/sh
+cat > /dev/null && echo "$*" >> "$0.calls"
+"""
+
+
+def _counter(transport: str, tmp: str):
+    """/**
+     * @description Start the receiving side.
+     * @returns {[Object, Function, ?Object]} (cfg overrides, delivered() counter, server to stop)
+     */"""
+
+    if transport == "smtp":
+        srv = StubSmtpServer().__enter__()
+        return {"smtp_host": "127.0.0.1", "smtp_port": srv.port, "smtp_tls": False, "smtp_ssl": False,
+                "smtp_user": None, "smtp_pass": None}, lambda: srv.messages, srv
+    if transport == "lmtp":
+        srv = StubLmtpServer(os.path.join(tmp, "lmtp.sock")).__enter__()
+        return {"lmtp_socket": srv.path}, lambda: srv.messages, srv
+    if transport == "sendmail":
+        path = os.path.join(tmp, "sendmail")
+        Path(path).write_text(_FAKE_SENDMAIL)
+        os.chmod(path, 0o755)
+
+        def calls() -> int:
+            try:
+                with open(path + ".calls", "rb") as f:
+                    return f.read().count(b"\n")
+            except OSError:
+                return 0
+
+        return {"sendmail_path": path}, calls, None
+    if transport == "maildir":
+        path = os.path.join(tmp, "Maildir")
+
+        def files() -> int:
+            try:
+                return len(os.listdir(os.path.join(path, "new")))
+            except OSError:
+                return 0
+
+        return {"sink_path": path}, files, None
+    path = os.path.join(tmp, "errmail.mbox")
+
+    def messages() -> int:
+        try:
+            with open(path, "rb") as f:
+                return sum(1 for line in f if line.startswith(b"From MAILER-DAEMON "))
+        except OSError:
+            return 0
+
+    return {"sink_path": path}, messages, None
+
+
+def run(transport: str, n: int) -> tuple[float, int]:
+    """/**
+     * @returns {[number, number]} (seconds until all n arrived or 30s passed, delivered)
+     */"""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides, delivered, srv = _counter(transport, tmp)
+        cfg = replace(
+            load_config(service="bench"),
+            transport=transport,
+            mail_from="errmail@localhost",
+            mail_to="oncall@localhost",
+            rate_limit_per_hour=0,
+            digest_seconds=0,
+            spool=True,
+            spool_dir=os.path.join(tmp, "spool"),
+            **overrides,
+        )
+        notifier = Notifier(cfg, command=["bench"], cwd=tmp)
+        body = "Traceback (most recent call last):\n" + "  File \"app.py\", line 1, in <module>\n" * 20
+        t0 = time.perf_counter()
+        for i in range(n):
+            event = ErrorEvent(kind="python-traceback", fp=f"fp{i}", message=f"ValueError: bad {i}", excerpt=body, ts=time.time())
+            notifier.enqueue(event, pid=1, exit_code=None, tail=body)
+        while delivered() < n and time.perf_counter() - t0 < 30:
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - t0
+        got = delivered()
+        notifier.close()
+        if srv is not None:
+            srv.__exit__(None, None, None)
+        return elapsed, got
+
+
+def main() -> int:
+    """/**
+     * @returns {number}
+     */"""
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=300)
+    ap.add_argument("--transport", action="append", choices=TRANSPORTS, default=None)
+    args = ap.parse_args()
+
+    print(f"{args.messages} distinct errors through Notifier (spool on, no rate limit)")
+    print(f"  {'transport':<9} {'msg/s':>8} {'ms/msg':>8} {'delivered':>10}")
+    failed = False
+    for transport in args.transport or TRANSPORTS:
+        secs, got = run(transport, args.messages)
+        print(f"  {transport:<9} {got / secs:8.1f} {secs / max(got, 1) * 1000:8.2f} {got:>6}/{args.messages}")
+        failed |= got != args.messages
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
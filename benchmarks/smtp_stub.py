@@ -0,0 +1,165 @@
+"""/**
+ * @file smtp_stub.py
+ * @description Minimal local stand-in SMTP server for `errmail bench` and the delivery
+ * benchmarks (no TLS/AUTH), and its LMTP-over-Unix-socket twin (StubLmtpServer). Dev
+ * only: it lives here, not in the errmail package, so `errmail bench` needs a checkout.
+ *
+ * Speaks just enough SMTP for smtplib: EHLO/HELO (LHLO), MAIL, RCPT, DATA, NOOP, RSET,
+ * QUIT. One RCPT per transaction is assumed (LMTP then answers DATA once).
+ * `connect_delay` emulates the cost of a real relay handshake (TCP + TLS + login);
+ * `idle_timeout` makes the server drop idle connections like real relays do.
+ * `rcpt_delay` slows down RCPT for some recipient domains (a tarpitting or overloaded
+ * destination); `reject` is a set of addresses RCPT refuses with 550. Messages are counted
+ * per accepted recipient domain in `by_domain`.
+ */"""
+
+from __future__ import annotations
+
+import os
+import socket
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """/**
+     * @class _Handler
+     */"""
+
+    def handle(self) -> None:
+        srv: "StubSmtpServer" = self.server  # type: ignore[assignment]
+        with srv.lock:
+            srv.connections += 1
+        if srv.connect_delay:
+            time.sleep(srv.connect_delay)
+        if srv.idle_timeout:
+            self.connection.settimeout(srv.idle_timeout)
+        self._reply(b"220 stub ESMTP")
+        domains: list[str] = []
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                cmd = line.strip().upper()
+                if cmd.startswith(b"EHLO") or cmd.startswith(b"LHLO"):
+                    self._reply(b"250-stub\r\n250-8BITMIME\r\n250 SIZE 10485760")
+                elif cmd.startswith(b"RCPT"):
+                    addr = line.strip().rstrip(b">").rpartition(b"<")[2].decode("ascii", "replace").lower()
+                    if addr in srv.reject:
+                        self._reply(b"550 5.1.1 no such user")
+                        continue
+                    domain = addr.rpartition("@")[2]
+                    domains.append(domain)
+                    delay = srv.rcpt_delay.get(domain)
+                    if delay:
+                        time.sleep(delay)
+                    self._reply(b"250 ok")
+                elif cmd.startswith(b"HELO") or cmd.startswith(b"MAIL"):
+                    domains = []
+                    self._reply(b"250 ok")
+                elif cmd.startswith(b"NOOP") or cmd.startswith(b"RSET"):
+                    self._reply(b"250 ok")
+                elif cmd.startswith(b"DATA"):
+                    self._reply(b"354 go ahead")
+                    size = 0
+                    while True:
+                        data = self.rfile.readline()
+                        if not data or data == b".\r\n":
+                            break
+                        size += len(data)
+                    with srv.lock:
+                        srv.messages += 1
+                        srv.bytes_received += size
+                        for domain in domains:
+                            srv.by_domain[domain] = srv.by_domain.get(domain, 0) + 1
+                    domains = []
+                    self._reply(b"250 queued")
+                elif cmd.startswith(b"QUIT"):
+                    self._reply(b"221 bye")
+                    return
+                else:
+                    self._reply(b"502 not implemented")
+        except (socket.timeout, ConnectionError):
+            return
+
+    def _reply(self, data: bytes) -> None:
+        self.wfile.write(data + b"\r\n")
+
+
+class StubSmtpServer(socketserver.ThreadingTCPServer):
+    """/**
+     * @class StubSmtpServer
+     * @param {number} connect_delay seconds to wait before the 220 greeting
+     * @param {number} idle_timeout seconds of client silence before the server hangs up (0 = never)
+     * @param {?Object<string, number>} rcpt_delay seconds to wait on RCPT, per recipient domain
+     */"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self, connect_delay: float = 0.0, idle_timeout: float = 0.0, rcpt_delay: dict[str, float] | None = None
+    ) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.connect_delay = connect_delay
+        self.idle_timeout = idle_timeout
+        self.rcpt_delay = {k.lower(): v for k, v in (rcpt_delay or {}).items()}
+        self.reject: set[str] = set()
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.by_domain: dict[str, int] = {}
+        self.bytes_received = 0
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self) -> "StubSmtpServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class StubLmtpServer(socketserver.ThreadingUnixStreamServer):
+    """/**
+     * @class StubLmtpServer
+     * @description StubSmtpServer's protocol on a Unix socket, for transport="lmtp".
+     * @param {string} path socket path (removed on exit)
+     */"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str) -> None:
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        self.path = path
+        self.connect_delay = 0.0
+        self.idle_timeout = 0.0
+        self.rcpt_delay: dict[str, float] = {}
+        self.reject: set[str] = set()
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.by_domain: dict[str, int] = {}
+        self.bytes_received = 0
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StubLmtpServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
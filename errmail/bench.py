@@ -0,0 +1,318 @@
+"""/**
+ * @file bench.py
+ * @description `errmail bench`: measure what the wrapper costs on synthetic stderr workloads.
+ *
+ * For each workload the generator child is run twice:
+ * - baseline: child alone, output to /dev/null
+ * - wrapped: child under run_command() in a fresh worker process (so CPU and peak RSS
+ *   belong to the wrapper only), notifications delivered to a local stub SMTP server
+ *
+ * Every error line the child writes carries its write timestamp, so the worker can
+ * report child-write -> Notifier.enqueue latency percentiles.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+import json
+import os
+from pathlib import Path
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from .config import ErrmailConfig, load_config
+from .detector import ErrorEvent
+from .notifier import Notifier, TailArg
+from .runner import run_command
+
+# Generator child. argv: workload, count. Error lines end with "ts=<time.time()>".
+_CHILD_SCRIPT = r'''
+import sys, time
+kind, n = sys.argv[1], int(sys.argv[2])
+out = sys.stderr.buffer
+w, flush, now = out.write, out.flush, time.time
+if kind == "noise":
+    for i in range(n):
+        w(b"INFO request id=%d path=/api/v1/items status=200 took=12ms\n" % i)
+elif kind == "mixed":
+    for i in range(n):
+        if i % 20 == 19:
+            w(b"ERROR db timeout after 30s pool=main ts=%.6f\n" % now())
+            flush()
+        else:
+            w(b"INFO request id=%d path=/api/v1/items status=200 took=12ms\n" % i)
+elif kind == "traceback-storm":
+    for i in range(n // 6):
+        w(b"Traceback (most recent call last):\n"
+          b'  File "/srv/app/worker.py", line 120, in handle\n'
+          b"    result = process(job)\n"
+          b'  File "/srv/app/worker.py", line 88, in process\n'
+          b"    raise RuntimeError(msg)\n")
+        w(b"RuntimeError: job %d failed ts=%.6f\n" % (i % 7, now()))
+        flush()
+elif kind == "long-lines":
+    pad = b"x" * (256 * 1024)
+    for i in range(n):
+        if i % 50 == 49:
+            w(b"ERROR payload rejected ts=%.6f " % now() + pad + b"\n")
+            flush()
+        else:
+            w(b"INFO payload " + pad + b"\n")
+flush()
+'''
+
+_RE_TS = re.compile(r"ts=(\d+\.\d+)")
+
+
+@dataclass(frozen=True)
+class Workload:
+    """/**
+     * @class Workload
+     * @property {string} name
+     * @property {number} lines default number of stderr lines
+     * @property {string} description
+     */"""
+
+    name: str
+    lines: int
+    description: str
+
+
+WORKLOADS: dict[str, Workload] = {
+    w.name: w
+    for w in (
+        Workload("noise", 200_000, "INFO lines only (prefilter fast path)"),
+        Workload("mixed", 200_000, "INFO with 5% ERROR lines"),
+        Workload("traceback-storm", 120_000, "back-to-back Python tracebacks"),
+        Workload("long-lines", 400, "256KB lines, 2% ERROR"),
+    )
+}
+
+
+def child_command(workload: str, lines: int) -> list[str]:
+    """/**
+     * @param {string} workload
+     * @param {number} lines
+     * @returns {Array<string>}
+     */"""
+
+    return [sys.executable, "-c", _CHILD_SCRIPT, workload, str(lines)]
+
+
+def _percentiles(samples: list[float]) -> dict[str, float | None]:
+    """/**
+     * @param {Array<number>} samples milliseconds
+     * @returns {Object<string, ?number>}
+     */"""
+
+    if not samples:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    s = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(s[min(len(s) - 1, int(q * len(s)))], 3)
+
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(s[-1], 3)}
+
+
+class _RecordingNotifier(Notifier):
+    """/**
+     * @class _RecordingNotifier
+     * @description Notifier that timestamps every enqueue() before cooldown applies.
+     */"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.emit_to_enqueue: list[float] = []
+        self.detect_to_enqueue: list[float] = []
+
+    def enqueue(self, event: ErrorEvent, *, tail: TailArg, **kwargs: Any) -> None:
+        now = time.time()
+        self.detect_to_enqueue.append((now - event.ts) * 1000.0)
+        m = _RE_TS.search(event.message)
+        if m:
+            self.emit_to_enqueue.append((now - float(m.group(1))) * 1000.0)
+        super().enqueue(event, tail=tail, **kwargs)
+
+
+def _run_baseline(command: list[str]) -> dict[str, Any]:
+    """/**
+     * @param {Array<string>} command
+     * @returns {Object}
+     */"""
+
+    t0 = time.perf_counter()
+    p = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)  # noqa: S603
+    _, status, ru = os.wait4(p.pid, 0)
+    wall = time.perf_counter() - t0
+    p.returncode = os.waitstatus_to_exitcode(status)
+    return {"wall_s": wall, "child_cpu_s": ru.ru_utime + ru.ru_stime, "child_peak_rss_kb": ru.ru_maxrss}
+
+
+def _run_wrapped(workload: str, lines: int, smtp_port: int, result_path: str) -> dict[str, Any]:
+    """/**
+     * @description Run the worker process; its stdout/stderr (the forwarded child output)
+     * go to /dev/null.
+     * @returns {Object}
+     */"""
+
+    cmd = [sys.executable, "-m", "errmail.bench", workload, str(lines), str(smtp_port), result_path]
+    # Make sure the worker imports this same errmail, installed or not.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, check=False)  # noqa: S603
+    with open(result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _bench_config(smtp_port: int) -> ErrmailConfig:
+    """/**
+     * @param {number} smtp_port
+     * @returns {ErrmailConfig}
+     */"""
+
+    return replace(
+        load_config(service="bench"),
+        smtp_host="127.0.0.1",
+        smtp_port=smtp_port,
+        smtp_tls=False,
+        smtp_ssl=False,
+        smtp_user=None,
+        smtp_pass=None,
+        mail_from="errmail@localhost",
+        mail_to="bench@localhost",
+        cooldown_store="memory",
+    )
+
+
+def _worker(workload: str, lines: int, smtp_port: int, result_path: str) -> int:
+    """/**
+     * @description Inside the worker process: run the child under run_command().
+     * @returns {number}
+     */"""
+
+    cfg = _bench_config(smtp_port)
+    command = child_command(workload, lines)
+    notifier = _RecordingNotifier(cfg, command=command, cwd=os.getcwd())
+    r0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.perf_counter()
+    exit_code = run_command(command, cfg=cfg, notifier=notifier)
+    wall = time.perf_counter() - t0
+    r1 = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (r1.ru_utime - r0.ru_utime) + (r1.ru_stime - r0.ru_stime)
+    result = {
+        "exit_code": exit_code,
+        "wall_s": wall,
+        "wrapper_cpu_s": cpu,
+        "wrapper_cpu_pct": cpu / wall * 100.0 if wall > 0 else 0.0,
+        "wrapper_peak_rss_kb": r1.ru_maxrss,
+        "events": len(notifier.detect_to_enqueue),
+        "queue": notifier.stats(),
+        "detect_to_enqueue_ms": _percentiles(notifier.detect_to_enqueue),
+        "emit_to_enqueue_ms": _percentiles(notifier.emit_to_enqueue),
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    return 0
+
+
+def _stub_smtp_server() -> type:
+    """/**
+     * @description The stub SMTP server is a dev tool kept with the benchmarks
+     * (benchmarks/smtp_stub.py), not shipped in the package.
+     * @returns {type} StubSmtpServer
+     * @throws {RuntimeError} outside a source checkout
+     */"""
+
+    import importlib.util
+
+    path = Path(__file__).resolve().parent.parent / "benchmarks" / "smtp_stub.py"
+    if not path.is_file():
+        raise RuntimeError(f"errmail bench needs a source checkout ({path} not found)")
+    spec = importlib.util.spec_from_file_location("errmail_bench_smtp_stub", path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.StubSmtpServer
+
+
+def run_bench(workloads: list[str], *, lines: int | None = None, repeat: int = 1) -> dict[str, Any]:
+    """/**
+     * @param {Array<string>} workloads names from WORKLOADS
+     * @param {?number} lines override each workload's default line count
+     * @param {number} repeat runs per workload; the fastest wrapped run is reported
+     * @returns {Object} JSON-serializable report
+     * @throws {RuntimeError} outside a source checkout
+     */"""
+
+    StubSmtpServer = _stub_smtp_server()
+
+    cfg = load_config(service="bench")
+    report: dict[str, Any] = {
+        "schema": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runner": cfg.runner,
+        "pump_mode": cfg.pump_mode,
+        "workloads": {},
+    }
+    with StubSmtpServer() as smtp, tempfile.TemporaryDirectory() as tmp:
+        for name in workloads:
+            n = lines or WORKLOADS[name].lines
+            command = child_command(name, n)
+            baseline = min((_run_baseline(command) for _ in range(repeat)), key=lambda r: r["wall_s"])
+            wrapped = min(
+                (_run_wrapped(name, n, smtp.port, os.path.join(tmp, f"{name}.json")) for _ in range(repeat)),
+                key=lambda r: r["wall_s"],
+            )
+            base_lps = n / baseline["wall_s"]
+            wrap_lps = n / wrapped["wall_s"]
+            baseline["lines_per_s"] = base_lps
+            wrapped["lines_per_s"] = wrap_lps
+            report["workloads"][name] = {
+                "lines": n,
+                "baseline": baseline,
+                "wrapped": wrapped,
+                "throughput_ratio": wrap_lps / base_lps,
+            }
+        report["emails_delivered"] = smtp.messages
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    """/**
+     * @param {Object} report
+     * @returns {string}
+     */"""
+
+    out = [
+        f"errmail bench  python {report['python']}  runner={report['runner']}  pump={report['pump_mode']}",
+        f"{'workload':<16} {'lines':>8} {'alone l/s':>11} {'wrapped l/s':>12} {'ratio':>6} "
+        f"{'cpu%':>6} {'rss MB':>7} {'events':>7} {'p50 ms':>7} {'p99 ms':>7}",
+    ]
+    for name, r in report["workloads"].items():
+        w = r["wrapped"]
+        lat = w["emit_to_enqueue_ms"]
+
+        def ms(v: float | None) -> str:
+            return "-" if v is None else f"{v:.2f}"
+
+        out.append(
+            f"{name:<16} {r['lines']:>8} {r['baseline']['lines_per_s']:>11.0f} {w['lines_per_s']:>12.0f} "
+            f"{r['throughput_ratio']:>6.2f} {w['wrapper_cpu_pct']:>6.1f} {w['wrapper_peak_rss_kb'] / 1024:>7.1f} "
+            f"{w['events']:>7} {ms(lat['p50']):>7} {ms(lat['p99']):>7}"
+        )
+    out.append("latency: child write -> Notifier.enqueue; cpu%/rss: wrapper process only")
+    return "\n".join(out)
+
+
+if __name__ == "__main__":
+    # Worker entry point used by _run_wrapped().
+    raise SystemExit(_worker(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), sys.argv[4]))
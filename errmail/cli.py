@@ -4,19 +4,26 @@
  * - `errmail init` generate config template
  * - `errmail test` send a test email
  * - `errmail run -- <command...>` run command and alert on errors
+ * - `errmail supervise <file>` run many commands under one errmail process
+ * - `errmail watch <log files...>` follow log files and alert on errors
+ * - `errmail drain` deliver emails left in the spool by exited errmail processes
+ * - `errmail bench` measure wrapper overhead on synthetic workloads
  */"""
 
 from __future__ import annotations
 
 import argparse
+import json
 import os
 from pathlib import Path
 import sys
 
 from .config import load_config
 from .notifier import with_overrides
-from .mailer import MailPayload, build_subject, send_mail
-from .runner import run_command
+from .rules import load_ruleset
+
+# Subcommand modules (runner, supervisor, watcher, spool, bench, mailer) are imported by the
+# subcommand that needs them: `errmail run` is on the startup path of every wrapped job.
 
 
 def _env_bool(name: str, default: bool = False) -> bool:
@@ -67,11 +74,86 @@ def _build_parser() -> argparse.ArgumentParser:
     run.add_argument("--to", default=None, help="recipient email (override ERRMAIL_MAIL_TO)")
     run.add_argument("--cooldown-seconds", type=int, default=None, help="cooldown per fingerprint")
     run.add_argument("--tail-lines", type=int, default=None, help="stderr tail lines included in email")
+    run.add_argument("--pty", action="store_true", default=None, help="run the command on pseudo-terminals (or ERRMAIL_PTY)")
     run.add_argument("--verbose", action="store_true", help="print errmail internal logs to stderr")
 
+    sup = sub.add_parser("supervise", help="run many commands (one per line: service = command) under one errmail")
+    sup.add_argument("file", help="commands file; each line: <service> = <command args...>")
+    sup.add_argument("--cwd", default=None, help="working directory for the commands")
+    sup.add_argument("--to", default=None, help="recipient email (override ERRMAIL_MAIL_TO)")
+    sup.add_argument("--cooldown-seconds", type=int, default=None, help="cooldown per fingerprint")
+    sup.add_argument("--tail-lines", type=int, default=None, help="stderr tail lines included in email")
+    sup.add_argument("--pty", action="store_true", default=None, help="run the commands on pseudo-terminals (or ERRMAIL_PTY)")
+    sup.add_argument("--verbose", action="store_true", help="print errmail internal logs to stderr")
+
+    wat = sub.add_parser("watch", help="follow log files and email on errors (survives rotation and restarts)")
+    wat.add_argument("files", nargs="+", help="log files to follow (may not exist yet)")
+    wat.add_argument("--service", default=None, help="override service name (or ERRMAIL_SERVICE)")
+    wat.add_argument("--to", default=None, help="recipient email (override ERRMAIL_MAIL_TO)")
+    wat.add_argument("--cooldown-seconds", type=int, default=None, help="cooldown per fingerprint")
+    wat.add_argument("--tail-lines", type=int, default=None, help="log tail lines included in email")
+    wat.add_argument(
+        "--state",
+        default=None,
+        help="offset checkpoint file (or ERRMAIL_WATCH_STATE; default: ~/.local/state/errmail/watch-offsets.json)",
+    )
+    wat.add_argument("--interval", type=float, default=1.0, help="seconds between polls (default: 1)")
+    wat.add_argument("--from-start", action="store_true", help="read files without a checkpoint from the beginning")
+    wat.add_argument("--once", action="store_true", help="read what is there, checkpoint, and exit")
+    wat.add_argument("--verbose", action="store_true", help="print errmail internal logs to stderr")
+
+    dra = sub.add_parser("drain", help="deliver emails left in the spool by errmail processes that have exited")
+    dra.add_argument(
+        "--spool-dir",
+        default=None,
+        help="spool directory (or ERRMAIL_SPOOL_DIR; default: ~/.local/state/errmail/spool)",
+    )
+    dra.add_argument("--wait", type=float, default=0.0, help="seconds to wait for spool files still held by a running errmail")
+    dra.add_argument("--retry-for", type=float, default=0.0, help="keep retrying failed emails (with backoff) this many seconds")
+    dra.add_argument("--verbose", action="store_true", help="print errmail internal logs to stderr")
+
+    bench = sub.add_parser("bench", help="measure wrapper overhead on synthetic stderr workloads")
+    bench.add_argument(
+        "--workload",
+        action="append",
+        default=None,
+        help="workload to run: noise, mixed, traceback-storm, long-lines (repeatable; default: all)",
+    )
+    bench.add_argument("--lines", type=int, default=None, help="stderr lines per workload (default: per workload)")
+    bench.add_argument("--repeat", type=int, default=1, help="runs per workload; the fastest is reported")
+    bench.add_argument("--json", action="store_true", help="print the JSON report instead of a table")
+    bench.add_argument("--output", default=None, help="also write the JSON report to this file")
+
     return p
 
 
+def _warn_missing(cfg) -> None:
+    """/**
+     * @param {ErrmailConfig} cfg
+     */"""
+
+    from .mailer import missing_settings
+
+    missing = [m + " or --to" if m == "ERRMAIL_MAIL_TO" else m for m in missing_settings(cfg)]
+    if missing:
+        print(f"[errmail] email may be disabled, missing: {', '.join(missing)}", file=sys.stderr)
+
+
+def _check_rules(cfg) -> bool:
+    """/**
+     * @description Fail fast on a broken rules file instead of running without the rules.
+     * @param {ErrmailConfig} cfg
+     * @returns {boolean}
+     */"""
+
+    try:
+        load_ruleset(cfg)
+    except (OSError, ValueError) as e:
+        print(f"[errmail] invalid rules: {e}", file=sys.stderr)
+        return False
+    return True
+
+
 def _split_command_argv(argv: list[str]) -> tuple[list[str], list[str]]:
     """/**
      * @param {Array<string>} argv
@@ -193,6 +275,8 @@ def main(argv: list[str] | None = None) -> int:
         cfg = load_config(service=args.service)
         cfg = with_overrides(cfg, service=args.service, mail_to=args.to)
 
+        from .mailer import MailPayload, build_subject, send_mail
+
         subject = build_subject(cfg.service, "test", "manual")
         body = "This is a test email from errmail.\nIf you received it, SMTP config works.\n"
         err = send_mail(cfg, MailPayload(subject=subject, body=body))
@@ -216,23 +300,108 @@ def main(argv: list[str] | None = None) -> int:
             cooldown_seconds=args.cooldown_seconds,
             tail_lines=args.tail_lines,
             mail_to=args.to,
+            pty=args.pty,
         )
 
         # Important: by default we do NOT print anything. Keep output unchanged.
         # Only when verbose=1, print config warnings.
         if verbose:
-            missing = []
-            if not cfg.smtp_host:
-                missing.append("ERRMAIL_SMTP_HOST")
-            if not cfg.mail_from:
-                missing.append("ERRMAIL_MAIL_FROM")
-            if not cfg.mail_to:
-                missing.append("ERRMAIL_MAIL_TO or --to")
-            if missing:
-                print(f"[errmail] email may be disabled, missing: {', '.join(missing)}", file=sys.stderr)
+            _warn_missing(cfg)
+        if not _check_rules(cfg):
+            return 2
+
+        from .runner import run_command
 
         return run_command(cmd, cfg=cfg, cwd=args.cwd, verbose=verbose)
 
+    if args.subcmd == "supervise":
+        from .supervisor import parse_commands_file, supervise
+
+        verbose = bool(args.verbose or _env_bool("ERRMAIL_VERBOSE", False))
+        try:
+            specs = parse_commands_file(str(args.file))
+        except (OSError, ValueError) as e:
+            print(f"[errmail] cannot read {args.file}: {e}", file=sys.stderr)
+            return 2
+        if not specs:
+            print(f"[errmail] no commands in {args.file}", file=sys.stderr)
+            return 2
+        cfg = load_config()
+        cfg = with_overrides(
+            cfg,
+            cooldown_seconds=args.cooldown_seconds,
+            tail_lines=args.tail_lines,
+            mail_to=args.to,
+            pty=args.pty,
+        )
+        if verbose:
+            _warn_missing(cfg)
+        if not _check_rules(cfg):
+            return 2
+
+        return supervise(specs, cfg=cfg, cwd=args.cwd, verbose=verbose)
+
+    if args.subcmd == "watch":
+        from .watcher import watch
+
+        verbose = bool(args.verbose or _env_bool("ERRMAIL_VERBOSE", False))
+        cfg = load_config(service=args.service)
+        cfg = with_overrides(
+            cfg,
+            service=args.service,
+            cooldown_seconds=args.cooldown_seconds,
+            tail_lines=args.tail_lines,
+            mail_to=args.to,
+        )
+        if verbose:
+            _warn_missing(cfg)
+        if not _check_rules(cfg):
+            return 2
+
+        return watch(
+            list(args.files),
+            cfg=cfg,
+            state_path=args.state,
+            interval=max(0.05, args.interval),
+            from_start=args.from_start,
+            once=args.once,
+            verbose=verbose,
+        )
+
+    if args.subcmd == "drain":
+        from .spool import drain
+
+        verbose = bool(args.verbose or _env_bool("ERRMAIL_VERBOSE", False))
+        cfg = load_config()
+        if verbose:
+            _warn_missing(cfg)
+        delivered, left = drain(
+            cfg,
+            args.spool_dir,
+            wait=max(0.0, args.wait),
+            retry_for=max(0.0, args.retry_for),
+            verbose=verbose,
+        )
+        if verbose:
+            print(f"[errmail] drain: {delivered} delivered, {left} left in the spool", file=sys.stderr)
+        return 1 if left else 0
+
+    if args.subcmd == "bench":
+        from .bench import WORKLOADS, format_report, run_bench
+
+        for name in args.workload or []:
+            if name not in WORKLOADS:
+                parser.error(f"argument --workload: invalid choice: {name!r} (choose from {', '.join(WORKLOADS)})")
+        try:
+            report = run_bench(args.workload or list(WORKLOADS), lines=args.lines, repeat=max(1, args.repeat))
+        except RuntimeError as e:
+            parser.error(str(e))
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if args.output:
+            Path(str(args.output)).expanduser().write_text(text + "\n", encoding="utf-8")
+        print(text if args.json else format_report(report))
+        return 0
+
     parser.error("unknown subcommand")
     return 2
 
@@ -23,9 +23,38 @@ class ErrmailConfig:
      * @property {boolean} smtp_tls
      * @property {string} mail_from
      * @property {string} mail_to
+     * @property {string} transport "smtp", "sendmail", "lmtp", "maildir" or "mbox" (see transports.py)
+     * @property {string} sendmail_path sendmail binary for transport="sendmail"
+     * @property {?string} lmtp_socket Unix socket for transport="lmtp"
+     * @property {?string} sink_path Maildir directory / mbox file for transport="maildir" / "mbox"
+     * @property {number} smtp_concurrency max sends in flight to one mail server across all routes
      * @property {number} cooldown_seconds
      * @property {number} tail_lines
+     * @property {number} body_max_bytes budget of the inline email body (0 = unlimited)
+     * @property {boolean} attach_tail attach the full stderr tail (gzip) when the body was clipped
      * @property {string} service
+     * @property {string} pump_mode "binary" (raw chunk passthrough) or "text" (legacy readline)
+     * @property {string} runner "asyncio" (one event loop) or "thread" (two pump threads)
+     * @property {boolean} pty give children pseudo-terminals for stdout/stderr (line-buffered output)
+     * @property {number} digest_seconds coalesce notifications per window (0 = one email per event)
+     * @property {number} digest_max_events max events per digest email
+     * @property {string} cooldown_store "memory" (per process) or "sqlite" (shared on-disk table)
+     * @property {?string} cooldown_path SQLite file for cooldown_store="sqlite"
+     * @property {number} cooldown_max_entries max fingerprints kept in memory
+     * @property {string} queue_policy when the queue is over budget: "merge", "drop-oldest" or "drop-newest"
+     * @property {number} queue_max_bytes payload budget of the notification queue
+     * @property {number} rate_limit_per_hour global email rate (all fingerprints; 0 = unlimited)
+     * @property {number} rate_limit_burst emails that may go out back to back before the rate applies
+     * @property {boolean} spool write emails to an on-disk outbox before sending (retried, survives exit)
+     * @property {?string} spool_dir outbox directory (default: ~/.local/state/errmail/spool)
+     * @property {?string} metrics_addr serve Prometheus metrics on this "host:port"
+     * @property {?string} metrics_file rewrite Prometheus metrics to this file
+     * @property {number} metrics_interval seconds between metrics_file rewrites
+     * @property {?string} profile_dir write sampling/tracemalloc profiles here at exit
+     * @property {?string} rules_file user detection rules (in addition to /etc/errmail.rules, ~/.errmail.rules)
+     * @property {?string} watch_state_path offset checkpoint file of `errmail watch`
+     * @property {string} input_format "text" or "json" (JSON lines judged by their level/exception fields)
+     * @property {string} json_fingerprint comma-separated fields JSON events are fingerprinted on
      */"""
 
     smtp_host: str | None
@@ -39,6 +68,35 @@ class ErrmailConfig:
     cooldown_seconds: int
     tail_lines: int
     service: str
+    body_max_bytes: int = 64 * 1024
+    attach_tail: bool = True
+    transport: str = "smtp"
+    sendmail_path: str = "/usr/sbin/sendmail"
+    lmtp_socket: str | None = None
+    sink_path: str | None = None
+    smtp_concurrency: int = 4
+    pump_mode: str = "binary"
+    runner: str = "asyncio"
+    pty: bool = False
+    digest_seconds: int = 0
+    digest_max_events: int = 50
+    cooldown_store: str = "memory"
+    cooldown_path: str | None = None
+    cooldown_max_entries: int = 10000
+    queue_policy: str = "merge"
+    queue_max_bytes: int = 8 * 1024 * 1024
+    rate_limit_per_hour: int = 0
+    rate_limit_burst: int = 10
+    spool: bool = False
+    spool_dir: str | None = None
+    metrics_addr: str | None = None
+    metrics_file: str | None = None
+    metrics_interval: int = 10
+    profile_dir: str | None = None
+    rules_file: str | None = None
+    watch_state_path: str | None = None
+    input_format: str = "text"
+    json_fingerprint: str = "logger,message,exception"
 
 
 def _read_kv_env_file(path: str) -> dict[str, str]:
@@ -119,6 +177,24 @@ def _env_int(name: str, default: int, preset: dict[str, str] | None = None) -> i
         return default
 
 
+def _env_choice(name: str, default: str, choices: tuple[str, ...], preset: dict[str, str] | None = None) -> str:
+    """/**
+     * @param {string} name
+     * @param {string} default
+     * @param {Array<string>} choices
+     * @param {?Object<string, string>} preset
+     * @returns {string}
+     */"""
+
+    raw = os.getenv(name)
+    if raw is None and preset is not None:
+        raw = preset.get(name)
+    if raw is None:
+        return default
+    val = str(raw).strip().lower()
+    return val if val in choices else default
+
+
 def load_config(service: str | None = None) -> ErrmailConfig:
     """/**
      * @param {?string} service
@@ -156,5 +232,35 @@ def load_config(service: str | None = None) -> ErrmailConfig:
         cooldown_seconds=_env_int("ERRMAIL_COOLDOWN_SECONDS", 300, preset),
         tail_lines=_env_int("ERRMAIL_TAIL_LINES", 200, preset),
         service=svc,
+        body_max_bytes=_env_int("ERRMAIL_BODY_MAX_BYTES", 64 * 1024, preset),
+        attach_tail=_env_bool("ERRMAIL_ATTACH_TAIL", True, preset),
+        transport=_env_choice("ERRMAIL_TRANSPORT", "smtp", ("smtp", "sendmail", "lmtp", "maildir", "mbox"), preset),
+        sendmail_path=_coalesce(os.getenv("ERRMAIL_SENDMAIL"), preset.get("ERRMAIL_SENDMAIL")) or "/usr/sbin/sendmail",
+        lmtp_socket=_coalesce(os.getenv("ERRMAIL_LMTP_SOCKET"), preset.get("ERRMAIL_LMTP_SOCKET")),
+        sink_path=_coalesce(os.getenv("ERRMAIL_SINK_PATH"), preset.get("ERRMAIL_SINK_PATH")),
+        smtp_concurrency=_env_int("ERRMAIL_SMTP_CONCURRENCY", 4, preset),
+        pump_mode=_env_choice("ERRMAIL_PUMP_MODE", "binary", ("binary", "text"), preset),
+        runner=_env_choice("ERRMAIL_RUNNER", "asyncio", ("asyncio", "thread"), preset),
+        pty=_env_bool("ERRMAIL_PTY", False, preset),
+        digest_seconds=_env_int("ERRMAIL_DIGEST_SECONDS", 0, preset),
+        digest_max_events=_env_int("ERRMAIL_DIGEST_MAX_EVENTS", 50, preset),
+        cooldown_store=_env_choice("ERRMAIL_COOLDOWN_STORE", "memory", ("memory", "sqlite"), preset),
+        cooldown_path=_coalesce(os.getenv("ERRMAIL_COOLDOWN_PATH"), preset.get("ERRMAIL_COOLDOWN_PATH")),
+        cooldown_max_entries=_env_int("ERRMAIL_COOLDOWN_MAX_ENTRIES", 10000, preset),
+        queue_policy=_env_choice("ERRMAIL_QUEUE_POLICY", "merge", ("merge", "drop-oldest", "drop-newest"), preset),
+        queue_max_bytes=_env_int("ERRMAIL_QUEUE_MAX_BYTES", 8 * 1024 * 1024, preset),
+        rate_limit_per_hour=_env_int("ERRMAIL_RATE_LIMIT", 0, preset),
+        rate_limit_burst=_env_int("ERRMAIL_RATE_BURST", 10, preset),
+        spool=_env_bool("ERRMAIL_SPOOL", False, preset),
+        spool_dir=_coalesce(os.getenv("ERRMAIL_SPOOL_DIR"), preset.get("ERRMAIL_SPOOL_DIR")),
+        metrics_addr=_coalesce(os.getenv("ERRMAIL_METRICS_ADDR"), preset.get("ERRMAIL_METRICS_ADDR")),
+        metrics_file=_coalesce(os.getenv("ERRMAIL_METRICS_FILE"), preset.get("ERRMAIL_METRICS_FILE")),
+        metrics_interval=_env_int("ERRMAIL_METRICS_INTERVAL", 10, preset),
+        profile_dir=_coalesce(os.getenv("ERRMAIL_PROFILE"), preset.get("ERRMAIL_PROFILE")),
+        rules_file=_coalesce(os.getenv("ERRMAIL_RULES_FILE"), preset.get("ERRMAIL_RULES_FILE")),
+        watch_state_path=_coalesce(os.getenv("ERRMAIL_WATCH_STATE"), preset.get("ERRMAIL_WATCH_STATE")),
+        input_format=_env_choice("ERRMAIL_INPUT_FORMAT", "text", ("text", "json"), preset),
+        json_fingerprint=_coalesce(os.getenv("ERRMAIL_JSON_FINGERPRINT"), preset.get("ERRMAIL_JSON_FINGERPRINT"))
+        or "logger,message,exception",
     )
 
@@ -0,0 +1,245 @@
+"""/**
+ * @file cooldown.py
+ * @description Cooldown stores: "was this fingerprint alerted recently?"
+ *
+ * - MemoryCooldownStore: in-process, bounded, entries expire after the TTL.
+ * - SqliteCooldownStore: on-disk table shared by every errmail process on the host,
+ *   so restarts (e.g. a crash-looping service) do not re-send the same alert.
+ */"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+
+from .config import ErrmailConfig
+
+
+class CooldownStore(ABC):
+    """/**
+     * @class CooldownStore
+     * @description Interface. should_send() atomically checks and records a send.
+     */"""
+
+    @abstractmethod
+    def should_send(self, key: str, now: float, cooldown: float) -> bool:
+        """/**
+         * @param {string} key
+         * @param {number} now unix timestamp
+         * @param {number} cooldown seconds
+         * @returns {boolean} true if no send was recorded within cooldown (and records one now)
+         */"""
+
+    @abstractmethod
+    def forget(self, key: str, ts: float) -> None:
+        """/**
+         * @description Undo the send should_send() recorded at ts: it did not go out after
+         * all (e.g. the notification queue dropped it). Newer records are kept.
+         * @param {string} key
+         * @param {number} ts the `now` given to should_send()
+         */"""
+
+    def close(self) -> None:
+        """/**
+         * @returns {void}
+         */"""
+
+
+class MemoryCooldownStore(CooldownStore):
+    """/**
+     * @class MemoryCooldownStore
+     * @description Insertion-ordered dict kept in last-sent order, so expired entries
+     * are always at the front: eviction is amortized O(1) per call.
+     *
+     * @param {number} max_entries hard cap; the oldest entries are evicted first
+     * @param {number} ttl_seconds entries older than this are dropped (>= cooldown)
+     */"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0) -> None:
+        self._max = max(1, max_entries)
+        self._ttl = ttl_seconds
+        self._last: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def last_sent(self, key: str) -> Optional[float]:
+        """/**
+         * @param {string} key
+         * @returns {?number}
+         */"""
+
+        return self._last.get(key)
+
+    def mark(self, key: str, ts: float) -> None:
+        """/**
+         * @param {string} key
+         * @param {number} ts
+         */"""
+
+        with self._lock:
+            self._mark(key, ts)
+
+    def _mark(self, key: str, ts: float) -> None:
+        last = self._last
+        last[key] = ts
+        last.move_to_end(key)
+        horizon = ts - self._ttl
+        while last:
+            k, t = next(iter(last.items()))
+            if t >= horizon and len(last) <= self._max:
+                break
+            del last[k]
+
+    def should_send(self, key: str, now: float, cooldown: float) -> bool:
+        # Suppressed repeats (the storm case) skip the lock: a dict lookup is atomic.
+        last = self._last.get(key)
+        if last is not None and now - last < cooldown:
+            return False
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < cooldown:
+                return False
+            self._mark(key, now)
+            return True
+
+    def forget(self, key: str, ts: float) -> None:
+        with self._lock:
+            if self._last.get(key) == ts:
+                del self._last[key]
+
+
+class SqliteCooldownStore(CooldownStore):
+    """/**
+     * @class SqliteCooldownStore
+     * @description Cooldown table in a SQLite file (WAL mode; SQLite's file locking makes it
+     * safe to share between concurrent errmail processes).
+     *
+     * Hot path stays O(1): a MemoryCooldownStore in front answers "sent recently" without
+     * touching the disk. Only a key that may be sendable goes to the table, inside an
+     * IMMEDIATE transaction so two processes cannot both claim it. A claim waits at most
+     * _BUSY_TIMEOUT for the database lock; past that the send is allowed.
+     *
+     * @param {string} path
+     * @param {number} max_entries size of the in-process front cache
+     * @param {number} ttl_seconds rows older than this are pruned
+     */"""
+
+    _PRUNE_EVERY = 256
+    # should_send() runs on the caller's thread (Notifier.enqueue): wait at most this long
+    # for another process's transaction, then decide from in-process state.
+    _BUSY_TIMEOUT = 0.1
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl_seconds: float = 300.0) -> None:
+        import sqlite3
+
+        p = Path(path).expanduser()
+        p.parent.mkdir(parents=True, exist_ok=True)
+        self._sqlite3 = sqlite3
+        self._db = sqlite3.connect(str(p), timeout=2.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cooldown (key TEXT PRIMARY KEY, last_sent REAL NOT NULL)")
+        # Setup above may wait; claims below may not.
+        self._db.execute(f"PRAGMA busy_timeout={int(self._BUSY_TIMEOUT * 1000)}")
+        self._ttl = ttl_seconds
+        self._local = MemoryCooldownStore(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def should_send(self, key: str, now: float, cooldown: float) -> bool:
+        last = self._local.last_sent(key)
+        if last is not None and now - last < cooldown:
+            return False
+        with self._lock:
+            try:
+                return self._claim(key, now, cooldown)
+            except self._sqlite3.Error:
+                # Disk trouble (or another process holding the lock past _BUSY_TIMEOUT) must
+                # not swallow or delay alerts: fall back to in-process state.
+                return self._local.should_send(key, now, cooldown)
+
+    def _claim(self, key: str, now: float, cooldown: float) -> bool:
+        """/**
+         * @returns {boolean}
+         */"""
+
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT last_sent FROM cooldown WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[0] < cooldown:
+                db.execute("COMMIT")
+                # Another process (or a previous run) sent it: remember locally.
+                self._local.mark(key, row[0])
+                return False
+            db.execute(
+                "INSERT INTO cooldown (key, last_sent) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET last_sent = excluded.last_sent",
+                (key, now),
+            )
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                db.execute("DELETE FROM cooldown WHERE last_sent < ?", (now - self._ttl,))
+            db.execute("COMMIT")
+        except BaseException:
+            try:
+                db.execute("ROLLBACK")
+            except self._sqlite3.Error:
+                pass
+            raise
+        self._local.mark(key, now)
+        return True
+
+    def forget(self, key: str, ts: float) -> None:
+        self._local.forget(key, ts)
+        with self._lock:
+            try:
+                self._db.execute("DELETE FROM cooldown WHERE key = ? AND last_sent = ?", (key, ts))
+            except self._sqlite3.Error:
+                # The record stays: one cooldown without an email, as before.
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._db.close()
+            except self._sqlite3.Error:
+                pass
+
+
+def default_cooldown_path() -> str:
+    """/**
+     * @returns {string}
+     */"""
+
+    base = os.getenv("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return str(Path(base) / "errmail" / "cooldown.sqlite3")
+
+
+def open_cooldown_store(cfg: ErrmailConfig) -> CooldownStore:
+    """/**
+     * @description Build the store selected by ERRMAIL_COOLDOWN_STORE. Falls back to the
+     * in-memory store if the on-disk one cannot be opened.
+     *
+     * @param {ErrmailConfig} cfg
+     * @returns {CooldownStore}
+     */"""
+
+    # Keep entries at least one cooldown (and never less than a minute).
+    ttl = float(max(cfg.cooldown_seconds, 60))
+    if cfg.cooldown_store == "sqlite":
+        try:
+            return SqliteCooldownStore(
+                cfg.cooldown_path or default_cooldown_path(),
+                max_entries=cfg.cooldown_max_entries,
+                ttl_seconds=ttl,
+            )
+        except Exception:  # noqa: BLE001
+            pass
+    return MemoryCooldownStore(max_entries=cfg.cooldown_max_entries, ttl_seconds=ttl)
@@ -1,18 +1,31 @@
 """/**
  * @file mailer.py
- * @description SMTP mail sending (best-effort, never block the main process).
+ * @description Mail sending (best-effort, never block the main process): message
+ * building, the Transport interface and the SMTP transport. The other transports
+ * (ERRMAIL_TRANSPORT) are in transports.py.
+ *
+ * smtplib, ssl and the email package are imported on first send, not at import time:
+ * most wrapped runs never send mail and should not pay for loading them.
+ *
+ * Bodies are kept under a byte budget (ERRMAIL_BODY_MAX_BYTES, see render_body); what
+ * did not fit inline goes along as a gzip attachment written line by line (gzip_lines).
  */"""
 
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from email.message import EmailMessage
-import smtplib
-import ssl
+import threading
 import time
-from typing import Optional
+from typing import TYPE_CHECKING, Optional, Sequence, Union
 
 from .config import ErrmailConfig
+from .utils import TailSnapshot
+
+if TYPE_CHECKING:
+    from email.message import EmailMessage
+    import smtplib
+    import ssl
 
 
 @dataclass(frozen=True)
@@ -21,10 +34,36 @@ class MailPayload:
      * @class MailPayload
      * @property {string} subject
      * @property {string} body
+     * @property {Array<[string, Uint8Array]>} attachments (file name, gzip data)
      */"""
 
     subject: str
     body: str
+    attachments: "tuple[tuple[str, bytes], ...]" = ()
+
+
+# Settings each transport needs (attribute, env var).
+_REQUIRED: dict[str, tuple[tuple[str, str], ...]] = {
+    "smtp": (
+        ("smtp_host", "ERRMAIL_SMTP_HOST"),
+        ("smtp_port", "ERRMAIL_SMTP_PORT"),
+        ("mail_from", "ERRMAIL_MAIL_FROM"),
+        ("mail_to", "ERRMAIL_MAIL_TO"),
+    ),
+    "sendmail": (("sendmail_path", "ERRMAIL_SENDMAIL"), ("mail_to", "ERRMAIL_MAIL_TO")),
+    "lmtp": (("lmtp_socket", "ERRMAIL_LMTP_SOCKET"), ("mail_from", "ERRMAIL_MAIL_FROM"), ("mail_to", "ERRMAIL_MAIL_TO")),
+    "maildir": (("sink_path", "ERRMAIL_SINK_PATH"),),
+    "mbox": (("sink_path", "ERRMAIL_SINK_PATH"),),
+}
+
+
+def missing_settings(cfg: ErrmailConfig) -> list[str]:
+    """/**
+     * @param {ErrmailConfig} cfg
+     * @returns {Array<string>} env vars cfg.transport needs but that are not set
+     */"""
+
+    return [env for attr, env in _REQUIRED.get(cfg.transport, ()) if not getattr(cfg, attr)]
 
 
 def can_send(cfg: ErrmailConfig) -> bool:
@@ -33,51 +72,257 @@ def can_send(cfg: ErrmailConfig) -> bool:
      * @returns {boolean}
      */"""
 
-    return bool(cfg.smtp_host and cfg.smtp_port and cfg.mail_from and cfg.mail_to)
+    return not missing_settings(cfg)
+
+
+_SSL_CONTEXT: ssl.SSLContext | None = None
+_SSL_LOCK = threading.Lock()
+
+
+def _ssl_context() -> ssl.SSLContext:
+    """/**
+     * @description Process-wide default SSL context (loading CA certs is expensive).
+     * @returns {ssl.SSLContext}
+     */"""
+
+    global _SSL_CONTEXT
+    with _SSL_LOCK:
+        if _SSL_CONTEXT is None:
+            import ssl
+
+            _SSL_CONTEXT = ssl.create_default_context()
+        return _SSL_CONTEXT
 
 
-def send_mail(cfg: ErrmailConfig, payload: MailPayload, timeout_seconds: int = 10) -> Optional[str]:
+def _build_message(cfg: ErrmailConfig, payload: MailPayload) -> EmailMessage:
     """/**
      * @param {ErrmailConfig} cfg
      * @param {MailPayload} payload
-     * @param {number} timeout_seconds
-     * @returns {?string} error string (if failed)
+     * @returns {EmailMessage}
      */"""
 
-    if not can_send(cfg):
-        return "missing SMTP config (ERRMAIL_SMTP_HOST/PORT, ERRMAIL_MAIL_FROM/TO)"
+    from email.message import EmailMessage
 
     msg = EmailMessage()
-    msg["From"] = cfg.mail_from
-    msg["To"] = cfg.mail_to
+    # Optional for sendmail (fills in the local user) and the file sinks.
+    if cfg.mail_from:
+        msg["From"] = cfg.mail_from
+    if cfg.mail_to:
+        msg["To"] = cfg.mail_to
     msg["Subject"] = payload.subject
     msg.set_content(payload.body)
+    for name, data in payload.attachments:
+        msg.add_attachment(data, maintype="application", subtype="gzip", filename=name)
+    return msg
 
-    try:
+
+class Transport(ABC):
+    """/**
+     * @class Transport
+     * @description Interface. Delivers built messages; may keep a connection (or an open
+     * file) between sends. Not thread-safe: owned by one sender thread.
+     *
+     * @property {Array<string>} refused after a send() that failed for some recipients
+     *   only (LMTP reports per recipient): those still to deliver to; empty otherwise
+     */"""
+
+    refused: "list[str]" = []
+
+    @abstractmethod
+    def send(self, msg: EmailMessage) -> None:
+        """/**
+         * @param {EmailMessage} msg
+         * @throws on delivery failure
+         */"""
+
+    def close(self) -> None:
+        """/**
+         * @description Release the connection / file (best-effort).
+         */"""
+
+
+class SmtpSession(Transport):
+    """/**
+     * @class SmtpSession
+     * @description A reusable SMTP connection: connect + TLS + login once, then send many
+     * messages. Before reusing a connection that sat idle it is probed with NOOP, and a
+     * connection the server dropped is re-established transparently (once per send).
+     *
+     * Not thread-safe: owned by one worker thread (see Notifier).
+     *
+     * @param {ErrmailConfig} cfg
+     * @param {number} timeout_seconds
+     * @param {number} noop_after_seconds probe with NOOP if idle longer than this
+     * @param {number} max_idle_seconds drop the connection if idle longer than this
+     */"""
+
+    def __init__(
+        self,
+        cfg: ErrmailConfig,
+        timeout_seconds: int = 10,
+        noop_after_seconds: float = 5.0,
+        max_idle_seconds: float = 240.0,
+    ) -> None:
+        self._cfg = cfg
+        self._timeout = timeout_seconds
+        self._noop_after = noop_after_seconds
+        self._max_idle = max_idle_seconds
+        self._smtp: smtplib.SMTP | None = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        """/**
+         * @returns {smtplib.SMTP}
+         */"""
+
+        import smtplib
+
+        cfg = self._cfg
         # Priority: SMTP_SSL (implicit TLS, usually port 465) > STARTTLS (usually port 587) > plain.
         if cfg.smtp_ssl:
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(cfg.smtp_host, cfg.smtp_port, timeout=timeout_seconds, context=context) as s:
-                if cfg.smtp_user and cfg.smtp_pass:
-                    s.login(cfg.smtp_user, cfg.smtp_pass)
-                s.send_message(msg)
-        elif cfg.smtp_tls:
-            context = ssl.create_default_context()
-            with smtplib.SMTP(cfg.smtp_host, cfg.smtp_port, timeout=timeout_seconds) as s:
+            s: smtplib.SMTP = smtplib.SMTP_SSL(cfg.smtp_host, cfg.smtp_port, timeout=self._timeout, context=_ssl_context())
+        else:
+            s = smtplib.SMTP(cfg.smtp_host, cfg.smtp_port, timeout=self._timeout)
+        try:
+            if cfg.smtp_tls and not cfg.smtp_ssl:
                 s.ehlo()
-                s.starttls(context=context)
+                s.starttls(context=_ssl_context())
                 s.ehlo()
-                if cfg.smtp_user and cfg.smtp_pass:
-                    s.login(cfg.smtp_user, cfg.smtp_pass)
-                s.send_message(msg)
-        else:
-            with smtplib.SMTP(cfg.smtp_host, cfg.smtp_port, timeout=timeout_seconds) as s:
-                if cfg.smtp_user and cfg.smtp_pass:
-                    s.login(cfg.smtp_user, cfg.smtp_pass)
-                s.send_message(msg)
+            if cfg.smtp_user and cfg.smtp_pass:
+                s.login(cfg.smtp_user, cfg.smtp_pass)
+        except Exception:
+            _close_quietly(s)
+            raise
+        self.connects += 1
+        return s
+
+    def _alive(self, s: smtplib.SMTP) -> bool:
+        """/**
+         * @param {smtplib.SMTP} s
+         * @returns {boolean}
+         */"""
+
+        try:
+            return s.noop()[0] == 250
+        except Exception:  # noqa: BLE001
+            return False
+
+    def send(self, msg: EmailMessage) -> None:
+        """/**
+         * @param {EmailMessage} msg
+         * @throws on delivery failure
+         */"""
+
+        import smtplib
+
+        now = time.monotonic()
+        idle = now - self._last_used
+        reused = self._smtp is not None
+        if self._smtp is not None and (idle > self._max_idle or (idle > self._noop_after and not self._alive(self._smtp))):
+            self.close()
+            reused = False
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._transmit(self._smtp, msg)
+        except smtplib.SMTPServerDisconnected as e:
+            self._resend_after_drop(msg, reused, e)
+        except smtplib.SMTPException:
+            # A rejected message: keep the connection usable for the next one.
+            try:
+                self._smtp.rset()
+            except Exception:  # noqa: BLE001
+                self.close()
+            raise
+        except OSError as e:
+            # Reset / broken pipe / timeout on the socket.
+            self._resend_after_drop(msg, reused, e)
+        self._last_used = time.monotonic()
+
+    def _resend_after_drop(self, msg: EmailMessage, reused: bool, exc: OSError) -> None:
+        """/**
+         * @description The server dropped a pooled connection between sends: reconnect once.
+         * A fresh connection that fails is a real error and is re-raised.
+         * @param {EmailMessage} msg
+         * @param {boolean} reused
+         * @param {OSError} exc what the send failed with
+         * @throws {OSError} exc, if the connection was not a reused one
+         */"""
+
+        self.close()
+        if not reused:
+            raise exc
+        self._smtp = self._connect()
+        self._transmit(self._smtp, msg)
+
+    def _transmit(self, s: smtplib.SMTP, msg: EmailMessage) -> None:
+        """/**
+         * @description One mail transaction on an open connection.
+         * @param {smtplib.SMTP} s
+         * @param {EmailMessage} msg
+         */"""
+
+        s.send_message(msg)
+
+    def close(self) -> None:
+        """/**
+         * @description QUIT and drop the connection (best-effort).
+         */"""
+
+        s, self._smtp = self._smtp, None
+        if s is not None:
+            _close_quietly(s)
+
+
+def _close_quietly(s: smtplib.SMTP) -> None:
+    """/**
+     * @param {smtplib.SMTP} s
+     */"""
+
+    try:
+        s.quit()
+    except Exception:  # noqa: BLE001
+        try:
+            s.close()
+        except Exception:  # noqa: BLE001
+            pass
+
+
+def send_mail(
+    cfg: ErrmailConfig,
+    payload: MailPayload,
+    timeout_seconds: int = 10,
+    session: Transport | None = None,
+) -> Optional[str]:
+    """/**
+     * @param {ErrmailConfig} cfg
+     * @param {MailPayload} payload
+     * @param {number} timeout_seconds
+     * @param {?Transport} session reuse this transport (default: one-shot cfg.transport)
+     * @returns {?string} error string (if failed)
+     */"""
+
+    if session is not None:
+        session.refused = []
+    missing = missing_settings(cfg)
+    if missing:
+        return f"missing {cfg.transport} config ({', '.join(missing)})"
+
+    msg = _build_message(cfg, payload)
+    one_shot = session is None
+    if session is None:
+        from .transports import open_transport
+
+        session = open_transport(cfg, timeout_seconds=timeout_seconds)
+    try:
+        session.send(msg)
         return None
     except Exception as e:  # noqa: BLE001
         return f"{type(e).__name__}: {e}"
+    finally:
+        if one_shot:
+            session.close()
 
 
 def build_subject(service: str, kind: str, fp: str) -> str:
@@ -93,7 +338,201 @@ def build_subject(service: str, kind: str, fp: str) -> str:
     return f"【Bug警报！】{kind_display}"
 
 
-def format_body(
+# File name of the full stderr tail when the inline body had to be clipped.
+TAIL_ATTACHMENT = "stderr-tail.txt.gz"
+# Room kept for the "... [N lines omitted] ..." marker of a clipped section.
+_MARKER_RESERVE = 120
+# Smallest share of the budget left for excerpt + tail, however large the rest is.
+_MIN_VARIABLE_BYTES = 1024
+
+
+def _utf8_len(text: str) -> int:
+    """/**
+     * @param {string} text
+     * @returns {number}
+     */"""
+
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def _cut(text: str, max_bytes: int, keep_end: bool) -> str:
+    """/**
+     * @description The first (or last) max_bytes UTF-8 bytes of one over-long line.
+     * @param {string} text
+     * @param {number} max_bytes
+     * @param {boolean} keep_end
+     * @returns {string}
+     */"""
+
+    data = text.encode("utf-8")
+    data = data[len(data) - max_bytes :] if keep_end else data[:max_bytes]
+    return data.decode("utf-8", "ignore")
+
+
+def _fill_head(lines: Sequence[str], stop: int, budget: int) -> tuple[int, int]:
+    """/**
+     * @param {Array<string>} lines
+     * @param {number} stop index not to reach
+     * @param {number} budget bytes
+     * @returns {[number, number]} (lines from the start that fit, bytes left)
+     */"""
+
+    j = 0
+    while j < stop:
+        size = _utf8_len(lines[j])
+        if size > budget:
+            break
+        budget -= size
+        j += 1
+    return j, budget
+
+
+def clip_lines(lines: Sequence[str], max_bytes: int, note: str = "") -> tuple[str, bool]:
+    """/**
+     * @description Keep as many lines from the start and the end as fit in max_bytes
+     * (UTF-8, a third for the start, the rest for the end, where the error usually is)
+     * and replace the middle with a marker. Only the kept lines are measured and joined.
+     * The result is at most max_bytes as long as that leaves room for the marker
+     * (_MARKER_RESERVE plus the note).
+     *
+     * @param {Array<string>} lines with their line endings
+     * @param {number} max_bytes
+     * @param {string} note appended to the marker (e.g. where the full text is)
+     * @returns {[string, boolean]} (text, whether anything was left out)
+     */"""
+
+    budget = max(0, max_bytes - _MARKER_RESERVE - _utf8_len(note))
+    n = len(lines)
+    end_budget = budget - budget // 3
+    i, used = n, 0
+    while i > 0:
+        size = _utf8_len(lines[i - 1])
+        if used + size > end_budget:
+            break
+        used += size
+        i -= 1
+    j, head_budget = _fill_head(lines, i, budget - used)
+    if j == i:
+        return "".join(lines), False
+    end = list(lines[i:])
+    partial = ""
+    if not end:
+        # The last line alone is over its share: keep its end, and give the start only
+        # what that leaves.
+        i -= 1
+        end = [_cut(lines[i], end_budget, keep_end=True)]
+        partial = "the start of the last line"
+        j, head_budget = _fill_head(lines, i, budget - _utf8_len(end[0]))
+    head = list(lines[:j])
+    if not head and j == 0 and i > 0:
+        head = [_cut(lines[0], head_budget, keep_end=False)] if head_budget > 0 else []
+        if head:
+            j = 1
+            partial = "the end of the first line"
+    if head and not head[-1].endswith("\n"):
+        head[-1] += "\n"
+    what = [f"{i - j} line(s)"] if i > j else []
+    if partial:
+        what.append(partial)
+    marker = f"... [{' and '.join(what)} omitted{note}] ...\n"
+    return "".join(head) + marker + "".join(end), True
+
+
+def _lines_of(text: "Union[str, TailSnapshot]") -> Sequence[str]:
+    """/**
+     * @param {string|TailSnapshot} text
+     * @returns {Array<string>} lines with their endings
+     */"""
+
+    return text.lines if isinstance(text, TailSnapshot) else text.splitlines(keepends=True)
+
+
+def _size_of(text: "Union[str, TailSnapshot]") -> int:
+    """/**
+     * @description Size in characters (a lower bound of the UTF-8 size), without joining.
+     * @param {string|TailSnapshot} text
+     * @returns {number}
+     */"""
+
+    return text.nbytes if isinstance(text, TailSnapshot) else len(text)
+
+
+def _has_text(text: "Union[str, TailSnapshot]") -> bool:
+    """/**
+     * @param {string|TailSnapshot} text
+     * @returns {boolean} anything besides whitespace
+     */"""
+
+    if isinstance(text, TailSnapshot):
+        return any(line.strip() for line in text.lines)
+    return bool(text and text.strip())
+
+
+def _fit(text: "Union[str, TailSnapshot]", max_bytes: int, note: str = "") -> tuple[str, bool]:
+    """/**
+     * @param {string|TailSnapshot} text
+     * @param {number} max_bytes 0 = unlimited
+     * @param {string} note
+     * @returns {[string, boolean]} (text without trailing newlines, clipped)
+     */"""
+
+    size = _size_of(text)
+    if max_bytes <= 0 or size * 4 <= max_bytes:
+        clipped = False
+    elif size > max_bytes:
+        clipped = True
+    else:
+        # Within the budget in characters: check the real UTF-8 size.
+        flat = text if isinstance(text, str) else text.text
+        clipped = _utf8_len(flat) > max_bytes
+    if not clipped:
+        flat = text if isinstance(text, str) else text.text
+        return flat.rstrip("\n"), False
+    out, clipped = clip_lines(_lines_of(text), max_bytes, note)
+    return out.rstrip("\n"), clipped
+
+
+def gzip_lines(lines: Sequence[str]) -> bytes:
+    """/**
+     * @description Compress text line by line into a gzip member, so the full text is
+     * never built as one string.
+     *
+     * @param {Array<string>} lines with their line endings
+     * @returns {Uint8Array}
+     */"""
+
+    import gzip
+    import io
+
+    buf = io.BytesIO()
+    # mtime=0: the same text always compresses to the same bytes.
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6, mtime=0) as gz:
+        write = gz.write
+        for line in lines:
+            write(line.encode("utf-8", "replace"))
+    return buf.getvalue()
+
+
+def tail_attachment(tail: "Union[str, TailSnapshot]") -> tuple[str, bytes]:
+    """/**
+     * @param {string|TailSnapshot} tail
+     * @returns {[string, Uint8Array]} (TAIL_ATTACHMENT, full tail gzip-compressed)
+     */"""
+
+    return TAIL_ATTACHMENT, gzip_lines(_lines_of(tail))
+
+
+def format_body(**kwargs) -> str:
+    """/**
+     * @description render_body() without a byte budget.
+     * @param {Object} kwargs see render_body
+     * @returns {string}
+     */"""
+
+    return render_body(**kwargs)[0]
+
+
+def render_body(
     *,
     service: str,
     command: list[str],
@@ -104,10 +543,20 @@ def format_body(
     fp: str,
     message: str,
     excerpt: str,
-    tail: str,
+    tail: "Union[str, TailSnapshot]",
     ts: float | None = None,
-) -> str:
+    severity: str | None = None,
+    fields: "tuple[tuple[str, str], ...]" = (),
+    suppressed: "tuple[int, float] | None" = None,
+    max_bytes: int = 0,
+    attachment: str = "",
+) -> tuple[str, bool]:
     """/**
+     * @description Render the email body. With max_bytes, the excerpt and the stderr tail
+     * are clipped (start and end kept, see clip_lines) so the whole body stays within
+     * max_bytes UTF-8 bytes; the excerpt gets at most half of what the other sections
+     * leave when there is a tail.
+     *
      * @param {string} service
      * @param {Array<string>} command
      * @param {string} cwd
@@ -117,9 +566,15 @@ def format_body(
      * @param {string} fp
      * @param {string} message
      * @param {string} excerpt
-     * @param {string} tail
+     * @param {string|TailSnapshot} tail
      * @param {?number} ts
-     * @returns {string}
+     * @param {?string} severity shown when a user rule set it (see rules.py)
+     * @param {Array<[string, string]>} fields structured log fields (JSON input)
+     * @param {?[number, number]} suppressed (occurrences, since ts) not emailed since the
+     *   last email for this fingerprint (cooldown / rate limit)
+     * @param {number} max_bytes body budget (0 = unlimited)
+     * @param {string} attachment file name the clipped tail marker points to ("" = none)
+     * @returns {[string, boolean]} (body, whether anything was clipped)
      */"""
 
     t = ts or time.time()
@@ -141,6 +596,13 @@ def format_body(
         sep_thin,
         f"Error Type:    {kind_display}",
         f"Error Message: {message}",
+    ]
+    if severity and severity != "error":
+        parts.append(f"Severity:      {severity.upper()}")
+    if suppressed:
+        since = time.strftime("%H:%M", time.localtime(suppressed[1]))
+        parts.append(f"Occurrences:   {suppressed[0]} more occurrences since {since}")
+    parts += [
         "",
         sep,
         "",
@@ -148,21 +610,30 @@ def format_body(
         sep_thin,
     ]
     
-    # 添加错误摘要（如果有）
+    # 添加错误摘要（如果有）；正文超出预算时先记下位置，最后再截断填入
+    excerpt_at = tail_at = -1
     if excerpt and excerpt.strip():
-        parts.append(excerpt.rstrip("\n"))
+        excerpt_at = len(parts)
+        parts.append("")
+        parts.append("")
+
+    # 添加结构化日志字段（JSON 输入）
+    if fields:
+        width = max(len(k) for k, _ in fields) + 1
+        parts.extend([sep, "", "[ Log Fields ]", sep_thin])
+        parts.extend(f"{(k + ':').ljust(width)} {v}" for k, v in fields)
         parts.append("")
     
     # 添加 stderr 输出（如果有）
-    if tail and tail.strip():
+    if _has_text(tail):
         parts.extend([
             sep,
             "",
             "[ Full Output (Stderr) ]",
             sep_thin,
-            tail.rstrip("\n"),
-            "",
         ])
+        tail_at = len(parts)
+        parts.extend(["", ""])
     
     # 添加执行上下文信息
     parts.extend([
@@ -189,6 +660,20 @@ def format_body(
         "This is an automated error notification from errmail.",
         "",
     ])
-    
-    return "\n".join(parts)
 
+    clipped = False
+    left = 0
+    if max_bytes > 0:
+        left = max(_MIN_VARIABLE_BYTES, max_bytes - sum(_utf8_len(p) + 1 for p in parts))
+    if excerpt_at >= 0:
+        share = left // 2 if left and tail_at >= 0 else left
+        parts[excerpt_at], cut = _fit(excerpt, share)
+        clipped |= cut
+        if left:
+            left = max(0, left - _utf8_len(parts[excerpt_at]))
+    if tail_at >= 0:
+        note = f"; full output attached as {attachment}" if attachment else ""
+        parts[tail_at], cut = _fit(tail, max(left, 1) if max_bytes > 0 else 0, note)
+        clipped |= cut
+    
+    return "\n".join(parts), clipped
@@ -5,129 +5,1035 @@
 
 from __future__ import annotations
 
-from dataclasses import replace
+from collections import OrderedDict, deque
+from dataclasses import dataclass, replace
+from functools import partial
 import os
 import queue
 import threading
 import time
-from typing import Optional
+from typing import Callable, Optional, Sequence, Union
 
 from .config import ErrmailConfig
+from .cooldown import open_cooldown_store
 from .detector import ErrorEvent
-from .mailer import MailPayload, build_subject, format_body, send_mail
+from .mailer import TAIL_ATTACHMENT, MailPayload, build_subject, can_send, render_body, send_mail, tail_attachment
+from .metrics import METRICS
+from .rules import Route
+from .spool import SpoolEntry, close_outboxes, open_outbox
+from .transports import open_transport
+from .utils import TailSnapshot
+
+TailArg = Union[str, TailSnapshot, Callable[[], Union[str, TailSnapshot]]]
+
+
+@dataclass(frozen=True)
+class _Pending:
+    """/**
+     * @class _Pending
+     * @description One queued notification with the context of the child that produced it.
+     */"""
+
+    event: ErrorEvent
+    pid: int | None
+    exit_code: int | None
+    tail: str | TailSnapshot
+    service: str
+    command: list[str]
+    cwd: str
+    # time.monotonic() at enqueue, for the per-route queue latency.
+    queued_at: float = 0.0
+
+
+# Non-digest mode: notifications taken off the queue at once (one spool fsync).
+_MAX_BATCH = 64
+# Seconds between looks for spool segments of exited errmail processes.
+_ADOPT_INTERVAL = 3600.0
+# (service, kind, severity) -> route lookups remembered; past this, routes are matched
+# on every event.
+_ROUTE_CACHE_MAX = 4096
+# close(): how long to wait for a batch a worker is writing to the spool (never SMTP).
+_CLOSE_WAIT_SECONDS = 2.0
+# "merge" policy: fingerprints summarized one per line; merges past this are only counted.
+_MERGED_MAX = 200
+# Fixed per-item overhead (objects, strings headers) added to the payload estimate.
+_ITEM_OVERHEAD = 512
+
+
+def _payload_bytes(item: _Pending) -> int:
+    """/**
+     * @description Approximate memory held by one queued notification (characters).
+     * @param {_Pending} item
+     * @returns {number}
+     */"""
+
+    tail = item.tail
+    tail_size = len(tail) if isinstance(tail, str) else tail.nbytes
+    return _ITEM_OVERHEAD + len(item.event.message) + len(item.event.excerpt) + tail_size
+
+
+class _BoundedQueue:
+    """/**
+     * @class _BoundedQueue
+     * @description FIFO bounded by payload bytes instead of item count. Mirrors the parts
+     * of queue.Queue the Notifier uses (put_nowait/get/task_done/unfinished_tasks).
+     *
+     * Over budget, `policy` decides what gives:
+     * - "drop-oldest": evict queued notifications from the front until the new one fits
+     * - "drop-newest": reject the new notification
+     * - "merge": reject the new notification but keep a one-line summary of it
+     *   (service, kind, message, count per fingerprint) for the next email; past
+     *   _MERGED_MAX fingerprints further merges only add to one overflow count
+     *
+     * None (the flush sentinel) is always accepted and costs nothing.
+     *
+     * @param {number} max_bytes
+     * @param {string} policy
+     */"""
+
+    def __init__(self, max_bytes: int, policy: str) -> None:
+        self._max = max(1, max_bytes)
+        self._policy = policy
+        self._items: "deque[tuple[_Pending | None, int]]" = deque()
+        self._cond = threading.Condition()
+        self.unfinished_tasks = 0
+        self.nbytes = 0
+        # Totals since start, and what has not been reported in an email yet.
+        self.dropped = 0
+        self.merged = 0
+        self._unreported_dropped = 0
+        self._unreported_merged: "OrderedDict[str, list]" = OrderedDict()
+        self._unreported_merged_other = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put_nowait(self, item: "_Pending | None") -> bool:
+        """/**
+         * @param {?_Pending} item
+         * @returns {boolean} false if the item was dropped or merged
+         */"""
+
+        with self._cond:
+            size = 0 if item is None else _payload_bytes(item)
+            if item is not None and self.nbytes + size > self._max:
+                if self._policy == "drop-oldest":
+                    self._evict_until(self._max - size)
+                if self.nbytes + size > self._max:
+                    self._reject(item)
+                    return False
+            self._items.append((item, size))
+            self.nbytes += size
+            self.unfinished_tasks += 1
+            self._cond.notify()
+            return True
+
+    def _evict_until(self, budget: int) -> None:
+        """/**
+         * @param {number} budget
+         */"""
+
+        items = self._items
+        i = 0
+        while self.nbytes > budget and i < len(items):
+            old, size = items[i]
+            if old is None:
+                i += 1
+                continue
+            del items[i]
+            self.nbytes -= size
+            self.unfinished_tasks -= 1
+            self.dropped += 1
+            self._unreported_dropped += 1
+
+    def _reject(self, item: _Pending) -> None:
+        """/**
+         * @param {_Pending} item
+         */"""
+
+        if self._policy != "merge":
+            self.dropped += 1
+            self._unreported_dropped += 1
+            return
+        self.merged += 1
+        key = f"{item.service}:{item.event.fp}"
+        rec = self._unreported_merged.get(key)
+        if rec is not None:
+            rec[3] += 1
+        elif len(self._unreported_merged) < _MERGED_MAX:
+            self._unreported_merged[key] = [item.service, item.event.kind, item.event.message, 1]
+        else:
+            self._unreported_merged_other += 1
+
+    def get(self, timeout: float | None = None) -> "_Pending | None":
+        """/**
+         * @param {?number} timeout
+         * @returns {?_Pending}
+         * @throws {queue.Empty}
+         */"""
+
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout=timeout):
+                raise queue.Empty
+            item, size = self._items.popleft()
+            self.nbytes -= size
+            return item
+
+    def task_done(self) -> None:
+        """/**
+         * @returns {void}
+         */"""
+
+        with self._cond:
+            if self.unfinished_tasks > 0:
+                self.unfinished_tasks -= 1
+
+    def take_overload_report(self) -> str:
+        """/**
+         * @description Describe drops/merges since the last call, and reset them.
+         * @returns {string} empty if nothing was lost
+         */"""
+
+        with self._cond:
+            dropped = self._unreported_dropped
+            merged = self._unreported_merged
+            other = self._unreported_merged_other
+            if not dropped and not merged:
+                return ""
+            self._unreported_dropped = 0
+            self._unreported_merged = OrderedDict()
+            self._unreported_merged_other = 0
+        lines = ["[errmail] notification queue over budget since the last email:"]
+        if dropped:
+            lines.append(f"    {dropped} notification(s) dropped")
+        if merged:
+            total = sum(rec[3] for rec in merged.values()) + other
+            lines.append(f"    {total} notification(s) merged into this summary:")
+            for service, kind, message, count in merged.values():
+                lines.append(f"    x{count}  [{service}] {kind}: {message}")
+            if other:
+                lines.append(f"    x{other}  other error(s)")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class _TokenBucket:
+    """/**
+     * @class _TokenBucket
+     * @description Global email rate limit across all fingerprints: up to `burst` emails
+     * back to back, refilled at `per_hour`.
+     *
+     * @param {number} per_hour 0 = unlimited
+     * @param {number} burst
+     */"""
+
+    def __init__(self, per_hour: int, burst: int) -> None:
+        self.per_hour = max(0, per_hour)
+        self.burst = max(1, burst)
+        self._rate = self.per_hour / 3600.0
+        self._tokens = float(self.burst)
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self._rate <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._at) * self._rate)
+        self._at = now
+
+    def take(self) -> bool:
+        """/**
+         * @returns {boolean} true if an email may be sent now (and a token was used)
+         */"""
+
+        if self._rate <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    def wait_seconds(self) -> float:
+        """/**
+         * @returns {number} seconds until take() can succeed
+         */"""
+
+        if self._rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            return max(0.0, (1.0 - self._tokens) / self._rate)
+
+
+class _SuppressionLog:
+    """/**
+     * @class _SuppressionLog
+     * @description Occurrences that did not get their own email, per "service:fingerprint":
+     * - held back by cooldown (this fingerprint was emailed recently);
+     * - held back by the rate limit (it was not emailed at all).
+     * The next email for a fingerprint reports and resets its count ("N more occurrences
+     * since HH:MM"). Rate-limited fingerprints are also listed in the next email of any
+     * kind, so a capped storm still shows its size.
+     *
+     * Records are [service, kind, message, count, first ts]. Past max_entries per table
+     * the oldest record is dropped; a dropped rate-limited record's count is kept as a total.
+     *
+     * @param {number} max_entries
+     */"""
+
+    def __init__(self, max_entries: int) -> None:
+        self._max = max(1, max_entries)
+        self._cooled: "OrderedDict[str, list]" = OrderedDict()
+        self._limited: "OrderedDict[str, list]" = OrderedDict()
+        self._limited_since: float | None = None
+        self._limited_evicted = 0
+        self._lock = threading.Lock()
+
+    def note(self, key: str, service: str, event: ErrorEvent, *, limited: bool) -> bool:
+        """/**
+         * @param {string} key "service:fingerprint"
+         * @param {string} service
+         * @param {ErrorEvent} event
+         * @param {boolean} limited held back by the rate limit (else by cooldown)
+         * @returns {boolean} true if this is the first rate-limited record since the last report
+         */"""
+
+        with self._lock:
+            # A fingerprint that was never emailed stays in the rate-limited table.
+            rec = self._limited.get(key)
+            if rec is None and not limited:
+                rec = self._cooled.get(key)
+            if rec is not None:
+                rec[3] += 1
+                return False
+            table = self._limited if limited else self._cooled
+            first = limited and not self._limited and not self._limited_evicted
+            table[key] = [service, event.kind, event.message, 1, event.ts]
+            if limited and self._limited_since is None:
+                self._limited_since = event.ts
+            if len(table) > self._max:
+                _, old = table.popitem(last=False)
+                if limited:
+                    self._limited_evicted += old[3]
+            return first
+
+    def take(self, key: str) -> Optional[tuple[int, float]]:
+        """/**
+         * @param {string} key
+         * @returns {?[number, number]} (occurrences, first ts) held back since the last
+         *   email for this key, and forget them
+         */"""
+
+        with self._lock:
+            recs = [rec for rec in (self._cooled.pop(key, None), self._limited.pop(key, None)) if rec is not None]
+            if not self._limited and not self._limited_evicted:
+                self._limited_since = None
+        if not recs:
+            return None
+        return sum(rec[3] for rec in recs), min(rec[4] for rec in recs)
+
+    def is_limited(self, key: str) -> bool:
+        """/**
+         * @param {string} key
+         * @returns {boolean} held back by the rate limit since the last report
+         */"""
+
+        return key in self._limited
+
+    @property
+    def has_limited(self) -> bool:
+        return bool(self._limited) or self._limited_evicted > 0
+
+    def take_limited_report(self, bucket: _TokenBucket, max_lines: int = 20) -> str:
+        """/**
+         * @description Describe rate-limited occurrences since the last report, and reset.
+         * @param {_TokenBucket} bucket for the configured limit
+         * @param {number} max_lines errors listed one per line; the rest are summed up
+         * @returns {string} empty if nothing was held back by the rate limit
+         */"""
+
+        with self._lock:
+            if not self._limited and not self._limited_evicted:
+                return ""
+            recs = list(self._limited.values())
+            evicted, since = self._limited_evicted, self._limited_since
+            self._limited = OrderedDict()
+            self._limited_evicted = 0
+            self._limited_since = None
+        total = sum(rec[3] for rec in recs) + evicted
+        when = time.strftime("%H:%M", time.localtime(since)) if since else "?"
+        lines = [
+            f"[errmail] rate limit ({bucket.per_hour} emails/hour, burst {bucket.burst}): "
+            f"{total} occurrence(s) of {len(recs)} error(s) not emailed since {when}:"
+        ]
+        for service, kind, message, count, ts in recs[:max_lines]:
+            lines.append(f"    x{count}  [{service}] {kind}: {message}  (first {time.strftime('%H:%M:%S', time.localtime(ts))})")
+        rest = recs[max_lines:]
+        if rest:
+            lines.append(f"    ... and {len(rest)} more error(s), {sum(rec[3] for rec in rest)} occurrence(s)")
+        if evicted:
+            lines.append(f"    ... and {evicted} occurrence(s) of older errors")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class _Route:
+    """/**
+     * @class _Route
+     * @description One recipient list with its own queue, worker thread, transport
+     * connection and outbox, so a slow or failing mail server for one route never delays
+     * the others. Only touched by its worker thread, except `q` and `outbox` (thread-safe).
+     *
+     * @param {string} name metrics label: "default" or the recipients
+     * @param {ErrmailConfig} cfg with this route's mail_to
+     * @param {string} tag spool segment suffix ("" for the default route)
+     * @param {threading.BoundedSemaphore} slots shared by all routes on the same server
+     * @param {boolean} verbose
+     */"""
+
+    def __init__(
+        self, name: str, cfg: ErrmailConfig, tag: str, slots: threading.BoundedSemaphore, verbose: bool
+    ) -> None:
+        self.name = name
+        self.cfg = cfg
+        self.slots = slots
+        # None is a flush() sentinel that closes a digest window early.
+        self.q = _BoundedQueue(cfg.queue_max_bytes, cfg.queue_policy)
+        self.suppressed = _SuppressionLog(cfg.cooldown_max_entries)
+        # One SMTP/LMTP connection (or sink) reused across notifications, see ERRMAIL_TRANSPORT.
+        self.session = open_transport(cfg)
+        self.outbox = open_outbox(cfg, verbose=verbose, tag=tag)
+        # Segments left by exited errmail processes are picked up by the default route,
+        # at start and then hourly.
+        self.adopt_at: Optional[float] = None if tag else 0.0
+        self.latency = METRICS.labeled_histogram(
+            "errmail_route_queue_seconds", "enqueue to delivered, per route", "route", name
+        )
+        # Set by Notifier.close(): the worker closes `session` itself and exits.
+        self.closing = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+
+def _transport_target(cfg: ErrmailConfig) -> str:
+    """/**
+     * @param {ErrmailConfig} cfg
+     * @returns {string} the server (or sink) cfg delivers to, for ERRMAIL_SMTP_CONCURRENCY
+     */"""
+
+    if cfg.transport == "smtp":
+        return f"smtp://{cfg.smtp_host}:{cfg.smtp_port}"
+    if cfg.transport == "sendmail":
+        return f"sendmail:{cfg.sendmail_path}"
+    if cfg.transport == "lmtp":
+        return f"lmtp:{cfg.lmtp_socket}"
+    return f"{cfg.transport}:{cfg.sink_path}"
 
 
 class Notifier:
     """/**
      * @class Notifier
-     * @description Enqueue events and send emails in a background thread.
+     * @description Enqueue events and send emails in background threads.
      *
      * Guarantees:
      * - Never blocks the main process on SMTP.
-     * - Cooldown per fingerprint to avoid email storms.
+     * - Cooldown per (service, fingerprint) to avoid email storms.
+     * - Global rate limit (cfg.rate_limit_per_hour, cfg.rate_limit_burst) across
+     *   fingerprints, for storms of distinct errors. Nothing held back by cooldown or the
+     *   rate limit is forgotten: counts show up in the next email (see _SuppressionLog).
+     * - Optional digest mode (cfg.digest_seconds > 0): one combined email per window.
+     * - Bounded memory: each route's queue holds at most cfg.queue_max_bytes of payload;
+     *   what gets dropped or merged (cfg.queue_policy) is reported in the next email.
+     * - Rendered emails go through a durable outbox (see spool.py): written to disk before
+     *   the first send, retried with backoff, handed to `errmail drain` at exit.
+     * - Routes (`route` lines in the rules file) send matching events to their own
+     *   recipients through their own queue and worker thread; events no route matches go
+     *   to cfg.mail_to. At most cfg.smtp_concurrency sends are in flight per mail server.
+     *
+     * One Notifier can serve many children (`errmail supervise`): enqueue() accepts the
+     * service/command/cwd of the child, defaulting to the ones given here.
      *
      * @param {ErrmailConfig} cfg
      * @param {Array<string>} command
      * @param {string} cwd
      * @param {boolean} verbose
+     * @param {Array<Route>} routes from RuleSet.routes
      */"""
 
-    def __init__(self, cfg: ErrmailConfig, command: list[str], cwd: str, verbose: bool = False) -> None:
+    def __init__(
+        self,
+        cfg: ErrmailConfig,
+        command: list[str],
+        cwd: str,
+        verbose: bool = False,
+        routes: Sequence[Route] = (),
+    ) -> None:
         self._cfg = cfg
         self._command = command
         self._cwd = cwd
         self._verbose = verbose
 
-        self._q: "queue.Queue[tuple[ErrorEvent, int | None, int | None, str]]" = queue.Queue()
-        self._lock = threading.Lock()
-        self._last_sent: dict[str, float] = {}
+        # Bounded (TTL-evicted) or on-disk, see ERRMAIL_COOLDOWN_STORE.
+        self._cooldown = open_cooldown_store(cfg)
+        # Digest mode already sends at most one email per window.
+        self._bucket = _TokenBucket(0 if cfg.digest_seconds > 0 else cfg.rate_limit_per_hour, cfg.rate_limit_burst)
+        self._flushing = False
+
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._default = self._new_route("default", cfg, "")
+        self._routes = [self._default]
+        by_recipients = {cfg.mail_to or "": self._default}
+        self._routed: list[tuple[Route, _Route]] = []
+        for rule in routes:
+            route = by_recipients.get(rule.mail_to)
+            if route is None:
+                route = self._new_route(rule.mail_to, replace(cfg, mail_to=rule.mail_to), f"r{len(self._routes)}")
+                self._routes.append(route)
+                by_recipients[rule.mail_to] = route
+            self._routed.append((rule, route))
+        self._route_cache: dict[tuple[str, str, str], _Route] = {}
+
+        rs = self._routes
+        METRICS.register_gauge("errmail_queue_depth", "notifications waiting to be sent", lambda: sum(len(r.q) for r in rs))
+        METRICS.register_gauge("errmail_queue_bytes", "estimated payload bytes queued", lambda: sum(r.q.nbytes for r in rs))
+        METRICS.register_gauge(
+            "errmail_queue_dropped_total",
+            "notifications dropped (queue over budget)",
+            lambda: sum(r.q.dropped for r in rs),
+            "counter",
+        )
+        METRICS.register_gauge(
+            "errmail_queue_merged_total",
+            "notifications merged (queue over budget)",
+            lambda: sum(r.q.merged for r in rs),
+            "counter",
+        )
+        METRICS.register_gauge(
+            "errmail_outbox_pending", "rendered emails not delivered yet", lambda: sum(r.outbox.pending() for r in rs)
+        )
+        METRICS.register_gauge(
+            "errmail_mail_expired_total",
+            "emails given up after retrying for 24 hours",
+            lambda: sum(r.outbox.expired for r in rs),
+            "counter",
+        )
+
+        for route in self._routes:
+            route.thread = threading.Thread(
+                target=self._worker, args=(route,), name=f"errmail-notifier-{route.name}", daemon=True
+            )
+            route.thread.start()
+
+    def _new_route(self, name: str, cfg: ErrmailConfig, tag: str) -> _Route:
+        """/**
+         * @param {string} name
+         * @param {ErrmailConfig} cfg
+         * @param {string} tag
+         * @returns {_Route}
+         */"""
+
+        target = _transport_target(cfg)
+        slots = self._slots.get(target)
+        if slots is None:
+            slots = self._slots[target] = threading.BoundedSemaphore(max(1, cfg.smtp_concurrency))
+        return _Route(name, cfg, tag, slots, self._verbose)
 
-        self._thread = threading.Thread(target=self._worker, name="errmail-notifier", daemon=True)
-        self._thread.start()
+    def _route_for(self, service: str, event: ErrorEvent) -> _Route:
+        """/**
+         * @description First matching route, cached per (service, kind, severity).
+         * @param {string} service
+         * @param {ErrorEvent} event
+         * @returns {_Route}
+         */"""
+
+        if not self._routed:
+            return self._default
+        key = (service, event.kind, event.severity)
+        route = self._route_cache.get(key)
+        if route is None:
+            route = next((r for rule, r in self._routed if rule.matches(*key)), self._default)
+            if len(self._route_cache) < _ROUTE_CACHE_MAX:
+                self._route_cache[key] = route
+        return route
 
-    def enqueue(self, event: ErrorEvent, *, pid: int | None, exit_code: int | None, tail: str) -> None:
+    def enqueue(
+        self,
+        event: ErrorEvent,
+        *,
+        pid: int | None,
+        exit_code: int | None,
+        tail: TailArg,
+        service: str | None = None,
+        command: list[str] | None = None,
+        cwd: str | None = None,
+    ) -> None:
         """/**
          * @param {ErrorEvent} event
          * @param {?number} pid
          * @param {?number} exit_code
-         * @param {string} tail
+         * @param {string|TailSnapshot|Function} tail a callable is only invoked if the
+         *   event passes cooldown, so suppressed events never snapshot the tail
+         * @param {?string} service defaults to cfg.service
+         * @param {?Array<string>} command defaults to the Notifier's command
+         * @param {?string} cwd defaults to the Notifier's cwd
          */"""
 
-        if not self._should_send(event.fp):
+        svc = service or self._cfg.service
+        key = f"{svc}:{event.fp}"
+        METRICS.events_detected += 1
+        route = self._route_for(svc, event)
+        now = time.time()
+        limited = route.suppressed.is_limited(key) and self._bucket.wait_seconds() > 0
+        if not limited:
+            if not self._should_send(key, now):
+                METRICS.events_suppressed += 1
+                route.suppressed.note(key, svc, event, limited=False)
+                return
+            if not self._bucket.take():
+                # Not emailed: the first occurrence after the limit gets a full email.
+                self._cooldown.forget(key, now)
+                limited = True
+        if limited:
+            # (Repeats of a rate-limited fingerprint skip the cooldown store until a token is due.)
+            METRICS.events_rate_limited += 1
+            if route.suppressed.note(key, svc, event, limited=True):
+                # Wake the worker: it reports once the bucket refills, even if nothing else comes.
+                route.q.put_nowait(None)
             return
         try:
-            self._q.put_nowait((event, pid, exit_code, tail))
+            queued = route.q.put_nowait(
+                _Pending(
+                    event=event,
+                    pid=pid,
+                    exit_code=exit_code,
+                    tail=tail() if callable(tail) else tail,
+                    service=svc,
+                    command=command if command is not None else self._command,
+                    cwd=cwd or self._cwd,
+                    queued_at=time.monotonic(),
+                )
+            )
         except Exception:  # noqa: BLE001
             # Best-effort; never break the main flow.
-            return
+            queued = False
+        if not queued:
+            # Dropped or merged: the next occurrence may get its own email.
+            self._cooldown.forget(key, now)
 
-    def _should_send(self, fp: str) -> bool:
+    def stats(self) -> dict[str, int]:
         """/**
-         * @param {string} fp
+         * @description Queue counters over all routes: current depth/bytes and totals
+         * dropped/merged.
+         * @returns {Object<string, number>}
+         */"""
+
+        qs = [r.q for r in self._routes]
+        return {
+            "queued": sum(len(q) for q in qs),
+            "queued_bytes": sum(q.nbytes for q in qs),
+            "dropped": sum(q.dropped for q in qs),
+            "merged": sum(q.merged for q in qs),
+        }
+
+    def _should_send(self, key: str, now: float) -> bool:
+        """/**
+         * @param {string} key "service:fingerprint"
+         * @param {number} now unix timestamp, recorded as the send time
          * @returns {boolean}
          */"""
 
-        now = time.time()
-        with self._lock:
-            last = self._last_sent.get(fp, 0.0)
-            if now - last < self._cfg.cooldown_seconds:
-                return False
-            self._last_sent[fp] = now
-            return True
+        return self._cooldown.should_send(key, now, self._cfg.cooldown_seconds)
 
-    def _worker(self) -> None:
+    def _worker(self, route: _Route) -> None:
         """/**
+         * @param {_Route} route
          * @returns {void}
          */"""
 
+        outbox = route.outbox
+        send = partial(self._send_entry, route)
         while True:
+            if outbox.durable and route.adopt_at is not None and time.monotonic() >= route.adopt_at:
+                route.adopt_at = time.monotonic() + _ADOPT_INTERVAL
+                outbox.adopt_orphans()
             try:
-                event, pid, exit_code, tail = self._q.get()
+                batch = self._next_batch(route)
+            except queue.Empty:
+                batch = []
             except Exception:  # noqa: BLE001
                 continue
 
-            subject = build_subject(self._cfg.service, event.kind, event.fp)
-            body = format_body(
-                service=self._cfg.service,
-                command=self._command,
-                cwd=self._cwd,
-                pid=pid,
-                exit_code=exit_code,
-                kind=event.kind,
-                fp=event.fp,
-                message=event.message,
-                excerpt=event.excerpt,
-                tail=tail,
-                ts=event.ts,
-            )
-            err = send_mail(self._cfg, MailPayload(subject=subject, body=body))
-            if err and self._verbose:
+            self._spool_batch(route, batch)
+            if outbox.durable:
+                # On disk: flush() need not wait for SMTP.
+                self._done(route, batch)
+            try:
+                outbox.send_due(send)
+            except Exception:  # noqa: BLE001
+                pass
+            if not outbox.durable:
+                self._done(route, batch)
+            if route.closing.is_set() and not len(route.q):
+                # Only this thread uses the connection: QUIT it here, not from close().
                 try:
-                    print(f"[errmail] send failed: {err}", file=os.sys.stderr)
+                    route.session.close()
                 except Exception:  # noqa: BLE001
                     pass
+                return
+
+    def _spool_batch(self, route: _Route, batch: "list[_Pending | None]") -> None:
+        """/**
+         * @description Render a batch into the outbox and commit it (one fsync).
+         * @param {_Route} route
+         * @param {Array<?_Pending>} batch
+         */"""
+
+        items = [it for it in batch if it is not None]
+        try:
+            if self._cfg.digest_seconds > 0 and len(items) > 1:
+                self._send_digest(route, items)
+            elif items:
+                for item in items:
+                    self._send_one(route, item)
+            elif route.suppressed.has_limited and (self._flushing or self._bucket.take()):
+                # Nothing else to carry the rate-limit report: send it on its own
+                # (at exit regardless of the limit, so the counts are never lost).
+                self._send_limited_report(route)
+            # One fsync for the whole batch, before any of it is sent.
+            route.outbox.commit()
+        except Exception:  # noqa: BLE001
+            pass
+
+    def _done(self, route: _Route, batch: "list[_Pending | None]") -> None:
+        """/**
+         * @param {_Route} route
+         * @param {Array<?_Pending>} batch
+         */"""
+
+        for _ in batch:
             try:
-                self._q.task_done()
+                route.q.task_done()
             except Exception:  # noqa: BLE001
                 pass
 
+    def _next_batch(self, route: _Route) -> "list[_Pending | None]":
+        """/**
+         * @description Block for the next notification. In digest mode keep collecting for
+         * the digest window (or until digest_max_events); a flush() sentinel (None) cuts the
+         * window short so nothing is held back at exit. Otherwise take whatever else is
+         * already queued too (up to _MAX_BATCH), so a burst costs one spool fsync.
+         *
+         * @param {_Route} route
+         * @returns {Array<?_Pending>}
+         * @throws {queue.Empty} when a rate-limit report is waiting and a token is due, an
+         *   outbox retry is due, or it is time to look for orphaned spool segments
+         */"""
+
+        q = route.q
+        waits = [route.outbox.next_due()]
+        if route.outbox.durable and route.adopt_at is not None:
+            waits.append(route.adopt_at - time.monotonic())
+        if route.suppressed.has_limited:
+            waits.append(self._bucket.wait_seconds())
+        waits = [w for w in waits if w is not None]
+        first = q.get(timeout=max(0.05, min(waits)) if waits else None)
+        batch = [first]
+        window = self._cfg.digest_seconds
+        if first is None:
+            return batch
+        if window <= 0:
+            while len(batch) < _MAX_BATCH:
+                try:
+                    item = q.get(timeout=0)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                if item is None:
+                    break
+            return batch
+        deadline = time.monotonic() + window
+        limit = max(1, self._cfg.digest_max_events)
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    def _send_one(self, route: _Route, item: _Pending) -> None:
+        """/**
+         * @param {_Route} route
+         * @param {_Pending} item
+         */"""
+
+        event = item.event
+        subject = build_subject(item.service, event.kind, event.fp)
+        suppressed = route.suppressed.take(f"{item.service}:{event.fp}")
+        body, clipped = render_body(
+            service=item.service,
+            command=item.command,
+            cwd=item.cwd,
+            pid=item.pid,
+            exit_code=item.exit_code,
+            kind=event.kind,
+            fp=event.fp,
+            message=event.message,
+            excerpt=self._take_reports(route) + event.excerpt,
+            tail=item.tail,
+            ts=event.ts,
+            severity=event.severity,
+            fields=event.fields,
+            suppressed=suppressed,
+            **self._budget(),
+        )
+        self._deliver(route, subject, body, item.queued_at, self._attachments(item.tail, clipped))
+
+    def _send_digest(self, route: _Route, items: list[_Pending]) -> None:
+        """/**
+         * @description One combined email for a digest window: events grouped by
+         * (service, fingerprint) with counts, in first-seen order.
+         *
+         * @param {_Route} route
+         * @param {Array<_Pending>} items
+         */"""
+
+        groups: dict[str, list[_Pending]] = {}
+        for it in items:
+            groups.setdefault(f"{it.service}:{it.event.fp}", []).append(it)
+
+        services = sorted({it.service for it in items})
+        service = services[0] if len(services) == 1 else "multiple-services"
+        summary: list[str] = []
+        for n, (key, group) in enumerate(groups.items(), start=1):
+            first = group[0]
+            when = time.strftime("%H:%M:%S", time.localtime(first.event.ts))
+            more = ""
+            suppressed = route.suppressed.take(key)
+            if suppressed is not None:
+                since = time.strftime("%H:%M", time.localtime(suppressed[1]))
+                more = f"  (+{suppressed[0]} more occurrences since {since})"
+            summary.append(f"#{n} x{len(group)}  [{first.service}] {first.event.kind}  first seen {when}{more}")
+            summary.append(f"    {first.event.message}")
+            if first.event.excerpt.strip() != first.event.message:
+                summary.extend("    " + ln for ln in first.event.excerpt.rstrip("\n").splitlines()[-10:])
+            summary.append("")
+
+        last = items[-1]
+        message = f"{len(items)} events, {len(groups)} distinct errors"
+        subject = build_subject(service, "digest", "")
+        body, clipped = render_body(
+            service=service,
+            command=last.command,
+            cwd=last.cwd,
+            pid=last.pid,
+            exit_code=last.exit_code,
+            kind="digest",
+            fp="",
+            message=message,
+            excerpt=self._take_reports(route) + "\n".join(summary),
+            tail=last.tail,
+            ts=items[0].event.ts,
+            **self._budget(),
+        )
+        self._deliver(route, subject, body, items[0].queued_at, self._attachments(last.tail, clipped))
+
+    def _send_limited_report(self, route: _Route) -> None:
+        """/**
+         * @description An email carrying only the rate-limit report (and queue overload report).
+         * @param {_Route} route
+         */"""
+
+        report = self._take_reports(route)
+        if not report:
+            return
+        subject = build_subject(self._cfg.service, "rate-limited", "")
+        body, _ = render_body(
+            service=self._cfg.service,
+            command=self._command,
+            cwd=self._cwd,
+            pid=None,
+            exit_code=None,
+            kind="rate-limited",
+            fp="",
+            message="errors held back by the email rate limit",
+            excerpt=report,
+            tail="",
+            max_bytes=self._cfg.body_max_bytes,
+        )
+        self._deliver(route, subject, body)
+
+    def _budget(self) -> dict:
+        """/**
+         * @returns {Object} render_body() arguments for ERRMAIL_BODY_MAX_BYTES / ERRMAIL_ATTACH_TAIL
+         */"""
+
+        cfg = self._cfg
+        return {"max_bytes": cfg.body_max_bytes, "attachment": TAIL_ATTACHMENT if cfg.attach_tail else ""}
+
+    def _attachments(self, tail: "str | TailSnapshot", clipped: bool) -> "tuple[tuple[str, bytes], ...]":
+        """/**
+         * @param {string|TailSnapshot} tail
+         * @param {boolean} clipped the body did not fit the budget
+         * @returns {Array<[string, Uint8Array]>} the full tail, gzip-compressed, if it was clipped
+         */"""
+
+        if not clipped or not self._cfg.attach_tail or not tail:
+            return ()
+        return (tail_attachment(tail),)
+
+    def _take_reports(self, route: _Route) -> str:
+        """/**
+         * @param {_Route} route
+         * @returns {string} queue overload and rate-limit reports since the last email
+         */"""
+
+        return route.q.take_overload_report() + route.suppressed.take_limited_report(self._bucket)
+
+    def _deliver(
+        self,
+        route: _Route,
+        subject: str,
+        body: str,
+        queued_at: float = 0.0,
+        attachments: "tuple[tuple[str, bytes], ...]" = (),
+    ) -> None:
+        """/**
+         * @description Hand a rendered email to the outbox (sent after the batch is spooled).
+         * @param {_Route} route
+         * @param {string} subject
+         * @param {string} body
+         * @param {number} queued_at time.monotonic() of the (first) notification, 0 if none
+         * @param {Array<[string, Uint8Array]>} attachments
+         */"""
+
+        mail_to = route.cfg.mail_to
+        if not can_send(route.cfg):
+            # Nothing would ever deliver it: do not spool it.
+            self._send_entry(route, SpoolEntry(subject=subject, body=body, mail_to=mail_to, ts=time.time()))
+            return
+        route.outbox.put(subject, body, mail_to, queued_at, attachments)
+
+    def _send_entry(self, route: _Route, entry: SpoolEntry) -> Optional[str]:
+        """/**
+         * @param {_Route} route
+         * @param {SpoolEntry} entry
+         * @returns {?string} error string (if failed)
+         */"""
+
+        cfg = route.cfg
+        if entry.mail_to and entry.mail_to != cfg.mail_to:
+            # Adopted from a process with another recipient (--to).
+            cfg = replace(cfg, mail_to=entry.mail_to)
+        with route.slots:
+            t0 = time.perf_counter()
+            payload = MailPayload(subject=entry.subject, body=entry.body, attachments=entry.attachments)
+            err = send_mail(cfg, payload, session=route.session)
+            METRICS.send_seconds.observe(time.perf_counter() - t0)
+        if err:
+            METRICS.send_failures += 1
+            if route.session.refused:
+                # The other recipients have it already.
+                route.outbox.retry_only(entry, route.session.refused)
+        elif entry.queued_at:
+            route.latency.observe(time.monotonic() - entry.queued_at)
+        if err and self._verbose:
+            where = "" if route is self._default else f" (route {route.name})"
+            try:
+                print(f"[errmail] send failed{where} (attempt {entry.attempts + 1}): {err}", file=os.sys.stderr)
+            except Exception:  # noqa: BLE001
+                pass
+        return err
+
     def flush(self, timeout_seconds: float = 2.0) -> None:
         """/**
-         * @description Best-effort wait for queued notifications to be processed.
+         * @description Best-effort wait for queued notifications to be processed: written
+         * to the spool (or, without ERRMAIL_SPOOL, sent).
          * @param {number} timeout_seconds
          * @returns {void}
          */"""
 
+        self._flushing = True
+        for route in self._routes:
+            if self._cfg.digest_seconds > 0 or route.suppressed.has_limited:
+                # Close the current digest window now instead of waiting it out, and/or send
+                # the pending rate-limit report.
+                try:
+                    route.q.put_nowait(None)
+                except Exception:  # noqa: BLE001
+                    pass
         end = time.time() + max(0.0, timeout_seconds)
         # queue.join() has no timeout, so we poll unfinished_tasks.
         while time.time() < end:
             try:
-                if getattr(self._q, "unfinished_tasks", 0) == 0:
+                if all(getattr(r.q, "unfinished_tasks", 0) == 0 for r in self._routes):
                     return
             except Exception:  # noqa: BLE001
                 return
             time.sleep(0.05)
 
+    def close(self) -> None:
+        """/**
+         * @description Stop the workers without waiting for SMTP: every queued
+         * notification is written to the spool (on this thread if its worker is busy
+         * sending), then every email not yet acked, the ones being sent included, is
+         * handed to a detached `errmail drain`. Each worker QUITs its own connection when
+         * its send returns, if the process is still alive by then. Without ERRMAIL_SPOOL
+         * there is nothing to hand off: what flush() did not send is dropped.
+         * @returns {void}
+         */"""
+
+        for route in self._routes:
+            route.closing.set()
+            # The send in progress may finish; nothing else starts.
+            route.outbox.stop()
+        deadline = time.monotonic() + _CLOSE_WAIT_SECONDS
+        for route in self._routes:
+            if route.outbox.durable:
+                self._spool_rest(route, deadline)
+            try:
+                # Wake the worker if it is waiting for work, so it can shut down.
+                route.q.put_nowait(None)
+            except Exception:  # noqa: BLE001
+                pass
+        try:
+            self._cooldown.close()
+        except Exception:  # noqa: BLE001
+            pass
+        try:
+            close_outboxes([r.outbox for r in self._routes])
+        except Exception:  # noqa: BLE001
+            pass
+
+    def _spool_rest(self, route: _Route, deadline: float) -> None:
+        """/**
+         * @description close(): spool what is still queued, then wait (until `deadline`)
+         * for a batch the worker took but has not committed yet.
+         * @param {_Route} route
+         * @param {number} deadline time.monotonic()
+         */"""
+
+        batch: "list[_Pending | None]" = []
+        while True:
+            try:
+                batch.append(route.q.get(timeout=0))
+            except queue.Empty:
+                break
+        if batch:
+            self._spool_batch(route, batch)
+            self._done(route, batch)
+        while getattr(route.q, "unfinished_tasks", 0) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
 
 def with_overrides(
     cfg: ErrmailConfig,
@@ -136,12 +1042,15 @@ def with_overrides(
     cooldown_seconds: Optional[int] = None,
     tail_lines: Optional[int] = None,
     mail_to: Optional[str] = None,
+    pty: Optional[bool] = None,
 ) -> ErrmailConfig:
     """/**
      * @param {ErrmailConfig} cfg
      * @param {?string} service
      * @param {?number} cooldown_seconds
      * @param {?number} tail_lines
+     * @param {?string} mail_to
+     * @param {?boolean} pty
      * @returns {ErrmailConfig}
      */"""
 
@@ -151,5 +1060,6 @@ def with_overrides(
         cooldown_seconds=cooldown_seconds if cooldown_seconds is not None else cfg.cooldown_seconds,
         tail_lines=tail_lines if tail_lines is not None else cfg.tail_lines,
         mail_to=mail_to or cfg.mail_to,
+        pty=pty if pty is not None else cfg.pty,
     )
 
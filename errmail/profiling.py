@@ -0,0 +1,249 @@
+"""/**
+ * @file profiling.py
+ * @description Opt-in self-profiling (ERRMAIL_PROFILE=<dir>).
+ *
+ * - A sampling profiler thread records the Python stack of every other thread
+ *   (pumps / event loop, notifier worker) every few milliseconds. Sampling works the
+ *   same on every Python version; cProfile cannot run one profiler per thread on 3.12+.
+ * - tracemalloc records allocations; a snapshot is kept at the traced-memory peak and
+ *   one is taken at exit, so ring buffer and queue growth can be attributed.
+ *
+ * At exit everything is written to <dir>/errmail-<pid>-<time>/:
+ *   threads.txt            per-thread top functions (self and inclusive samples)
+ *   <thread>.folded        collapsed stacks (flamegraph.pl / speedscope)
+ *   memory.txt             top allocation sites at peak and at exit, errmail modules first
+ *   memory-peak.snapshot   tracemalloc snapshot (tracemalloc.Snapshot.load)
+ *
+ * tracemalloc (and the pickle machinery it pulls in) is imported only when profiling is
+ * on; this module is imported on every `errmail run`.
+ */"""
+
+from __future__ import annotations
+
+from collections import Counter
+import os
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+from .config import ErrmailConfig
+
+if TYPE_CHECKING:
+    import tracemalloc
+
+_SAMPLE_INTERVAL = 0.005
+_MAX_DEPTH = 64
+_TRACE_FRAMES = 16
+# Re-check for a new traced-memory peak about once a second.
+_PEAK_CHECK_EVERY = 200
+_TOP = 25
+
+_Frame = tuple[str, int, str]
+
+
+class Profiler:
+    """/**
+     * @class Profiler
+     * @description One profiling session; start() it before running children, stop() dumps.
+     * @param {string} out_dir parent directory for the session directory
+     */"""
+
+    def __init__(self, out_dir: str) -> None:
+        self._out_dir = out_dir
+        self._stop = threading.Event()
+        self._stacks: dict[str, Counter[tuple[_Frame, ...]]] = {}
+        self._samples = 0
+        self._peak_bytes = 0
+        self._peak_snapshot: tracemalloc.Snapshot | None = None
+        self._started = 0.0
+        self._thread = threading.Thread(target=self._run, name="errmail-profiler", daemon=True)
+
+    def start(self) -> None:
+        """/**
+         * @returns {void}
+         */"""
+
+        import tracemalloc
+
+        self._started = time.time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(_TRACE_FRAMES)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """/**
+         * @description Sampler loop.
+         * @returns {void}
+         */"""
+
+        me = threading.get_ident()
+        names: dict[int, str] = {}
+        while not self._stop.wait(_SAMPLE_INTERVAL):
+            frames = sys._current_frames()  # noqa: SLF001
+            if any(ident not in names for ident in frames):
+                names = {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack: list[_Frame] = []
+                f = frame
+                while f is not None and len(stack) < _MAX_DEPTH:
+                    code = f.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    f = f.f_back
+                stack.reverse()
+                name = names.get(ident, f"thread-{ident}")
+                self._stacks.setdefault(name, Counter())[tuple(stack)] += 1
+            self._samples += 1
+            if self._samples % _PEAK_CHECK_EVERY == 0:
+                self._check_peak()
+
+    def _check_peak(self) -> None:
+        """/**
+         * @returns {void}
+         */"""
+
+        import tracemalloc
+
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self._peak_bytes * 1.1:
+            self._peak_bytes = current
+            self._peak_snapshot = tracemalloc.take_snapshot()
+
+    def stop(self) -> Optional[Path]:
+        """/**
+         * @description Stop sampling and tracing, write the report directory.
+         * @returns {?Path} the session directory (null if it could not be written)
+         */"""
+
+        import tracemalloc
+
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        final = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        tracemalloc.stop()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))
+        out = Path(self._out_dir).expanduser() / f"errmail-{os.getpid()}-{stamp}"
+        try:
+            out.mkdir(parents=True, exist_ok=True)
+            self._write_threads(out)
+            self._write_memory(out, final)
+        except OSError:
+            return None
+        return out
+
+    def _write_threads(self, out: Path) -> None:
+        """/**
+         * @param {Path} out
+         */"""
+
+        elapsed = time.time() - self._started
+        lines = [f"samples: {self._samples} every {_SAMPLE_INTERVAL * 1000:.0f}ms over {elapsed:.1f}s", ""]
+        for name, stacks in sorted(self._stacks.items()):
+            total = sum(stacks.values())
+            own: Counter[_Frame] = Counter()
+            incl: Counter[_Frame] = Counter()
+            for stack, n in stacks.items():
+                if stack:
+                    own[stack[-1]] += n
+                for fr in set(stack):
+                    incl[fr] += n
+            lines.append(f"== {name}: {total} samples")
+            lines.append(f"  {'self':>6} {'incl':>6}  function")
+            for fr, n in own.most_common(_TOP):
+                lines.append(f"  {n / total:6.1%} {incl[fr] / total:6.1%}  {_fmt_frame(fr)}")
+            lines.append("")
+            folded = (
+                ";".join(_fmt_frame(fr) for fr in stack) + f" {n}\n" for stack, n in stacks.most_common()
+            )
+            (out / f"{_safe_name(name)}.folded").write_text("".join(folded), encoding="utf-8")
+        (out / "threads.txt").write_text("\n".join(lines), encoding="utf-8")
+
+    def _write_memory(self, out: Path, final: tracemalloc.Snapshot | None) -> None:
+        """/**
+         * @param {Path} out
+         * @param {?tracemalloc.Snapshot} final
+         */"""
+
+        import tracemalloc
+
+        own = tracemalloc.Filter(True, os.path.join(os.path.dirname(os.path.abspath(__file__)), "*"))
+        lines: list[str] = []
+        for label, snap in (("peak", self._peak_snapshot), ("exit", final)):
+            if snap is None:
+                continue
+            # Leave out tracemalloc's and the sampler's own allocations.
+            snap = snap.filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+            )
+            total = sum(s.size for s in snap.statistics("filename"))
+            lines.append(f"== {label}: {total / 1024:.1f} KB traced")
+            lines.append("-- errmail (ring buffer, queue, detector, mailer)")
+            lines.extend(_fmt_stats(snap.filter_traces((own,)).statistics("lineno")))
+            lines.append("-- all")
+            lines.extend(_fmt_stats(snap.statistics("lineno")))
+            lines.append("")
+        (out / "memory.txt").write_text("\n".join(lines), encoding="utf-8")
+        if self._peak_snapshot is not None:
+            self._peak_snapshot.dump(str(out / "memory-peak.snapshot"))
+
+
+def _fmt_frame(fr: _Frame) -> str:
+    """/**
+     * @param {Array} fr (filename, first line, function)
+     * @returns {string}
+     */"""
+
+    filename, line, func = fr
+    return f"{func} ({os.path.basename(filename)}:{line})"
+
+
+def _fmt_stats(stats: list[tracemalloc.Statistic]) -> list[str]:
+    """/**
+     * @param {Array<tracemalloc.Statistic>} stats
+     * @returns {Array<string>}
+     */"""
+
+    out = []
+    for st in stats[:_TOP]:
+        fr = st.traceback[0]
+        out.append(f"  {st.size / 1024:10.1f} KB {st.count:8d} blocks  {os.path.basename(fr.filename)}:{fr.lineno}")
+    return out
+
+
+def _safe_name(name: str) -> str:
+    """/**
+     * @param {string} name
+     * @returns {string}
+     */"""
+
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def start_profiler(cfg: ErrmailConfig) -> Optional[Profiler]:
+    """/**
+     * @param {ErrmailConfig} cfg
+     * @returns {?Profiler} null unless ERRMAIL_PROFILE is set
+     */"""
+
+    if not cfg.profile_dir:
+        return None
+    profiler = Profiler(cfg.profile_dir)
+    profiler.start()
+    return profiler
+
+
+def stop_profiler(profiler: Optional[Profiler], verbose: bool = False) -> None:
+    """/**
+     * @param {?Profiler} profiler
+     * @param {boolean} verbose
+     */"""
+
+    if profiler is None:
+        return
+    out = profiler.stop()
+    if verbose and out is not None:
+        print(f"[errmail] profile written to {out}", file=sys.stderr)
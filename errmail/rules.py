@@ -0,0 +1,383 @@
+"""/**
+ * @file rules.py
+ * @description User-defined detection rules (match / ignore / severity / kind) and
+ * delivery routes.
+ *
+ * Rules file format, one rule per line (# comments and blank lines are ignored):
+ *
+ *   match  kind=oom severity=critical  OOMKilled
+ *   match  kind=app-error              /ERR-[0-9]{4}/
+ *   ignore                             /DeprecationWarning: .* is deprecated/
+ *   route  service=payments-* severity=critical  to=pay-oncall@example.com,lead@example.com
+ *   route  kind=oom                               to=infra@example.com
+ *
+ * The pattern is the rest of the line: a literal substring, or a regex between slashes.
+ * A route sends events whose service and kind match its globs and whose severity is at
+ * least its severity to its own recipients instead of ERRMAIL_MAIL_TO (first matching
+ * route wins; see Notifier for the per-route queues).
+ * Every rule is indexed by a literal keyword (the literal itself, or the longest literal
+ * run every regex match must contain). All keywords are compiled into one trie regex:
+ * the detector prefilter uses it to skip lines without any keyword, and the matcher uses
+ * it to pick the few rules worth trying, so 200 rules cost about what 10 do. Regexes
+ * without a usable literal (e.g. /[0-9]+ (timeout|refused)/) are tried on every line; prefer
+ * patterns with a literal part.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+import os
+from pathlib import Path
+import re
+import sys
+from typing import Optional
+
+# CPython's private regex parser, only used to find rule keywords (see _required_literal).
+try:  # Python 3.11+
+    from re import _parser as _sre_parse  # type: ignore[attr-defined]
+except ImportError:  # pragma: no cover
+    try:
+        import sre_parse as _sre_parse  # type: ignore[no-redef]
+    except ImportError:
+        _sre_parse = None  # type: ignore[assignment]
+
+from .config import ErrmailConfig
+
+_RE_RULE_LINE = re.compile(r"^(match|ignore)((?:\s+(?:kind|severity)=\S+)*)\s+(\S.*?)\s*$")
+_RE_ROUTE_LINE = re.compile(r"^route((?:\s+(?:service|kind|severity|to)=\S+)+)\s*$")
+_SEVERITIES = ("info", "warning", "error", "critical")
+_SEVERITY_RANK = {s: i for i, s in enumerate(_SEVERITIES)}
+# Keywords shorter than this are too unselective to be worth prefiltering on.
+_MIN_KEYWORD = 3
+
+# Rules files picked up automatically (system-wide first), like the env config presets.
+DEFAULT_RULES_PATHS = ("/etc/errmail.rules", str(Path.home() / ".errmail.rules"))
+
+
+@dataclass(frozen=True)
+class Rule:
+    """/**
+     * @class Rule
+     * @property {string} action "match" or "ignore"
+     * @property {string} pattern regex source (literals are escaped)
+     * @property {string} kind event kind for match rules
+     * @property {string} severity "info" | "warning" | "error" | "critical"
+     * @property {?string} keyword literal every matching line contains (null if unknown)
+     * @property {string} origin "path:lineno" for error messages
+     */"""
+
+    action: str
+    pattern: str
+    kind: str = "rule"
+    severity: str = "error"
+    keyword: Optional[str] = None
+    origin: str = ""
+
+
+@dataclass(frozen=True)
+class Route:
+    """/**
+     * @class Route
+     * @property {string} mail_to comma-separated recipients
+     * @property {string} service glob on the service name
+     * @property {string} kind glob on the event kind
+     * @property {string} severity minimum severity
+     * @property {string} origin "path:lineno" for error messages
+     */"""
+
+    mail_to: str
+    service: str = "*"
+    kind: str = "*"
+    severity: str = "info"
+    origin: str = ""
+
+    def matches(self, service: str, kind: str, severity: str) -> bool:
+        """/**
+         * @param {string} service
+         * @param {string} kind
+         * @param {string} severity
+         * @returns {boolean}
+         */"""
+
+        return (
+            _SEVERITY_RANK.get(severity, _SEVERITY_RANK["error"]) >= _SEVERITY_RANK[self.severity]
+            and fnmatchcase(service, self.service)
+            and fnmatchcase(kind, self.kind)
+        )
+
+
+def _required_literal(pattern: str) -> Optional[str]:
+    """/**
+     * @description Longest run of literal characters that every match must contain
+     * (top-level sequence only; alternations and case-insensitive patterns give up).
+     * This reads CPython's private parser, which may change between releases: on any
+     * failure the rule simply has no keyword and its regex is tried on every line.
+     *
+     * @param {string} pattern
+     * @returns {?string}
+     */"""
+
+    if _sre_parse is None:
+        return None
+    try:
+        parsed = _sre_parse.parse(pattern)
+        if parsed.state.flags & re.IGNORECASE:
+            return None
+        best = ""
+        run: list[str] = []
+        for op, arg in list(parsed) + [(None, None)]:
+            if op is _sre_parse.LITERAL:
+                run.append(chr(arg))
+                continue
+            if len(run) > len(best):
+                best = "".join(run)
+            run = []
+    except Exception:  # noqa: BLE001
+        return None
+    return best if len(best) >= _MIN_KEYWORD else None
+
+
+def _parse_route(line: str, where: str) -> Route:
+    """/**
+     * @param {string} line
+     * @param {string} where "path:lineno"
+     * @returns {Route}
+     * @throws {ValueError}
+     */"""
+
+    m = _RE_ROUTE_LINE.match(line)
+    if m is None:
+        raise ValueError(f"{where}: expected 'route [service=..] [kind=..] [severity=..] to=<addr,...>'")
+    options = dict(o.split("=", 1) for o in m.group(1).split())
+    if not options.get("to"):
+        raise ValueError(f"{where}: route needs to=<addr,...>")
+    severity = options.get("severity", "info").lower()
+    if severity not in _SEVERITIES:
+        raise ValueError(f"{where}: severity must be one of {', '.join(_SEVERITIES)}")
+    return Route(
+        mail_to=", ".join(a for a in options["to"].split(",") if a),
+        service=options.get("service", "*"),
+        kind=options.get("kind", "*"),
+        severity=severity,
+        origin=where,
+    )
+
+
+def parse_rules(text: str, origin: str = "<rules>") -> "list[Rule | Route]":
+    """/**
+     * @param {string} text rules file content
+     * @param {string} origin file name used in error messages
+     * @returns {Array<Rule|Route>}
+     * @throws {ValueError} on a malformed line or an invalid regex
+     */"""
+
+    rules: "list[Rule | Route]" = []
+    for lineno, raw in enumerate(text.splitlines(), start=1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        where = f"{origin}:{lineno}"
+        if line.startswith("route"):
+            rules.append(_parse_route(line, where))
+            continue
+        m = _RE_RULE_LINE.match(line)
+        if m is None:
+            raise ValueError(f"{where}: expected 'match|ignore [kind=..] [severity=..] <pattern>'")
+        action, opts, pat = m.group(1), m.group(2).split(), m.group(3)
+        options = dict(o.split("=", 1) for o in opts)
+        severity = options.get("severity", "error").lower()
+        if severity not in _SEVERITIES:
+            raise ValueError(f"{where}: severity must be one of {', '.join(_SEVERITIES)}")
+        if len(pat) >= 2 and pat.startswith("/") and pat.endswith("/"):
+            pattern = pat[1:-1]
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"{where}: invalid regex: {e}") from None
+            keyword = _required_literal(pattern)
+        else:
+            pattern = re.escape(pat)
+            keyword = pat if len(pat) >= _MIN_KEYWORD else None
+        rules.append(
+            Rule(
+                action=action,
+                pattern=pattern,
+                kind=options.get("kind", "rule"),
+                severity=severity,
+                keyword=keyword,
+                origin=where,
+            )
+        )
+    return rules
+
+
+def keyword_regex(words: "list[str] | tuple[str, ...]") -> str:
+    """/**
+     * @description Regex source matching any of the literal words, factored as a trie so
+     * that CPython's backtracking engine fails on the first character at most positions
+     * (a flat "a|b|c" alternation costs one attempt per word per position). Longer words
+     * win when one word is a prefix of another.
+     *
+     * @param {Array<string>} words
+     * @returns {string}
+     */"""
+
+    root: dict = {}
+    for w in words:
+        node = root
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(root)
+
+
+class _Matcher:
+    """/**
+     * @class _Matcher
+     * @description Rules of one action behind a keyword index: a single trie regex finds
+     * the keywords present in a line, and only the rules owning those keywords (plus the
+     * few without a keyword) are tried. Cost per line therefore depends on the keywords
+     * present, not on the number of rules.
+     *
+     * @param {Array<Rule>} rules in file order
+     */"""
+
+    def __init__(self, rules: list[Rule]) -> None:
+        compiled = [(i, r, re.compile(r.pattern)) for i, r in enumerate(rules)]
+        self._always = [c for c in compiled if c[1].keyword is None]
+        by_kw: dict[str, list] = {}
+        for c in compiled:
+            if c[1].keyword is not None:
+                by_kw.setdefault(c[1].keyword, []).append(c)
+        # The trie reports the longest keyword at a position; rules of keywords that are
+        # a prefix of it occur there too.
+        self._by_kw = {
+            kw: [c for other, cs in by_kw.items() if kw.startswith(other) for c in cs] for kw in by_kw
+        }
+        self._finder = re.compile(f"(?=({keyword_regex(list(by_kw))}))") if by_kw else None
+
+    def first(self, line: str) -> Optional[Rule]:
+        """/**
+         * @description The rule matching earliest in the line (file order on ties).
+         * @param {string} line
+         * @returns {?Rule}
+         */"""
+
+        candidates = list(self._always)
+        if self._finder is not None:
+            seen: set[str] = set()
+            for m in self._finder.finditer(line):
+                kw = m.group(1)
+                if kw not in seen:
+                    seen.add(kw)
+                    candidates.extend(self._by_kw[kw])
+        best: Optional[tuple[int, int, Rule]] = None
+        for i, rule, rx in candidates:
+            m = rx.search(line)
+            if m is not None and (best is None or (m.start(), i) < best[:2]):
+                best = (m.start(), i, rule)
+        return best[2] if best is not None else None
+
+
+class RuleSet:
+    """/**
+     * @class RuleSet
+     * @description Compiled, immutable rule set shared by all detectors of a process.
+     *
+     * - ignore rules: any hit suppresses the line (built-in detections too).
+     * - match rules: if several match, the one matching earliest in the line wins (file
+     *   order on ties).
+     *
+     * Both are keyword-indexed (see _Matcher); `keywords` feeds the detector prefilter so
+     * lines without any keyword never reach the rules at all. Routes are only kept for the
+     * Notifier.
+     *
+     * @param {Array<Rule|Route>} rules
+     */"""
+
+    def __init__(self, rules: "list[Rule | Route]") -> None:
+        self._count = len(rules)
+        self.routes: tuple[Route, ...] = tuple(r for r in rules if isinstance(r, Route))
+        match = [r for r in rules if isinstance(r, Rule) and r.action == "match"]
+        ignore = [r for r in rules if isinstance(r, Rule) and r.action == "ignore"]
+        self._match = _Matcher(match) if match else None
+        self._ignore = _Matcher(ignore) if ignore else None
+        # A match rule without a keyword means every line must be looked at.
+        self.full_scan = any(r.keyword is None for r in match)
+        self.keywords: tuple[str, ...] = tuple(dict.fromkeys(r.keyword for r in match if r.keyword))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def ignored(self, line: str) -> bool:
+        """/**
+         * @param {string} line
+         * @returns {boolean}
+         */"""
+
+        return self._ignore is not None and self._ignore.first(line) is not None
+
+    def match(self, line: str) -> Optional[Rule]:
+        """/**
+         * @param {string} line
+         * @returns {?Rule}
+         */"""
+
+        return self._match.first(line) if self._match is not None else None
+
+
+def load_rules(path: str) -> "list[Rule | Route]":
+    """/**
+     * @param {string} path
+     * @returns {Array<Rule|Route>}
+     * @throws {OSError|ValueError}
+     */"""
+
+    p = Path(path).expanduser()
+    return parse_rules(p.read_text(encoding="utf-8"), origin=str(p))
+
+
+def load_ruleset(cfg: ErrmailConfig) -> Optional[RuleSet]:
+    """/**
+     * @description Load /etc/errmail.rules, ~/.errmail.rules and cfg.rules_file (in that
+     * order, all that exist). cfg.rules_file must exist if set.
+     *
+     * @param {ErrmailConfig} cfg
+     * @returns {?RuleSet} null if there are no rules
+     * @throws {OSError|ValueError}
+     */"""
+
+    rules: "list[Rule | Route]" = []
+    for path in DEFAULT_RULES_PATHS:
+        if os.path.isfile(path):
+            rules.extend(load_rules(path))
+    if cfg.rules_file:
+        rules.extend(load_rules(cfg.rules_file))
+    return RuleSet(rules) if rules else None
+
+
+def load_ruleset_quietly(cfg: ErrmailConfig, verbose: bool = False) -> Optional[RuleSet]:
+    """/**
+     * @description load_ruleset() for library callers: a broken rules file disables the
+     * user rules instead of failing the command (the CLI validates up front).
+     *
+     * @param {ErrmailConfig} cfg
+     * @param {boolean} verbose
+     * @returns {?RuleSet}
+     */"""
+
+    try:
+        return load_ruleset(cfg)
+    except (OSError, ValueError) as e:
+        if verbose:
+            print(f"[errmail] rules disabled: {e}", file=sys.stderr)
+        return None
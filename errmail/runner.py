@@ -1,20 +1,37 @@
 """/**
  * @file runner.py
  * @description Run a subprocess, passthrough stdout/stderr, and detect stderr errors.
+ *
+ * By default the child writes into pipes, so most runtimes switch it to block buffering:
+ * errors reach the detector late and stdout/stderr interleave differently than on a
+ * terminal. With ERRMAIL_PTY=1 (`errmail run --pty`) stdout and stderr are each a
+ * pseudo-terminal, so the child stays line-buffered; the two streams are still separate.
  */"""
 
 from __future__ import annotations
 
+import asyncio
+from collections import deque
+import contextlib
+import errno
+import io
 import os
+import re
+import select
 import subprocess
 import sys
 import threading
 import time
-from typing import Optional
+from typing import Callable, Optional
+import warnings
+import weakref
 
 from .config import ErrmailConfig
-from .detector import ErrorEvent, StderrDetector
+from .detector import ErrorEvent, StderrDetector, detector_for
+from .metrics import METRICS, start_exporter
 from .notifier import Notifier
+from .profiling import start_profiler, stop_profiler
+from .rules import RuleSet, load_ruleset_quietly
 from .utils import fingerprint
 
 
@@ -29,12 +46,55 @@ def _pump_stdout(stream: Optional[object]) -> None:
         for line in iter(stream.readline, ""):
             sys.stdout.write(line)
             sys.stdout.flush()
+            METRICS.stdout_bytes += len(line)
     except Exception:  # noqa: BLE001
         return
 
 
+class _IdleFlusher:
+    """/**
+     * @class _IdleFlusher
+     * @description For pumps whose reads cannot time out: a thread that emits an open
+     * trace once stderr has been quiet for _TRACE_IDLE_SECONDS. Hold `lock` around every
+     * detector call and touch() it when a read returns.
+     *
+     * @param {StderrDetector} detector
+     * @param {Function} on_event
+     */"""
+
+    def __init__(self, detector: StderrDetector, on_event) -> None:
+        self.lock = threading.Lock()
+        self._detector = detector
+        self._on_event = on_event
+        self._done = threading.Event()
+        self._last = time.monotonic()
+        threading.Thread(target=self._run, name="errmail-stderr-idle", daemon=True).start()
+
+    def touch(self) -> None:
+        self._last = time.monotonic()
+
+    def stop(self) -> None:
+        self._done.set()
+
+    def _run(self) -> None:
+        wait = _TRACE_IDLE_SECONDS
+        while not self._done.wait(wait):
+            with self.lock:
+                wait = _TRACE_IDLE_SECONDS
+                if not self._detector.pending:
+                    continue
+                idle = time.monotonic() - self._last
+                if idle < _TRACE_IDLE_SECONDS:
+                    wait = _TRACE_IDLE_SECONDS - idle
+                    continue
+                for evt in self._detector.flush_pending():
+                    self._on_event(evt)
+
+
 def _pump_stderr(stream: Optional[object], detector: StderrDetector, on_event) -> None:
     """/**
+     * @description Text-mode stderr pump (ERRMAIL_PUMP_MODE=text). Like the binary pump,
+     * an open trace is emitted after _TRACE_IDLE_SECONDS of quiet, not only at EOF.
      * @param {?object} stream
      * @param {StderrDetector} detector
      * @param {Function} on_event
@@ -42,15 +102,621 @@ def _pump_stderr(stream: Optional[object], detector: StderrDetector, on_event) -
 
     if stream is None:
         return
+    # readline() has no timeout, and select() would miss lines the text layer has buffered.
+    idle = _IdleFlusher(detector, on_event)
     try:
         for line in iter(stream.readline, ""):
             sys.stderr.write(line)
             sys.stderr.flush()
-            evt = detector.push_line(line)
-            if evt is not None:
+            METRICS.stderr_bytes += len(line)
+            with idle.lock:
+                idle.touch()
+                evt = detector.push_line(line)
+                if evt is not None:
+                    on_event(evt)
+        with idle.lock:
+            for evt in detector.finish():
                 on_event(evt)
     except Exception:  # noqa: BLE001
         return
+    finally:
+        idle.stop()
+
+
+# Large reads amortize syscall + Python overhead for chatty children.
+_CHUNK_SIZE = 64 * 1024
+# Emit an unterminated stack trace (Java, Go, ...) once stderr has been quiet this long.
+_TRACE_IDLE_SECONDS = 0.5
+# select() takes pipes only on POSIX (sockets only on Windows).
+_SELECT_PIPES = os.name != "nt"
+
+
+# Escape sequences (CSI colors/cursor moves, OSC titles) a child writes when it sees a
+# terminal. Passed through as-is, removed from what the detector sees: "\x1b[31mERROR"
+# must still match "ERROR" as a word.
+_RE_ANSI = re.compile(rb"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+
+
+def _strip_ansi(data: bytes) -> bytes:
+    """/**
+     * @param {bytes} data
+     * @returns {bytes} data without terminal escape sequences
+     */"""
+
+    return _RE_ANSI.sub(b"", data) if b"\x1b" in data else data
+
+
+def open_ptys(verbose: bool = False) -> Optional[dict[int, tuple[int, int]]]:
+    """/**
+     * @description One pseudo-terminal per output stream of a child (stdout, stderr), so
+     * the child sees a terminal and line-buffers, while the streams stay distinguishable.
+     * Output post-processing (ONLCR, "\n" -> "\r\n") is turned off, so the master side
+     * reads exactly the bytes the child wrote; the window size is copied from ours.
+     *
+     * @param {boolean} verbose
+     * @returns {?Object<number, [number, number]>} {1: (master, slave), 2: (master, slave)};
+     *   null if pseudo-terminals are unavailable (the caller falls back to pipes)
+     */"""
+
+    try:
+        import fcntl
+        import pty
+        import termios
+    except ImportError:
+        if verbose:
+            print("[errmail] pty mode needs a POSIX system, using pipes", file=sys.stderr)
+        return None
+
+    winsize = None
+    for fd in (2, 1, 0):
+        try:
+            winsize = fcntl.ioctl(fd, termios.TIOCGWINSZ, b"\0" * 8)
+            break
+        except OSError:
+            continue
+
+    ptys: dict[int, tuple[int, int]] = {}
+    try:
+        for fd in (1, 2):
+            master, slave = pty.openpty()
+            ptys[fd] = (master, slave)
+            attrs = termios.tcgetattr(slave)
+            attrs[1] &= ~termios.ONLCR
+            termios.tcsetattr(slave, termios.TCSANOW, attrs)
+            if winsize is not None:
+                fcntl.ioctl(slave, termios.TIOCSWINSZ, winsize)
+    except (OSError, termios.error) as e:
+        close_ptys(ptys, masters=True)
+        if verbose:
+            print(f"[errmail] cannot open a pty ({e}), using pipes", file=sys.stderr)
+        return None
+    return ptys
+
+
+def close_ptys(ptys: Optional[dict[int, tuple[int, int]]], *, masters: bool = False) -> None:
+    """/**
+     * @description Close the slave ends (the child holds its own copies), and the masters
+     * too if nothing is going to read them.
+     * @param {?Object<number, [number, number]>} ptys from open_ptys()
+     * @param {boolean} masters
+     */"""
+
+    for master, slave in (ptys or {}).values():
+        for fd in (slave, master) if masters else (slave,):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class _PtyMaster(io.FileIO):
+    """/**
+     * @class _PtyMaster
+     * @description Master side of a pty as a binary stream. Once every slave fd is closed
+     * (the child and its children exited) Linux fails reads with EIO: that is EOF here.
+     */"""
+
+    def readinto(self, buffer) -> int:  # type: ignore[override]
+        try:
+            return super().readinto(buffer)
+        except OSError as e:
+            if e.errno == errno.EIO:
+                return 0
+            raise
+
+
+def _write_all(fd: int, data: memoryview) -> bool:
+    """/**
+     * @description Write raw bytes to fd, handling partial writes.
+     * @param {number} fd
+     * @param {memoryview} data
+     * @returns {boolean} false if the fd is no longer writable
+     */"""
+
+    try:
+        while data:
+            n = os.write(fd, data)
+            data = data[n:]
+        return True
+    except OSError:
+        return False
+
+
+def _pump_stdout_binary(stream: Optional[object]) -> None:
+    """/**
+     * @description Forward raw stdout chunks to fd 1 without decoding.
+     * @param {?object} stream binary (unbuffered) pipe
+     */"""
+
+    if stream is None:
+        return
+    buf = bytearray(_CHUNK_SIZE)
+    view = memoryview(buf)
+    try:
+        while True:
+            n = stream.readinto(buf)
+            if not n:
+                return
+            # If our stdout is gone, keep draining so the child never blocks on a full pipe.
+            _write_all(1, view[:n])
+            METRICS.stdout_bytes += n
+    except Exception:  # noqa: BLE001
+        return
+
+
+def _pump_stderr_binary(stream: Optional[object], detector: StderrDetector, on_event, tty: bool = False) -> None:
+    """/**
+     * @description Forward raw stderr chunks to fd 2; the detector decodes + splits lines per chunk.
+     * An open trace is emitted once stderr is idle: select() with a timeout on POSIX, an
+     * _IdleFlusher thread elsewhere.
+     * @param {?object} stream binary (unbuffered) pipe
+     * @param {StderrDetector} detector
+     * @param {Function} on_event
+     * @param {boolean} tty stream is a pty master: hide escape sequences from the detector
+     */"""
+
+    if stream is None:
+        return
+    buf = bytearray(_CHUNK_SIZE)
+    view = memoryview(buf)
+    passthrough = True
+    idle = None if _SELECT_PIPES else _IdleFlusher(detector, on_event)
+    guard = idle.lock if idle is not None else contextlib.nullcontext()
+    try:
+        while True:
+            # Only while a trace is open: wait for more stderr, or emit it when idle.
+            if idle is None and detector.pending and not select.select([stream], [], [], _TRACE_IDLE_SECONDS)[0]:
+                for evt in detector.flush_pending():
+                    on_event(evt)
+                continue
+            n = stream.readinto(buf)
+            if not n:
+                break
+            if passthrough:
+                passthrough = _write_all(2, view[:n])
+            METRICS.stderr_bytes += n
+            with guard:
+                if idle is not None:
+                    idle.touch()
+                for evt in detector.push_chunk(_strip_ansi(bytes(view[:n])) if tty else view[:n]):
+                    on_event(evt)
+        with guard:
+            for evt in detector.finish():
+                on_event(evt)
+    except Exception:  # noqa: BLE001
+        return
+    finally:
+        if idle is not None:
+            idle.stop()
+
+
+# Output queued for a slow fd 1/2 before the children writing to it are paused.
+_WRITE_HIGH_WATER = 1024 * 1024
+_WRITE_LOW_WATER = 256 * 1024
+
+
+class _FdWriter:
+    """/**
+     * @class _FdWriter
+     * @description Writes to our fd 1 or 2 on a thread, so a slow reader of our output (a
+     * full pipe, a paused terminal) never stalls the event loop and the other children on
+     * it. Order is kept. Past _WRITE_HIGH_WATER queued bytes the producer is paused (the
+     * child then blocks on its own full pipe, as with inline writes) until the queue is
+     * below _WRITE_LOW_WATER. One per fd and event loop, see _fd_writer().
+     *
+     * @param {number} fd
+     * @param {asyncio.AbstractEventLoop} loop
+     */"""
+
+    def __init__(self, fd: int, loop: asyncio.AbstractEventLoop) -> None:
+        self._fd = fd
+        self._loop = loop
+        self._items: "deque[bytes]" = deque()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        # Loop thread only.
+        self._paused: list[Callable[[], None]] = []
+        self.nbytes = 0
+        self.ok = True
+
+    def write(self, data: bytes, pause: Callable[[], None], resume: Callable[[], None]) -> None:
+        """/**
+         * @description Queue data (event loop thread).
+         * @param {bytes} data
+         * @param {Function} pause stop reading from the producer
+         * @param {Function} resume start reading again
+         */"""
+
+        if not self.ok:
+            return
+        with self._cond:
+            self._items.append(data)
+            self.nbytes += len(data)
+            over = self.nbytes > _WRITE_HIGH_WATER
+            self._cond.notify()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"errmail-fd{self._fd}", daemon=True)
+            self._thread.start()
+        if over:
+            pause()
+            self._paused.append(resume)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._items)
+                data = self._items[0]
+            ok = _write_all(self._fd, memoryview(data))
+            with self._cond:
+                self._items.popleft()
+                self.nbytes -= len(data)
+                if not ok:
+                    # Our output is gone: keep reading the children, drop what they write.
+                    self.ok = False
+                    self._items.clear()
+                    self.nbytes = 0
+                low = self.nbytes <= _WRITE_LOW_WATER
+                self._cond.notify_all()
+            if low:
+                try:
+                    self._loop.call_soon_threadsafe(self._resume_all)
+                except RuntimeError:
+                    # The loop is closed.
+                    pass
+
+    def _resume_all(self) -> None:
+        paused, self._paused = self._paused, []
+        for resume in paused:
+            try:
+                resume()
+            except Exception:  # noqa: BLE001
+                pass
+
+    def wait_empty(self) -> None:
+        """/**
+         * @description Block until everything queued was written (call off the loop).
+         */"""
+
+        with self._cond:
+            self._cond.wait_for(lambda: not self._items)
+
+
+_WRITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[int, _FdWriter]]" = weakref.WeakKeyDictionary()
+
+
+def _fd_writer(loop: asyncio.AbstractEventLoop, fd: int) -> _FdWriter:
+    """/**
+     * @param {asyncio.AbstractEventLoop} loop
+     * @param {number} fd 1 or 2
+     * @returns {_FdWriter} shared by every child on the loop
+     */"""
+
+    writers = _WRITERS.setdefault(loop, {})
+    writer = writers.get(fd)
+    if writer is None:
+        writer = writers[fd] = _FdWriter(fd, loop)
+    return writer
+
+
+class _ChildProtocol(asyncio.SubprocessProtocol):
+    """/**
+     * @class _ChildProtocol
+     * @description Handle child pipe data directly in the event loop: forward raw bytes to
+     * fd 1/2 and feed stderr chunks to the detector (no StreamReader buffering/copies).
+     *
+     * `exited` resolves as soon as the child exits; `closed` once both pipes hit EOF.
+     * Process.wait() would also wait for the pipes, so a grandchild that inherited
+     * stdout/stderr would keep the wrapper alive; the thread runner returns on exit.
+     *
+     * With pseudo-terminals the child's stdout/stderr are not pipes of the transport:
+     * _PtyReader feeds the pty masters into pipe_data_received/pipe_connection_lost.
+     *
+     * Output is forwarded through _FdWriter, which pauses the source (`sources`) while
+     * our own stdout/stderr cannot keep up.
+     *
+     * @param {StderrDetector} detector
+     * @param {Function} on_event called with (ErrorEvent, pid)
+     * @param {asyncio.AbstractEventLoop} loop
+     * @param {boolean} tty output comes from pty masters
+     */"""
+
+    def __init__(self, detector: StderrDetector, on_event, loop: asyncio.AbstractEventLoop, tty: bool = False) -> None:
+        self._detector = detector
+        self._tty = tty
+        self._on_event = on_event
+        self._transport: asyncio.SubprocessTransport | None = None
+        self._pid: int | None = None
+        self._loop = loop
+        self._writers = {1: _fd_writer(loop, 1), 2: _fd_writer(loop, 2)}
+        # fd -> read transport the data comes from (pipe, or pty reader).
+        self.sources: dict[int, asyncio.ReadTransport] = {}
+        self._open = {1, 2}
+        self._last_stderr = 0.0
+        self._idle_timer: asyncio.TimerHandle | None = None
+        self.exited: "asyncio.Future[int]" = loop.create_future()
+        self.closed: "asyncio.Future[None]" = loop.create_future()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport  # type: ignore[assignment]
+        self._pid = transport.get_pid()  # type: ignore[attr-defined]
+        for fd in (1, 2):
+            pipe = self._transport.get_pipe_transport(fd)  # type: ignore[union-attr]
+            if pipe is not None:
+                self.sources[fd] = pipe  # type: ignore[assignment]
+
+    def _pause(self, fd: int) -> None:
+        source = self.sources.get(fd)
+        if source is not None and not source.is_closing():
+            source.pause_reading()
+
+    def _resume(self, fd: int) -> None:
+        source = self.sources.get(fd)
+        if source is not None and not source.is_closing():
+            source.resume_reading()
+
+    async def drain(self) -> None:
+        """/**
+         * @description Wait until the forwarded output was written, without blocking the loop.
+         */"""
+
+        for writer in self._writers.values():
+            if writer.nbytes:
+                await self._loop.run_in_executor(None, writer.wait_empty)
+
+    def pipe_data_received(self, fd: int, data: bytes) -> None:
+        writer = self._writers.get(fd)
+        if writer is not None:
+            writer.write(data, lambda: self._pause(fd), lambda: self._resume(fd))
+        if fd == 1:
+            METRICS.stdout_bytes += len(data)
+        else:
+            METRICS.stderr_bytes += len(data)
+        if fd == 2:
+            self._emit(self._detector.push_chunk(_strip_ansi(data) if self._tty else data))
+            if self._detector.pending:
+                self._last_stderr = self._loop.time()
+                if self._idle_timer is None:
+                    self._idle_timer = self._loop.call_later(_TRACE_IDLE_SECONDS, self._flush_idle)
+
+    def _flush_idle(self) -> None:
+        # Emit an open trace once stderr has been quiet for _TRACE_IDLE_SECONDS.
+        self._idle_timer = None
+        if not self._detector.pending:
+            return
+        wait = self._last_stderr + _TRACE_IDLE_SECONDS - self._loop.time()
+        if wait > 0:
+            self._idle_timer = self._loop.call_later(wait, self._flush_idle)
+            return
+        self._emit(self._detector.flush_pending())
+
+    def pipe_connection_lost(self, fd: int, exc: Exception | None) -> None:
+        if fd == 2:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            self._emit(self._detector.finish())
+        self._open.discard(fd)
+        if not self._open and not self.closed.done():
+            self.closed.set_result(None)
+
+    def process_exited(self) -> None:
+        if not self.exited.done() and self._transport is not None:
+            self.exited.set_result(self._transport.get_returncode())
+
+    def _emit(self, events: list[ErrorEvent]) -> None:
+        for evt in events:
+            try:
+                self._on_event(evt, self._pid)
+            except Exception:  # noqa: BLE001
+                pass
+
+
+class _PtyReader(asyncio.Protocol):
+    """/**
+     * @class _PtyReader
+     * @description Read pipe protocol for one pty master; forwards to _ChildProtocol as
+     * if it were the subprocess pipe `fd`. EIO at the end is reported by asyncio as a
+     * connection loss (quietly), i.e. EOF.
+     * @param {_ChildProtocol} child
+     * @param {number} fd 1 or 2
+     */"""
+
+    def __init__(self, child: _ChildProtocol, fd: int) -> None:
+        self._child = child
+        self._fd = fd
+
+    def data_received(self, data: bytes) -> None:
+        self._child.pipe_data_received(self._fd, data)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._child.pipe_connection_lost(self._fd, None)
+
+
+def use_pidfd_child_watcher() -> None:
+    """/**
+     * @description Python < 3.12 defaults to ThreadedChildWatcher (one extra thread per
+     * child). Prefer the pidfd watcher on Linux; 3.12+ already does this by itself.
+     */"""
+
+    if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+        return
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(asyncio.get_running_loop())
+            asyncio.set_child_watcher(watcher)
+    except Exception:  # noqa: BLE001
+        return
+
+
+async def run_child(
+    command: list[str],
+    *,
+    detector: StderrDetector,
+    on_event,
+    cwd: str,
+    on_start=None,
+    pty: bool = False,
+    verbose: bool = False,
+) -> tuple[int, int]:
+    """/**
+     * @description Run one child on the current event loop, pumping stdout/stderr.
+     * @param {Array<string>} command
+     * @param {StderrDetector} detector
+     * @param {Function} on_event called with (ErrorEvent, pid)
+     * @param {string} cwd
+     * @param {?Function} on_start called with the SubprocessTransport once the child runs
+     * @param {boolean} pty give the child pseudo-terminals instead of pipes (see open_ptys)
+     * @param {boolean} verbose
+     * @returns {Promise<[number, number]>} (pid, exit code)
+     */"""
+
+    loop = asyncio.get_running_loop()
+    ptys = open_ptys(verbose) if pty else None
+    try:
+        transport, protocol = await loop.subprocess_exec(
+            lambda: _ChildProtocol(detector, on_event, loop, tty=ptys is not None),
+            *command,
+            cwd=cwd,
+            stdin=None,
+            stdout=ptys[1][1] if ptys else subprocess.PIPE,
+            stderr=ptys[2][1] if ptys else subprocess.PIPE,
+        )
+    except BaseException:
+        close_ptys(ptys, masters=True)
+        raise
+    close_ptys(ptys)
+    readers: list[asyncio.BaseTransport] = []
+    for fd, (master, _) in (ptys or {}).items():
+        reader, _ = await loop.connect_read_pipe(
+            lambda fd=fd: _PtyReader(protocol, fd), open(master, "rb", buffering=0)  # noqa: SIM115
+        )
+        protocol.sources[fd] = reader  # type: ignore[assignment]
+        readers.append(reader)
+    pid = transport.get_pid()
+    if on_start is not None:
+        on_start(transport)
+    try:
+        # Shielded: a cancelled task must not cancel `exited`, the finally waits on it.
+        exit_code = await asyncio.shield(protocol.exited)
+        # Give the pipes a moment to drain (same budget as the thread runner's joins).
+        try:
+            await asyncio.wait_for(asyncio.shield(protocol.closed), timeout=2.0)
+        except asyncio.TimeoutError:
+            # A grandchild still holds the pipes: stop reading.
+            pass
+        await protocol.drain()
+    finally:
+        if not protocol.exited.done():
+            # Interrupted (Ctrl-C reaches the child too): let the child shut down on its
+            # own, like the thread runner does; closing the transport first would SIGKILL
+            # it. A second interrupt stops waiting.
+            try:
+                await asyncio.shield(protocol.exited)
+            except (asyncio.CancelledError, KeyboardInterrupt):
+                pass
+        for reader in readers:
+            reader.close()
+        transport.close()
+    return pid, exit_code
+
+
+async def _run_command_async(
+    command: list[str],
+    *,
+    cfg: ErrmailConfig,
+    cwd: str,
+    verbose: bool,
+    notifier: Notifier | None = None,
+    rules: RuleSet | None = None,
+) -> int:
+    """/**
+     * @param {Array<string>} command
+     * @param {ErrmailConfig} cfg
+     * @param {string} cwd
+     * @param {boolean} verbose
+     * @param {?Notifier} notifier
+     * @param {?RuleSet} rules
+     * @returns {Promise<number>} exit code
+     */"""
+
+    use_pidfd_child_watcher()
+    detector = detector_for(cfg, rules)
+    if notifier is None:
+        notifier = Notifier(cfg, command=command, cwd=cwd, verbose=verbose, routes=rules.routes if rules else ())
+    seen_any_event = False
+
+    def on_event(evt: ErrorEvent, pid: int) -> None:
+        nonlocal seen_any_event
+        seen_any_event = True
+        notifier.enqueue(evt, pid=pid, exit_code=None, tail=detector.tail_snapshot)
+
+    pid, exit_code = await run_child(
+        command, detector=detector, on_event=on_event, cwd=cwd, pty=cfg.pty, verbose=verbose
+    )
+    notify_nonzero_exit(notifier, detector, command, pid, exit_code, seen_any_event)
+    # Best-effort: allow background email thread to process queued notifications.
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, notifier.flush, 2.0)
+    # close() may wait for the workers: keep it off the loop too.
+    await loop.run_in_executor(None, notifier.close)
+    return exit_code
+
+
+def notify_nonzero_exit(
+    notifier: Notifier,
+    detector: StderrDetector,
+    command: list[str],
+    pid: int | None,
+    exit_code: int,
+    seen_any_event: bool,
+    service: str | None = None,
+) -> None:
+    """/**
+     * @description Exit-code fallback: alert on a non-zero exit when stderr showed nothing.
+     * @param {Notifier} notifier
+     * @param {StderrDetector} detector
+     * @param {Array<string>} command
+     * @param {?number} pid
+     * @param {number} exit_code
+     * @param {boolean} seen_any_event
+     * @param {?string} service
+     */"""
+
+    if exit_code != 0 and not seen_any_event:
+        msg = f"process exited with code {exit_code}"
+        excerpt = (msg + "\n").strip() + "\n"
+        fp = fingerprint(msg + "\n" + " ".join(command))
+        evt = ErrorEvent(kind="exit-nonzero", fp=fp, message=msg, excerpt=excerpt, ts=time.time())
+        notifier.enqueue(
+            evt,
+            pid=pid,
+            exit_code=exit_code,
+            tail=detector.tail_snapshot,
+            service=service,
+            command=command,
+        )
 
 
 def run_command(
@@ -59,31 +725,86 @@ def run_command(
     cfg: ErrmailConfig,
     cwd: str | None = None,
     verbose: bool = False,
+    notifier: Notifier | None = None,
 ) -> int:
     """/**
      * @param {Array<string>} command
      * @param {ErrmailConfig} cfg
      * @param {?string} cwd
      * @param {boolean} verbose
+     * @param {?Notifier} notifier use this Notifier instead of building one (e.g. `errmail bench`)
      * @returns {number} exit code
      */"""
 
-    workdir = cwd or os.getcwd()
-    detector = StderrDetector(tail_lines=cfg.tail_lines)
-    notifier = Notifier(cfg, command=command, cwd=workdir, verbose=verbose)
-
-    # NOTE: text=True + bufsize=1 gives line-buffered behavior for many commands,
-    # but some programs still buffer; passthrough is still best-effort.
-    p = subprocess.Popen(  # noqa: S603
-        command,
-        cwd=workdir,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,
-        universal_newlines=True,
-        errors="replace",
-    )
+    rules = load_ruleset_quietly(cfg, verbose=verbose)
+    exporter = start_exporter(cfg, verbose=verbose)
+    profiler = start_profiler(cfg)
+    try:
+        return _run_command(
+            command, cfg=cfg, workdir=cwd or os.getcwd(), verbose=verbose, notifier=notifier, rules=rules
+        )
+    finally:
+        stop_profiler(profiler, verbose=verbose)
+        if exporter is not None:
+            exporter.close()
+
+
+def _run_command(
+    command: list[str],
+    *,
+    cfg: ErrmailConfig,
+    workdir: str,
+    verbose: bool,
+    notifier: Notifier | None,
+    rules: RuleSet | None,
+) -> int:
+    """/**
+     * @returns {number} exit code
+     */"""
+
+    # The asyncio runner needs the chunked pump; legacy text mode keeps the threads.
+    if cfg.runner == "asyncio" and cfg.pump_mode != "text":
+        return asyncio.run(
+            _run_command_async(command, cfg=cfg, cwd=workdir, verbose=verbose, notifier=notifier, rules=rules)
+        )
+
+    detector = detector_for(cfg, rules)
+    if notifier is None:
+        notifier = Notifier(cfg, command=command, cwd=workdir, verbose=verbose, routes=rules.routes if rules else ())
+
+    ptys = open_ptys(verbose) if cfg.pty else None
+    binary = cfg.pump_mode != "text" or ptys is not None
+    if ptys is not None:
+        # Pseudo-terminals read through the binary pumps (text mode does not apply).
+        try:
+            p = subprocess.Popen(command, cwd=workdir, stdout=ptys[1][1], stderr=ptys[2][1])  # noqa: S603
+        except BaseException:
+            close_ptys(ptys, masters=True)
+            raise
+        close_ptys(ptys)
+        p.stdout, p.stderr = _PtyMaster(ptys[1][0], "rb"), _PtyMaster(ptys[2][0], "rb")
+    elif binary:
+        # Unbuffered binary pipes: pumps read large chunks and forward raw bytes.
+        p = subprocess.Popen(  # noqa: S603
+            command,
+            cwd=workdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+    else:
+        # NOTE: text=True + bufsize=1 gives line-buffered behavior for many commands,
+        # but some programs still buffer; passthrough is still best-effort.
+        p = subprocess.Popen(  # noqa: S603
+            command,
+            cwd=workdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            universal_newlines=True,
+            errors="replace",
+        )
 
     pid = p.pid
     seen_any_event = False
@@ -91,10 +812,13 @@ def run_command(
     def on_event(evt: ErrorEvent) -> None:
         nonlocal seen_any_event
         seen_any_event = True
-        notifier.enqueue(evt, pid=pid, exit_code=None, tail=detector.tail_text())
+        notifier.enqueue(evt, pid=pid, exit_code=None, tail=detector.tail_snapshot)
 
-    t_out = threading.Thread(target=_pump_stdout, args=(p.stdout,), daemon=True)
-    t_err = threading.Thread(target=_pump_stderr, args=(p.stderr, detector, on_event), daemon=True)
+    pump_out = _pump_stdout_binary if binary else _pump_stdout
+    pump_err = _pump_stderr_binary if binary else _pump_stderr
+    t_out = threading.Thread(target=pump_out, args=(p.stdout,), name="errmail-stdout", daemon=True)
+    err_args = (p.stderr, detector, on_event, True) if ptys is not None else (p.stderr, detector, on_event)
+    t_err = threading.Thread(target=pump_err, args=err_args, name="errmail-stderr", daemon=True)
     t_out.start()
     t_err.start()
 
@@ -102,17 +826,17 @@ def run_command(
     # Give pump threads a moment to flush remaining lines.
     t_out.join(timeout=1.0)
     t_err.join(timeout=1.0)
+    if ptys is not None:
+        # A pty master whose pump is still blocked (a grandchild holds the slave) stays open.
+        for t, stream in ((t_out, p.stdout), (t_err, p.stderr)):
+            if not t.is_alive():
+                stream.close()
 
-    if exit_code != 0 and not seen_any_event:
-        tail = detector.tail_text()
-        msg = f"process exited with code {exit_code}"
-        excerpt = (msg + "\n").strip() + "\n"
-        fp = fingerprint(msg + "\n" + " ".join(command))
-        evt = ErrorEvent(kind="exit-nonzero", fp=fp, message=msg, excerpt=excerpt, ts=time.time())
-        notifier.enqueue(evt, pid=pid, exit_code=exit_code, tail=tail)
+    notify_nonzero_exit(notifier, detector, command, pid, exit_code, seen_any_event)
 
     # Best-effort: allow background email thread to process queued notifications.
     notifier.flush(timeout_seconds=2.0)
+    notifier.close()
 
     return exit_code
 
@@ -0,0 +1,678 @@
+"""/**
+ * @file spool.py
+ * @description Durable outbox for rendered emails (ERRMAIL_SPOOL, ERRMAIL_SPOOL_DIR).
+ *
+ * Every email is written to a spool segment before the first send attempt, so neither a
+ * failed send nor a wrapper that exits right after the crash loses the alert:
+ * - One segment per process ("<unix ts>-<pid>.jsonl"), held under an exclusive flock for
+ *   the owner's lifetime. Records are JSON lines: {"id", "ts", "to", "subject", "body"}
+ *   (plus "attach": [[name, base64], ...] if any) for a message, {"ack": id} once it was
+ *   delivered (or given up), {"rcpt": id, "to": ...} once some recipients have it (LMTP
+ *   reports per recipient): only the rest are retried.
+ * - Writes are batched: the notifier writes every email of a batch, then fsyncs once
+ *   before sending any of them. Acks are never fsynced on their own: a lost ack means a
+ *   duplicate email, never a lost one (delivery is at-least-once).
+ * - Failed sends are retried with exponential backoff (30 s doubling up to 30 min);
+ *   emails older than 24 hours are given up.
+ * - A segment whose lock is free belongs to a process that is gone: the next errmail
+ *   process or `errmail drain` adopts it. A segment is deleted once every email in it
+ *   is acked.
+ * - A wrapper that exits with emails still undelivered hands them to a detached
+ *   `errmail drain`, which waits for the wrapper's lock, so exiting never waits on SMTP.
+ */"""
+
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+from .config import ErrmailConfig
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    # No flock: segments could not be told apart from those of live processes, so
+    # outboxes stay in memory there (see Outbox).
+    fcntl = None  # type: ignore[assignment]
+
+_SUFFIX = ".jsonl"
+_BACKOFF_FIRST = 30.0
+_BACKOFF_MAX = 1800.0
+_MAX_AGE_SECONDS = 24 * 3600.0
+# An own segment with nothing pending is truncated once it grows past this.
+_COMPACT_BYTES = 1024 * 1024
+# How long the drain spawned at exit waits for the wrapper's lock / keeps retrying.
+_HANDOFF_WAIT_SECONDS = 30.0
+_HANDOFF_RETRY_SECONDS = 900.0
+
+
+def default_spool_dir() -> str:
+    """/**
+     * @returns {string}
+     */"""
+
+    base = os.getenv("XDG_STATE_HOME") or str(Path.home() / ".local" / "state")
+    return str(Path(base) / "errmail" / "spool")
+
+
+def backoff_seconds(attempts: int) -> float:
+    """/**
+     * @param {number} attempts failed attempts so far (>= 1)
+     * @returns {number} delay before the next attempt
+     */"""
+
+    return min(_BACKOFF_MAX, _BACKOFF_FIRST * 2 ** max(0, attempts - 1))
+
+
+class _Segment:
+    """/**
+     * @class _Segment
+     * @description One locked spool file and the ids in it that are not acked yet.
+     *
+     * @param {string} path
+     * @param {number} fd opened O_APPEND, flock held
+     */"""
+
+    def __init__(self, path: str, fd: int) -> None:
+        self.path = path
+        self.fd: Optional[int] = fd
+        self.pending: set[int] = set()
+        self.next_id = 1
+
+    @classmethod
+    def create(cls, directory: str, tag: str = "") -> "_Segment":
+        """/**
+         * @param {string} directory
+         * @param {string} tag distinguishes several outboxes of one process
+         * @returns {_Segment}
+         * @throws {OSError}
+         */"""
+
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        path = os.path.join(directory, f"{int(time.time())}-{os.getpid()}{'-' + tag if tag else ''}{_SUFFIX}")
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return cls(path, fd)
+
+    @classmethod
+    def adopt(cls, path: str) -> "tuple[_Segment | None, list[dict]]":
+        """/**
+         * @description Lock a segment left behind by another process and read what it
+         * still has to deliver. A fully acked segment is deleted right away.
+         *
+         * @param {string} path
+         * @returns {[?_Segment, Array<Object>]} (segment, unacked message records);
+         *   (null, []) if it is locked by a live process or gone
+         * @throws {BlockingIOError} locked
+         */"""
+
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_APPEND)
+        except FileNotFoundError:
+            return None, []
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Deleted (fully acked by another adopter) between open() and flock().
+            st = os.fstat(fd)
+            cur = os.stat(path)
+            if (st.st_dev, st.st_ino) != (cur.st_dev, cur.st_ino):
+                os.close(fd)
+                return None, []
+            with open(fd, "rb", closefd=False) as f:
+                data = f.read()
+        except FileNotFoundError:
+            os.close(fd)
+            return None, []
+        except BaseException:
+            os.close(fd)
+            raise
+        seg = cls(path, fd)
+        messages: dict[int, dict] = {}
+        for line in data.splitlines():
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # Torn last line of a process that died mid-write.
+                continue
+            if "ack" in rec:
+                messages.pop(rec["ack"], None)
+            elif "rcpt" in rec:
+                if rec["rcpt"] in messages:
+                    messages[rec["rcpt"]]["to"] = rec["to"]
+            elif "id" in rec:
+                messages[rec["id"]] = rec
+                seg.next_id = max(seg.next_id, rec["id"] + 1)
+        seg.pending = set(messages)
+        if not messages:
+            seg.retire()
+        return seg, list(messages.values())
+
+    def write(self, records: list[dict]) -> None:
+        """/**
+         * @param {Array<Object>} records appended in one write
+         * @throws {OSError}
+         */"""
+
+        if self.fd is None:
+            return
+        data = "".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records).encode("utf-8")
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view) :]
+
+    def sync(self) -> None:
+        """/**
+         * @throws {OSError}
+         */"""
+
+        if self.fd is not None:
+            os.fsync(self.fd)
+
+    def compact(self) -> None:
+        """/**
+         * @description Drop the history of a segment with nothing pending.
+         */"""
+
+        if self.fd is not None and not self.pending and os.fstat(self.fd).st_size > _COMPACT_BYTES:
+            os.ftruncate(self.fd, 0)
+
+    def retire(self) -> None:
+        """/**
+         * @description Delete the file and release the lock.
+         */"""
+
+        if self.fd is None:
+            return
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self.release()
+
+    def release(self) -> None:
+        """/**
+         * @description Release the lock, keeping the file for whoever comes next.
+         */"""
+
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            os.close(fd)
+
+
+@dataclass
+class SpoolEntry:
+    """/**
+     * @class SpoolEntry
+     * @description One rendered email waiting for (re)delivery.
+     */"""
+
+    subject: str
+    body: str
+    mail_to: str | None
+    ts: float
+    id: int = 0
+    segment: Optional[_Segment] = None
+    attempts: int = 0
+    due: float = 0.0
+    # time.monotonic() when the notification was queued (0 = unknown, e.g. adopted).
+    queued_at: float = 0.0
+    # (file name, gzip data), see mailer.tail_attachment.
+    attachments: "tuple[tuple[str, bytes], ...]" = ()
+
+
+def _record(entry: SpoolEntry) -> dict:
+    """/**
+     * @param {SpoolEntry} entry
+     * @returns {Object} its spool record
+     */"""
+
+    rec = {"id": entry.id, "ts": entry.ts, "to": entry.mail_to, "subject": entry.subject, "body": entry.body}
+    if entry.attachments:
+        rec["attach"] = [[name, base64.b64encode(data).decode("ascii")] for name, data in entry.attachments]
+    return rec
+
+
+def _attachments(rec: dict) -> "tuple[tuple[str, bytes], ...]":
+    """/**
+     * @param {Object} rec spool record
+     * @returns {Array<[string, Uint8Array]>} (unreadable attachments are skipped)
+     */"""
+
+    out = []
+    for item in rec.get("attach") or ():
+        try:
+            name, data = item
+            out.append((str(name), base64.b64decode(data)))
+        except (TypeError, ValueError):
+            continue
+    return tuple(out)
+
+
+class Outbox:
+    """/**
+     * @class Outbox
+     * @description Emails between rendering and delivery, spooled to disk when `directory`
+     * is usable and the platform has flock (else kept in memory, still with retries). Driven by one sender thread:
+     * put() ... commit() ... send_due(); pending() and close() may be called from others.
+     *
+     * @param {?string} directory spool directory (null = memory only)
+     * @param {boolean} verbose
+     * @param {string} tag segment name suffix (one outbox per route, see Notifier)
+     */"""
+
+    def __init__(self, directory: str | None, verbose: bool = False, tag: str = "") -> None:
+        self.directory = directory if fcntl is not None else None
+        self._verbose = verbose
+        self._tag = tag
+        self._own: Optional[_Segment] = None
+        self._adopted: list[_Segment] = []
+        self._staged: list[SpoolEntry] = []
+        self._waiting: list[SpoolEntry] = []
+        self._in_flight = 0
+        self._stopping = False
+        self._lock = threading.Lock()
+        self.expired = 0
+
+    @property
+    def durable(self) -> bool:
+        return self.directory is not None
+
+    def pending(self) -> int:
+        """/**
+         * @returns {number} emails not delivered yet
+         */"""
+
+        with self._lock:
+            return len(self._staged) + len(self._waiting) + self._in_flight
+
+    def put(
+        self,
+        subject: str,
+        body: str,
+        mail_to: str | None,
+        queued_at: float = 0.0,
+        attachments: "tuple[tuple[str, bytes], ...]" = (),
+    ) -> None:
+        """/**
+         * @description Stage an email; it is written and sent on the next commit()/send_due().
+         */"""
+
+        with self._lock:
+            self._staged.append(
+                SpoolEntry(
+                    subject=subject,
+                    body=body,
+                    mail_to=mail_to,
+                    ts=time.time(),
+                    queued_at=queued_at,
+                    attachments=attachments,
+                )
+            )
+
+    def commit(self) -> None:
+        """/**
+         * @description Write the staged emails and fsync once. On disk trouble the emails
+         * stay in memory only (and the spool is turned off).
+         */"""
+
+        with self._lock:
+            staged, self._staged = self._staged, []
+            if not staged:
+                return
+            if self.directory is not None:
+                try:
+                    if self._own is None:
+                        self._own = _Segment.create(self.directory, self._tag)
+                    seg = self._own
+                    for entry in staged:
+                        entry.id, entry.segment = seg.next_id, seg
+                        seg.next_id += 1
+                    seg.write([_record(e) for e in staged])
+                    seg.sync()
+                    seg.pending.update(e.id for e in staged)
+                except OSError as e:
+                    self._log(f"spool disabled, {self.directory}: {e}")
+                    self.directory = None
+                    for entry in staged:
+                        entry.segment = None
+            now = time.monotonic()
+            for entry in staged:
+                entry.due = now
+            self._waiting.extend(staged)
+
+    def adopt_orphans(self) -> int:
+        """/**
+         * @description Take over segments of processes that are gone.
+         * @returns {number} segments skipped because a live process holds them
+         */"""
+
+        if self.directory is None:
+            return 0
+        try:
+            names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SUFFIX))
+        except OSError:
+            return 0
+        locked = 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if self._own is not None and path == self._own.path:
+                continue
+            if any(seg.path == path for seg in self._adopted):
+                continue
+            try:
+                seg, records = _Segment.adopt(path)
+            except BlockingIOError:
+                locked += 1
+                continue
+            except OSError:
+                continue
+            if seg is None or not records:
+                continue
+            now = time.monotonic()
+            with self._lock:
+                self._adopted.append(seg)
+                for rec in records:
+                    self._waiting.append(
+                        SpoolEntry(
+                            subject=str(rec.get("subject", "")),
+                            body=str(rec.get("body", "")),
+                            attachments=_attachments(rec),
+                            mail_to=rec.get("to"),
+                            ts=float(rec.get("ts") or time.time()),
+                            id=rec["id"],
+                            segment=seg,
+                            due=now,
+                        )
+                    )
+            self._log(f"adopted {len(records)} undelivered email(s) from {path}")
+        return locked
+
+    def stop(self) -> None:
+        """/**
+         * @description Let the send in progress finish but start no more: what is still
+         * waiting stays for close() to hand off.
+         */"""
+
+        with self._lock:
+            self._stopping = True
+
+    def next_due(self) -> Optional[float]:
+        """/**
+         * @returns {?number} seconds until the next retry is due (null if none waiting)
+         */"""
+
+        with self._lock:
+            if not self._waiting:
+                return None
+            return max(0.0, min(e.due for e in self._waiting) - time.monotonic())
+
+    def send_due(self, send: Callable[[SpoolEntry], Optional[str]]) -> int:
+        """/**
+         * @description Attempt every email that is due, oldest first.
+         * @param {Function} send returns an error string on failure
+         * @returns {number} emails delivered
+         */"""
+
+        now = time.monotonic()
+        with self._lock:
+            due = sorted((e for e in self._waiting if e.due <= now), key=lambda e: e.ts)
+            if not due or self._stopping:
+                return 0
+            self._waiting = [e for e in self._waiting if e.due > now]
+            self._in_flight += len(due)
+        delivered = 0
+        for n, entry in enumerate(due):
+            with self._lock:
+                if self._stopping:
+                    rest = due[n:]
+                    self._waiting.extend(rest)
+                    self._in_flight -= len(rest)
+                    break
+            err = send(entry)
+            with self._lock:
+                self._in_flight -= 1
+                if err is None:
+                    delivered += 1
+                    self._ack(entry)
+                    continue
+                entry.attempts += 1
+                if time.time() - entry.ts > _MAX_AGE_SECONDS:
+                    self.expired += 1
+                    self._log(f"giving up on an email after {entry.attempts} attempts: {entry.subject}")
+                    self._ack(entry)
+                    continue
+                entry.due = time.monotonic() + backoff_seconds(entry.attempts)
+                self._waiting.append(entry)
+                if n + 1 < len(due):
+                    # The server is likely down: retry the rest later too.
+                    rest = due[n + 1 :]
+                    for other in rest:
+                        other.due = entry.due
+                    self._waiting.extend(rest)
+                    self._in_flight -= len(rest)
+                    break
+        return delivered
+
+    def retry_only(self, entry: SpoolEntry, recipients: list[str]) -> None:
+        """/**
+         * @description Narrow a failed email to the recipients that still lack it. Like an
+         * ack, the record is not fsynced: if it is lost, everyone gets the retry.
+         * @param {SpoolEntry} entry
+         * @param {Array<string>} recipients
+         */"""
+
+        with self._lock:
+            entry.mail_to = ", ".join(recipients)
+            seg = entry.segment
+            if seg is None or seg.fd is None:
+                return
+            try:
+                seg.write([{"rcpt": entry.id, "to": entry.mail_to}])
+            except OSError:
+                pass
+
+    def _ack(self, entry: SpoolEntry) -> None:
+        """/**
+         * @description Mark delivered (or given up) in its segment. Lock held.
+         */"""
+
+        seg = entry.segment
+        if seg is None or seg.fd is None:
+            return
+        seg.pending.discard(entry.id)
+        try:
+            seg.write([{"ack": entry.id}])
+            if seg is self._own:
+                seg.compact()
+            elif not seg.pending:
+                seg.retire()
+                self._adopted.remove(seg)
+        except OSError:
+            # The email goes out again later: a duplicate, not a loss.
+            pass
+
+    def close(self, handoff: bool = True) -> int:
+        """/**
+         * @description Delete what is fully delivered and release the rest for a later
+         * errmail process. With handoff, undelivered spooled emails are given to a
+         * detached `errmail drain` right away, the ones the sender thread is still
+         * sending included: the drain waits for this process's lock and skips anything
+         * acked by then (a send that succeeds without its ack is sent twice).
+         *
+         * @param {boolean} handoff
+         * @returns {number} emails left undelivered
+         */"""
+
+        return close_outboxes([self], handoff=handoff)
+
+    def _release(self) -> tuple[int, int, bool]:
+        """/**
+         * @returns {[number, number, boolean]} (emails waiting, emails still being sent,
+         *   some of them are on disk)
+         */"""
+
+        with self._lock:
+            waiting = len(self._staged) + len(self._waiting)
+            in_flight = self._in_flight
+            spooled = any(seg.pending for seg in self._adopted) or bool(self._own and self._own.pending)
+            if self._own is not None and not self._own.pending:
+                self._own.retire()
+                self._own = None
+            for seg in self._adopted:
+                if not seg.pending:
+                    seg.retire()
+            # Our own segment stays locked until this process exits: the sender thread
+            # may still ack what it is sending, and the drain waits for the lock.
+            for seg in self._adopted:
+                seg.release()
+            self._adopted = []
+        return waiting, in_flight, spooled and self.directory is not None
+
+    def _log(self, msg: str) -> None:
+        if self._verbose:
+            try:
+                print(f"[errmail] {msg}", file=sys.stderr)
+            except Exception:  # noqa: BLE001
+                pass
+
+
+def close_outboxes(outboxes: list[Outbox], handoff: bool = True) -> int:
+    """/**
+     * @description Outbox.close() for several outboxes, with at most one `errmail drain`
+     * per spool directory (a drain takes every segment in it).
+     *
+     * @param {Array<Outbox>} outboxes
+     * @param {boolean} handoff
+     * @returns {number} emails left undelivered
+     */"""
+
+    total = 0
+    drains: dict[str, bool] = {}
+    for outbox in outboxes:
+        waiting, in_flight, spooled = outbox._release()
+        total += waiting + in_flight
+        if spooled:
+            # Being sent counts too: the drain skips whatever gets acked before we exit.
+            drains[outbox.directory or ""] = drains.get(outbox.directory or "", False) or outbox._verbose
+        elif waiting and outbox.directory is None:
+            outbox._log(f"{waiting} email(s) not delivered")
+        if in_flight and not spooled:
+            outbox._log(f"{in_flight} email(s) still being sent at exit")
+    if handoff:
+        for directory, verbose in drains.items():
+            spawn_drain(directory, verbose=verbose)
+    return total
+
+
+def open_outbox(cfg: ErrmailConfig, verbose: bool = False, tag: str = "") -> Outbox:
+    """/**
+     * @param {ErrmailConfig} cfg
+     * @param {boolean} verbose
+     * @param {string} tag segment name suffix
+     * @returns {Outbox} spooled if ERRMAIL_SPOOL is on
+     */"""
+
+    return Outbox((cfg.spool_dir or default_spool_dir()) if cfg.spool else None, verbose=verbose, tag=tag)
+
+
+def spawn_drain(directory: str, verbose: bool = False) -> None:
+    """/**
+     * @description Start a detached `errmail drain` for `directory` (best-effort).
+     * @param {string} directory
+     * @param {boolean} verbose
+     */"""
+
+    import subprocess
+
+    env = dict(os.environ)
+    root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (root, env.get("PYTHONPATH")) if p)
+    cmd = [
+        sys.executable,
+        "-m",
+        "errmail",
+        "drain",
+        "--spool-dir",
+        directory,
+        "--wait",
+        str(_HANDOFF_WAIT_SECONDS),
+        "--retry-for",
+        str(_HANDOFF_RETRY_SECONDS),
+    ]
+    try:
+        subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=None if verbose else subprocess.DEVNULL,
+            env=env,
+            start_new_session=True,
+            close_fds=True,
+        )
+    except OSError as e:
+        if verbose:
+            print(f"[errmail] cannot start errmail drain: {e}", file=sys.stderr)
+
+
+def drain(
+    cfg: ErrmailConfig,
+    directory: str | None = None,
+    *,
+    wait: float = 0.0,
+    retry_for: float = 0.0,
+    verbose: bool = False,
+) -> tuple[int, int]:
+    """/**
+     * @description Deliver what other (exited) errmail processes left in the spool.
+     *
+     * @param {ErrmailConfig} cfg
+     * @param {?string} directory default: cfg.spool_dir or ~/.local/state/errmail/spool
+     * @param {number} wait seconds to wait for segments still locked by a live process
+     * @param {number} retry_for keep retrying failed emails (with backoff) this long
+     * @param {boolean} verbose
+     * @returns {[number, number]} (delivered, left in the spool)
+     */"""
+
+    from dataclasses import replace
+
+    from .mailer import MailPayload, send_mail
+    from .transports import open_transport
+
+    outbox = Outbox(directory or cfg.spool_dir or default_spool_dir(), verbose=verbose)
+    session = open_transport(cfg)
+    delivered = 0
+
+    def send(entry: SpoolEntry) -> Optional[str]:
+        c = cfg if not entry.mail_to or entry.mail_to == cfg.mail_to else replace(cfg, mail_to=entry.mail_to)
+        err = send_mail(c, MailPayload(subject=entry.subject, body=entry.body, attachments=entry.attachments), session=session)
+        if err and session.refused:
+            outbox.retry_only(entry, session.refused)
+        if err and verbose:
+            print(f"[errmail] send failed: {err}", file=sys.stderr)
+        return err
+
+    start = time.monotonic()
+    try:
+        while True:
+            locked = outbox.adopt_orphans()
+            delivered += outbox.send_due(send)
+            now = time.monotonic()
+            if locked and now - start < wait:
+                time.sleep(0.1)
+                continue
+            nxt = outbox.next_due()
+            if nxt is None or now + nxt - start > retry_for:
+                break
+            time.sleep(nxt)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+    return delivered, outbox.close(handoff=False)
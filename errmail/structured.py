@@ -0,0 +1,242 @@
+"""/**
+ * @file structured.py
+ * @description JSON-lines stderr (ERRMAIL_INPUT_FORMAT=json).
+ *
+ * A JSON line is an error if its level field says so ("error", "fatal", pino/bunyan
+ * numeric levels >= 50, ...) or if it carries a non-empty exception/stack field. Text
+ * inside the payload ("msg": "retrying after ERROR") no longer matters.
+ *
+ * Parsing is gated by one regex that looks for those keys with an error value in the raw
+ * line (or across a whole read chunk), so lines that are not errors are never passed to
+ * json.loads.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+import re
+from typing import Any, Optional
+
+from .rules import keyword_regex
+
+_LEVEL_KEYS = ("level", "severity", "lvl", "levelname", "loglevel", "log.level", "@l")
+_MESSAGE_KEYS = ("message", "msg", "@m", "@mt", "error.message", "err.message")
+_STACK_KEYS = (
+    "stack",
+    "stack_trace",
+    "stacktrace",
+    "exception",
+    "exc_info",
+    "traceback",
+    "@x",
+    "error.stack",
+    "err.stack",
+    "error.stack_trace",
+)
+_CRITICAL_LEVELS = ("fatal", "critical", "crit", "panic", "emerg", "emergency", "alert")
+_ERROR_LEVELS = ("error", "err", "severe") + _CRITICAL_LEVELS
+
+# Prefix check on the raw text: a level key with an error value, or a stack key with a
+# non-empty value. Escaped quotes inside string values (\"level\") cannot match. The
+# lookahead lets the many other quotes of a line fail on their first character.
+_RE_ERROR_SIGNAL = re.compile(
+    r'"(?=' + keyword_regex(_LEVEL_KEYS + _STACK_KEYS) + r')'
+    r'(?:(?:' + keyword_regex(_LEVEL_KEYS) + r')"\s*:\s*(?:"(?i:' + "|".join(_ERROR_LEVELS) + r')"|[5-9]\d\b)'
+    r'|(?:' + keyword_regex(_STACK_KEYS) + r')"\s*:\s*(?!null\b|false\b|""|\[\]|\{\}))'
+)
+
+# Fields shown in the email: at most this many, values cut to this length.
+_MAX_FIELDS = 30
+_MAX_VALUE = 200
+
+DEFAULT_FINGERPRINT_FIELDS = ("logger", "message", "exception")
+
+
+@dataclass(frozen=True)
+class JsonRecord:
+    """/**
+     * @class JsonRecord
+     * @property {string} severity "error" or "critical"
+     * @property {string} message
+     * @property {string} stack exception/stack text ("" if none)
+     * @property {Array<[string, string]>} fields flattened scalar fields for the email
+     * @property {string} fp_source text the fingerprint is computed from
+     */"""
+
+    severity: str
+    message: str
+    stack: str
+    fields: tuple[tuple[str, str], ...]
+    fp_source: str
+
+
+def is_json_line(line: str) -> bool:
+    """/**
+     * @param {string} line
+     * @returns {boolean} true if the line looks like a JSON object (not parsed)
+     */"""
+
+    return line.startswith('{"') or line.startswith('{ "')
+
+
+def may_be_error(line: str) -> bool:
+    """/**
+     * @param {string} line
+     * @returns {boolean} false if the line certainly is not an error record
+     */"""
+
+    return _RE_ERROR_SIGNAL.search(line) is not None
+
+
+def error_line_indexes(body: str) -> list[int]:
+    """/**
+     * @description may_be_error() over a whole chunk: one regex sweep, hits mapped to
+     * line indexes (like detector._candidate_lines).
+     *
+     * @param {string} body newline-terminated lines
+     * @returns {Array<number>} sorted, unique line indexes
+     */"""
+
+    out: list[int] = []
+    idx = 0
+    last = 0
+    for m in _RE_ERROR_SIGNAL.finditer(body):
+        pos = m.start()
+        idx += body.count("\n", last, pos)
+        last = pos
+        if not out or out[-1] != idx:
+            out.append(idx)
+    return out
+
+
+def _lookup(obj: dict, key: str) -> Any:
+    """/**
+     * @description Top-level key, else a dotted path into nested objects.
+     * @param {Object} obj
+     * @param {string} key
+     * @returns {*} null if missing
+     */"""
+
+    if key in obj:
+        return obj[key]
+    if "." not in key:
+        return None
+    cur: Any = obj
+    for part in key.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return None
+        cur = cur[part]
+    return cur
+
+
+def _first(obj: dict, keys: tuple[str, ...]) -> tuple[Optional[str], Any]:
+    """/**
+     * @returns {[?string, *]} (key, value) of the first present, non-empty key
+     */"""
+
+    for key in keys:
+        value = _lookup(obj, key)
+        # Identity checks: 0 == False, and "code": 0 is a value.
+        if value is None or value is False or value in ("", [], {}):
+            continue
+        return key, value
+    return None, None
+
+
+def _text(value: Any) -> str:
+    """/**
+     * @param {*} value
+     * @returns {string}
+     */"""
+
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        # exc_info / stack as a list of lines.
+        return "".join(v if v.endswith("\n") else v + "\n" for v in value)
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _severity(level: Any) -> Optional[str]:
+    """/**
+     * @param {*} level
+     * @returns {?string} "error" / "critical", null if the level is below error
+     */"""
+
+    if isinstance(level, bool):
+        return None
+    if isinstance(level, (int, float)):
+        # pino / bunyan: 50 error, 60 fatal.
+        return "critical" if level >= 60 else "error" if level >= 50 else None
+    name = str(level).strip().lower()
+    if name in _CRITICAL_LEVELS:
+        return "critical"
+    return "error" if name in _ERROR_LEVELS else None
+
+
+def _flatten(obj: dict, skip: set[str]) -> tuple[tuple[str, str], ...]:
+    """/**
+     * @description Scalar fields, nested objects one level deep as "a.b".
+     * @param {Object} obj
+     * @param {Set<string>} skip keys already shown elsewhere in the email
+     * @returns {Array<[string, string]>}
+     */"""
+
+    out: list[tuple[str, str]] = []
+    for key, value in obj.items():
+        items = value.items() if isinstance(value, dict) else [(None, value)]
+        for sub, v in items:
+            name = key if sub is None else f"{key}.{sub}"
+            if name in skip or isinstance(v, (dict, list)) or v is None:
+                continue
+            out.append((name, str(v)[:_MAX_VALUE]))
+            if len(out) >= _MAX_FIELDS:
+                return tuple(out)
+    return tuple(out)
+
+
+def parse_error_record(line: str, fingerprint_fields: tuple[str, ...] = DEFAULT_FINGERPRINT_FIELDS) -> Optional[JsonRecord]:
+    """/**
+     * @param {string} line one JSON object
+     * @param {Array<string>} fingerprint_fields field names (dotted paths allowed); "level",
+     *   "message" and "exception" stand for whichever alias the record uses
+     * @returns {?JsonRecord} null if the line is not an error record
+     * @throws {ValueError} if the line passed the prefix check but is not a JSON object
+     */"""
+
+    if not may_be_error(line):
+        return None
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError("not a JSON object")
+    level_key, level = _first(obj, _LEVEL_KEYS)
+    stack_key, stack_value = _first(obj, _STACK_KEYS)
+    stack = _text(stack_value) if stack_key is not None else ""
+    if level_key is not None:
+        severity = _severity(level)
+        if severity is None:
+            return None
+    elif stack:
+        severity = "error"
+    else:
+        return None
+    message_key, message_value = _first(obj, _MESSAGE_KEYS)
+    message = _text(message_value) if message_key is not None else ""
+    if not message and stack:
+        message = stack.strip().splitlines()[-1]
+    aliases = {"level": level_key, "message": message_key, "exception": stack_key}
+    parts = []
+    for name in fingerprint_fields:
+        key = aliases.get(name, name)
+        value = _lookup(obj, key) if key else None
+        if value is not None:
+            parts.append(f"{name}={_text(value)}")
+    skip = {k for k in (message_key, stack_key) if k}
+    return JsonRecord(
+        severity=severity,
+        message=message.strip(),
+        stack=stack,
+        fields=_flatten(obj, skip),
+        fp_source="\n".join(parts) or line,
+    )
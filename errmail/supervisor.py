@@ -0,0 +1,185 @@
+"""/**
+ * @file supervisor.py
+ * @description Run many commands under one errmail process (`errmail supervise`).
+ *
+ * All children share one event loop and one Notifier (queue, SMTP worker, cooldown
+ * table) and one compiled rule set; each child keeps its own StderrDetector.
+ */"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import shlex
+import signal
+import sys
+
+from .config import ErrmailConfig
+from .detector import ErrorEvent, detector_for
+from .metrics import start_exporter
+from .profiling import start_profiler, stop_profiler
+from .notifier import Notifier
+from .rules import RuleSet, load_ruleset_quietly
+from .runner import notify_nonzero_exit, run_child, use_pidfd_child_watcher
+
+
+@dataclass(frozen=True)
+class ChildSpec:
+    """/**
+     * @class ChildSpec
+     * @property {string} service
+     * @property {Array<string>} command
+     */"""
+
+    service: str
+    command: list[str]
+
+
+def parse_commands_file(path: str) -> list[ChildSpec]:
+    """/**
+     * @description Parse a commands file. One child per line: `service = command args...`
+     * (shell-style quoting). Blank lines and lines starting with # are ignored.
+     *
+     * @param {string} path
+     * @returns {Array<ChildSpec>}
+     * @throws {ValueError} on a malformed line
+     */"""
+
+    specs: list[ChildSpec] = []
+    text = Path(path).expanduser().read_text(encoding="utf-8")
+    for lineno, raw in enumerate(text.splitlines(), start=1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=" not in line:
+            raise ValueError(f"{path}:{lineno}: expected 'service = command...'")
+        name, cmd = line.split("=", 1)
+        service = name.strip()
+        command = shlex.split(cmd)
+        if not service or not command:
+            raise ValueError(f"{path}:{lineno}: empty service name or command")
+        specs.append(ChildSpec(service=service, command=command))
+    return specs
+
+
+async def _run_one(
+    spec: ChildSpec,
+    *,
+    cfg: ErrmailConfig,
+    notifier: Notifier,
+    cwd: str,
+    running: set[asyncio.SubprocessTransport],
+    verbose: bool,
+    rules: RuleSet | None,
+) -> int:
+    """/**
+     * @returns {Promise<number>} exit code (127 if the command could not be started)
+     */"""
+
+    detector = detector_for(cfg, rules)
+    seen_any_event = False
+
+    def on_event(evt: ErrorEvent, pid: int) -> None:
+        nonlocal seen_any_event
+        seen_any_event = True
+        notifier.enqueue(
+            evt,
+            pid=pid,
+            exit_code=None,
+            tail=detector.tail_snapshot,
+            service=spec.service,
+            command=spec.command,
+        )
+
+    started: list[asyncio.SubprocessTransport] = []
+
+    def on_start(transport: asyncio.SubprocessTransport) -> None:
+        started.append(transport)
+        running.add(transport)
+
+    try:
+        pid, exit_code = await run_child(
+            spec.command,
+            detector=detector,
+            on_event=on_event,
+            cwd=cwd,
+            on_start=on_start,
+            pty=cfg.pty,
+            verbose=verbose,
+        )
+    except OSError as e:
+        if verbose:
+            print(f"[errmail] {spec.service}: failed to start: {type(e).__name__}: {e}", file=sys.stderr)
+        pid, exit_code = None, 127
+    finally:
+        running.difference_update(started)
+
+    if verbose:
+        print(f"[errmail] {spec.service} exited with code {exit_code}", file=sys.stderr)
+    notify_nonzero_exit(notifier, detector, spec.command, pid, exit_code, seen_any_event, service=spec.service)
+    return exit_code
+
+
+async def _supervise_async(specs: list[ChildSpec], *, cfg: ErrmailConfig, cwd: str, verbose: bool) -> int:
+    """/**
+     * @returns {Promise<number>}
+     */"""
+
+    use_pidfd_child_watcher()
+    rules = load_ruleset_quietly(cfg, verbose=verbose)
+    notifier = Notifier(
+        cfg, command=["errmail", "supervise"], cwd=cwd, verbose=verbose, routes=rules.routes if rules else ()
+    )
+    running: set[asyncio.SubprocessTransport] = set()
+
+    def forward(signum: int) -> None:
+        # Let children shut down on their own; we exit once they have.
+        for transport in list(running):
+            try:
+                transport.send_signal(signum)
+            except Exception:  # noqa: BLE001
+                pass
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, forward, signum)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    codes = await asyncio.gather(
+        *(
+            _run_one(spec, cfg=cfg, notifier=notifier, cwd=cwd, running=running, verbose=verbose, rules=rules)
+            for spec in specs
+        )
+    )
+    # Best-effort: allow background email thread to process queued notifications.
+    await loop.run_in_executor(None, notifier.flush, 2.0)
+    # close() may wait for the workers: keep it off the loop too.
+    await loop.run_in_executor(None, notifier.close)
+    for code in codes:
+        if code != 0:
+            return code
+    return 0
+
+
+def supervise(specs: list[ChildSpec], *, cfg: ErrmailConfig, cwd: str | None = None, verbose: bool = False) -> int:
+    """/**
+     * @description Run all children concurrently until every one has exited.
+     * @param {Array<ChildSpec>} specs
+     * @param {ErrmailConfig} cfg
+     * @param {?string} cwd
+     * @param {boolean} verbose
+     * @returns {number} 0 if all children exited 0, else the first non-zero exit code (in file order)
+     */"""
+
+    exporter = start_exporter(cfg, verbose=verbose)
+    profiler = start_profiler(cfg)
+    try:
+        return asyncio.run(_supervise_async(specs, cfg=cfg, cwd=cwd or os.getcwd(), verbose=verbose))
+    finally:
+        stop_profiler(profiler, verbose=verbose)
+        if exporter is not None:
+            exporter.close()
@@ -0,0 +1,209 @@
+"""/**
+ * @file transports.py
+ * @description Delivery transports behind Notifier (ERRMAIL_TRANSPORT):
+ * - "smtp": SMTP relay over TCP (SmtpSession, mailer.py), the default
+ * - "sendmail": pipe each message to the local MTA (`sendmail -t -oi`)
+ * - "lmtp": LMTP over a Unix socket (e.g. Dovecot, Postfix lmtp), one pooled connection
+ * - "maildir" / "mbox": write messages to local files, no network at all; the stand-in
+ *   for end-to-end tests and delivery benchmarks
+ *
+ * Like mailer.py, the modules a transport needs (smtplib, subprocess, mailbox) are
+ * imported on first send.
+ */"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from .config import ErrmailConfig
+from .mailer import SmtpSession, Transport
+
+if TYPE_CHECKING:
+    from email.message import EmailMessage
+    import mailbox
+    import smtplib
+
+TRANSPORTS = ("smtp", "sendmail", "lmtp", "maildir", "mbox")
+
+
+def _recipients(msg: EmailMessage) -> list[str]:
+    """/**
+     * @param {EmailMessage} msg
+     * @returns {Array<string>} addresses in To/Cc/Bcc
+     */"""
+
+    from email.utils import getaddresses
+
+    return [addr for _, addr in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", []) + msg.get_all("Bcc", [])) if addr]
+
+
+class SendmailTransport(Transport):
+    """/**
+     * @class SendmailTransport
+     * @description `sendmail -t -oi`: recipients from the headers, a lone "." line is not
+     * end of input. The local MTA queues and retries, so this returns as soon as it
+     * accepted the message.
+     *
+     * @param {string} path sendmail binary
+     * @param {number} timeout_seconds
+     */"""
+
+    def __init__(self, path: str, timeout_seconds: int = 10) -> None:
+        self._path = path
+        self._timeout = timeout_seconds
+
+    def send(self, msg: EmailMessage) -> None:
+        import subprocess
+
+        proc = subprocess.run(
+            [self._path, "-t", "-oi"],
+            input=msg.as_bytes(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=self._timeout,
+            check=False,
+        )
+        if proc.returncode != 0:
+            detail = proc.stderr.decode("utf-8", "replace").strip().splitlines()
+            raise RuntimeError(f"{self._path} exited with {proc.returncode}" + (f": {detail[-1]}" if detail else ""))
+
+
+class LmtpSession(SmtpSession):
+    """/**
+     * @class LmtpSession
+     * @description SmtpSession over LMTP on a Unix socket (no TLS/AUTH). LMTP answers DATA
+     * once per recipient and smtplib reads a single reply, so every recipient gets its
+     * own transaction. Delivery status is kept per recipient: a recipient that accepted
+     * the message is not sent it again when the connection is re-established, and one
+     * that refused it does not stop the others (see Transport.refused).
+     *
+     * @param {ErrmailConfig} cfg uses cfg.lmtp_socket
+     * @param {number} timeout_seconds
+     */"""
+
+    def __init__(self, cfg: ErrmailConfig, timeout_seconds: int = 10) -> None:
+        super().__init__(cfg, timeout_seconds=timeout_seconds)
+        # Recipients of the current message that do not have it yet.
+        self._todo: list[str] = []
+
+    def send(self, msg: EmailMessage) -> None:
+        self._todo = _recipients(msg)
+        self.refused = []
+        total = len(self._todo)
+        try:
+            super().send(msg)
+        except Exception:
+            if len(self._todo) < total:
+                self.refused = list(self._todo)
+            raise
+
+    def _connect(self) -> smtplib.SMTP:
+        import smtplib
+
+        s = smtplib.LMTP(self._cfg.lmtp_socket or "", timeout=self._timeout)
+        self.connects += 1
+        return s
+
+    def _transmit(self, s: smtplib.SMTP, msg: EmailMessage) -> None:
+        import smtplib
+
+        refused: dict[str, tuple[int, bytes]] = {}
+        for rcpt in list(self._todo):
+            try:
+                s.send_message(msg, to_addrs=[rcpt])
+            except smtplib.SMTPRecipientsRefused as e:
+                refused.update(e.recipients)
+                continue
+            except smtplib.SMTPDataError as e:
+                refused[rcpt] = (e.smtp_code, e.smtp_error)
+                continue
+            self._todo.remove(rcpt)
+        if refused:
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+
+class MaildirTransport(Transport):
+    """/**
+     * @class MaildirTransport
+     * @description Deliver into a Maildir (tmp/ then rename into new/, so readers never see
+     * a partial message). Safe with concurrent errmail processes.
+     *
+     * @param {string} path created if missing
+     */"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._box: mailbox.Maildir | None = None
+
+    def send(self, msg: EmailMessage) -> None:
+        import mailbox
+        import os
+
+        if self._box is None:
+            # Not Maildir(create=True): its mkdir races with other routes and processes
+            # creating the same Maildir.
+            for sub in ("tmp", "new", "cur"):
+                os.makedirs(os.path.join(self._path, sub), mode=0o700, exist_ok=True)
+            self._box = mailbox.Maildir(self._path, factory=None, create=False)
+        self._box.add(msg)
+
+    def close(self) -> None:
+        self._box = None
+
+
+class MboxTransport(Transport):
+    """/**
+     * @class MboxTransport
+     * @description Append to an mbox file under an fcntl lock (as MTAs and mail readers
+     * do), "From " lines in the body escaped as ">From ", fsynced after every message.
+     * Appends directly instead of going through mailbox.mbox, which scans the whole
+     * file on its first add.
+     *
+     * @param {string} path created if missing
+     */"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+
+    def send(self, msg: EmailMessage) -> None:
+        from email.generator import BytesGenerator
+        import fcntl
+        import io
+        import os
+        import time
+
+        buf = io.BytesIO()
+        buf.write(f"From MAILER-DAEMON {time.asctime(time.gmtime())}\n".encode("ascii"))
+        BytesGenerator(buf, mangle_from_=True).flatten(msg)
+        data = buf.getvalue()
+        data += b"\n" if data.endswith(b"\n") else b"\n\n"
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        with open(self._path, "ab") as f:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            try:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+def open_transport(cfg: ErrmailConfig, timeout_seconds: int = 10) -> Transport:
+    """/**
+     * @param {ErrmailConfig} cfg
+     * @param {number} timeout_seconds
+     * @returns {Transport} for cfg.transport (nothing is connected or opened yet)
+     */"""
+
+    from pathlib import Path
+
+    kind = cfg.transport
+    if kind == "sendmail":
+        return SendmailTransport(cfg.sendmail_path, timeout_seconds=timeout_seconds)
+    if kind == "lmtp":
+        return LmtpSession(cfg, timeout_seconds=timeout_seconds)
+    if kind == "maildir":
+        return MaildirTransport(str(Path(cfg.sink_path or "").expanduser()))
+    if kind == "mbox":
+        return MboxTransport(str(Path(cfg.sink_path or "").expanduser()))
+    return SmtpSession(cfg, timeout_seconds=timeout_seconds)
@@ -6,9 +6,60 @@
 from __future__ import annotations
 
 from collections import deque
+from functools import lru_cache
 import hashlib
 import re
-from typing import Deque, Iterable
+from typing import Deque, Iterable, Union
+
+
+class TailSnapshot:
+    """/**
+     * @class TailSnapshot
+     * @description Immutable handle on the ring buffer contents at one point in time.
+     * Holds references to the line strings only; the joined text is built on first
+     * access (i.e. when an email is actually rendered) and cached.
+     *
+     * @param {Array<string>} lines
+     */"""
+
+    __slots__ = ("_lines", "_text", "_nbytes")
+
+    def __init__(self, lines: tuple[str, ...]) -> None:
+        self._lines = lines
+        self._text: str | None = None
+        self._nbytes = -1
+
+    @property
+    def lines(self) -> tuple[str, ...]:
+        """/**
+         * @returns {Array<string>}
+         */"""
+
+        return self._lines
+
+    @property
+    def text(self) -> str:
+        """/**
+         * @returns {string}
+         */"""
+
+        if self._text is None:
+            self._text = "".join(self._lines)
+        return self._text
+
+    @property
+    def nbytes(self) -> int:
+        """/**
+         * @description Size of the text in characters, without building it (cached).
+         * @returns {number}
+         */"""
+
+        if self._nbytes < 0:
+            self._nbytes = len(self._text) if self._text is not None else sum(map(len, self._lines))
+        return self._nbytes
+
+    def __str__(self) -> str:
+        return self.text
 
 
 class RingBuffer:
@@ -21,6 +72,7 @@ class RingBuffer:
 
     def __init__(self, max_lines: int) -> None:
         self._buf: Deque[str] = deque(maxlen=max_lines)
+        self._snap: TailSnapshot | None = None
 
     def push(self, line: str) -> None:
         """/**
@@ -28,14 +80,26 @@ class RingBuffer:
          */"""
 
         self._buf.append(line)
+        self._snap = None
 
     def extend(self, lines: Iterable[str]) -> None:
         """/**
          * @param {Iterable<string>} lines
          */"""
 
-        for ln in lines:
-            self._buf.append(ln)
+        self._buf.extend(lines)
+        self._snap = None
+
+    def snapshot(self) -> TailSnapshot:
+        """/**
+         * @description Cheap immutable snapshot (no string building). Reused until the
+         * buffer changes, so all events of one batch share a single snapshot.
+         * @returns {TailSnapshot}
+         */"""
+
+        if self._snap is None:
+            self._snap = TailSnapshot(tuple(self._buf))
+        return self._snap
 
     def tail(self) -> str:
         """/**
@@ -45,27 +109,52 @@ class RingBuffer:
         return "".join(self._buf)
 
 
-_RE_HEX_ADDR = re.compile(r"0x[0-9a-fA-F]+")
-_RE_LINE_NO = re.compile(r"\bline\s+\d+\b")
-_RE_INT = re.compile(r"\b\d+\b")
+def tail_text(tail: "Union[str, TailSnapshot]") -> str:
+    """/**
+     * @param {string|TailSnapshot} tail
+     * @returns {string}
+     */"""
+
+    return tail if isinstance(tail, str) else tail.text
+
+
+# One pass equivalent to the former three sequential subs (hex address, "line N",
+# stand-alone integer). Those passes could see word boundaries created by an earlier
+# replacement ("0xfline 5" -> "0x?line 5"), so a hex match also takes an immediately
+# following "line N" or digit run to reproduce that output exactly. The leading
+# lookahead lets the engine skip most positions without trying every branch.
+_RE_NORMALIZE = re.compile(
+    r"(?=[\dl])(?:(0x[0-9a-fA-F]+)(?:(line\s+\d+\b)|(\d+\b))?|(\bline\s+\d+\b)|(\b\d+\b))"
+)
+# Replacement by m.lastindex: hex, hex+line, hex+int, line, int.
+_NORMALIZE_REPL = (None, "0x?", "0x?line ?", "0x??", "line ?", "?")
+
+
+def _normalize_match(m: "re.Match[str]") -> str:
+    """/**
+     * @param {re.Match} m
+     * @returns {string}
+     */"""
+
+    return _NORMALIZE_REPL[m.lastindex]  # type: ignore[index]
 
 
 def normalize_for_fingerprint(text: str) -> str:
     """/**
+     * @description Mask volatile parts (hex addresses, line numbers, stand-alone integers).
+     * Only stand-alone integers are replaced to avoid over-normalizing.
+     *
      * @param {string} text
      * @returns {string}
      */"""
 
-    s = text.strip()
-    s = _RE_HEX_ADDR.sub("0x?", s)
-    s = _RE_LINE_NO.sub("line ?", s)
-    # Avoid over-normalizing: only replace stand-alone integers (counts/ports/etc.)
-    s = _RE_INT.sub("?", s)
-    return s
+    return _RE_NORMALIZE.sub(_normalize_match, text.strip())
 
 
+@lru_cache(maxsize=4096)
 def fingerprint(text: str) -> str:
     """/**
+     * @description Memoized: repeated identical excerpts skip normalization and hashing.
      * @param {string} text
      * @returns {string} short fingerprint
      */"""
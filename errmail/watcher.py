@@ -0,0 +1,448 @@
+"""/**
+ * @file watcher.py
+ * @description `errmail watch`: follow log files through the StderrDetector/Notifier pipeline.
+ *
+ * - Every file is polled (default: once a second) and read in 1MB chunks until EOF, so
+ *   catching up after downtime costs a few syscalls per MB instead of one per line.
+ * - Rotation (the path now names another inode): the old file is drained to EOF, then
+ *   the new one is read from its start. Truncation (size below our offset, e.g.
+ *   copytruncate): read again from the start.
+ * - The offset of the last complete line is checkpointed (atomic JSON rewrite) together
+ *   with the file's device/inode and a hash of its first bytes. A restart resumes exactly
+ *   there: no re-alerts, no missed lines. If the file was rotated meanwhile, the rotated
+ *   copy ("app.log.1", "app.log-20240501", ...) is drained from the saved offset first.
+ *   Files without a checkpoint start at their end (like tail -f) unless from_start.
+ */"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import signal
+import threading
+import time
+from typing import Optional
+
+from .config import ErrmailConfig
+from .detector import ErrorEvent, StderrDetector, detector_for
+from .metrics import start_exporter
+from .notifier import Notifier
+from .profiling import start_profiler, stop_profiler
+from .rules import RuleSet, load_ruleset_quietly
+
+_READ_SIZE = 1024 * 1024
+# Bytes hashed to tell "same file, appended" from "same inode, rewritten".
+_HEAD_BYTES = 256
+# Checkpoint at most this often while running (and always at exit).
+_CHECKPOINT_SECONDS = 5.0
+
+
+def default_watch_state_path() -> str:
+    """/**
+     * @returns {string}
+     */"""
+
+    base = os.getenv("XDG_STATE_HOME") or str(Path.home() / ".local" / "state")
+    return str(Path(base) / "errmail" / "watch-offsets.json")
+
+
+def _head_hash(fd: int, length: int) -> str:
+    """/**
+     * @param {number} fd
+     * @param {number} length
+     * @returns {string}
+     */"""
+
+    return hashlib.sha1(os.pread(fd, length, 0)).hexdigest()
+
+
+class _WatchedFile:
+    """/**
+     * @class _WatchedFile
+     * @description One followed path: the open file, its read position and the offset of
+     * the last complete line handed to the detector.
+     *
+     * @param {string} path absolute path
+     * @param {StderrDetector} detector
+     */"""
+
+    def __init__(self, path: str, detector: StderrDetector) -> None:
+        self.path = path
+        self.detector = detector
+        self.fd: Optional[int] = None
+        self.dev = 0
+        self.ino = 0
+        self.pos = 0
+        self.committed = 0
+        self.head_len = 0
+        self.head = ""
+
+    def open(self, offset: int) -> bool:
+        """/**
+         * @param {number} offset where to start reading (clamped to the file size)
+         * @returns {boolean} false if the file does not exist (yet)
+         */"""
+
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        st = os.fstat(fd)
+        self.fd, self.dev, self.ino = fd, st.st_dev, st.st_ino
+        self.pos = self.committed = min(offset, st.st_size)
+        os.lseek(fd, self.pos, os.SEEK_SET)
+        self.head_len, self.head = 0, ""
+        self._update_head()
+        return True
+
+    def close(self) -> None:
+        """/**
+         * @returns {void}
+         */"""
+
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _update_head(self) -> None:
+        """/**
+         * @description (Re)hash the head while the file is shorter than _HEAD_BYTES.
+         */"""
+
+        if self.fd is not None and self.head_len < _HEAD_BYTES:
+            n = min(_HEAD_BYTES, self.committed)
+            if n != self.head_len:
+                self.head_len, self.head = n, _head_hash(self.fd, n)
+
+    def read_available(self, buf: bytearray) -> list[ErrorEvent]:
+        """/**
+         * @description Read to EOF in large chunks and feed the detector.
+         * @param {bytearray} buf reusable read buffer
+         * @returns {Array<ErrorEvent>}
+         */"""
+
+        events: list[ErrorEvent] = []
+        if self.fd is None:
+            return events
+        view = memoryview(buf)
+        while True:
+            n = os.readv(self.fd, [buf])
+            if not n:
+                break
+            # Only complete lines count as consumed; "\n" is one byte in ASCII-compatible
+            # encodings, so the raw offset of the last one is exact.
+            nl = buf.rfind(b"\n", 0, n)
+            if nl >= 0:
+                self.committed = self.pos + nl + 1
+            self.pos += n
+            events.extend(self.detector.push_chunk(view[:n]))
+            if n < len(buf):
+                break
+        self._update_head()
+        return events
+
+    def check_replaced(self) -> str:
+        """/**
+         * @returns {string} "" (unchanged), "rotated" or "truncated"
+         */"""
+
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # Moved away and not recreated yet: keep reading the old inode.
+            return ""
+        if (st.st_dev, st.st_ino) != (self.dev, self.ino):
+            return "rotated"
+        if st.st_size < self.pos:
+            return "truncated"
+        # Truncated and rewritten past our offset between two polls.
+        if self.head_len and _head_hash(self.fd, self.head_len) != self.head:  # type: ignore[arg-type]
+            return "truncated"
+        return ""
+
+    def checkpoint(self) -> dict:
+        """/**
+         * @returns {Object}
+         */"""
+
+        return {"dev": self.dev, "ino": self.ino, "offset": self.committed, "head_len": self.head_len, "head": self.head}
+
+
+def _load_state(path: str) -> dict:
+    """/**
+     * @param {string} path
+     * @returns {Object} absolute log path -> checkpoint (empty if missing or unreadable)
+     */"""
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get("files", {}) if isinstance(data, dict) else {}
+
+
+def _save_state(path: str, files: dict) -> None:
+    """/**
+     * @description Atomic rewrite (temp file + fsync + rename).
+     * @param {string} path
+     * @param {Object} files
+     */"""
+
+    p = Path(path)
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.tmp")
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": files}, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, p)
+    except OSError:
+        return
+
+
+def _find_rotated(path: str, dev: int, ino: int) -> Optional[str]:
+    """/**
+     * @description Look next to `path` for the file that used to be `path` (same inode).
+     * @param {string} path
+     * @param {number} dev
+     * @param {number} ino
+     * @returns {?string}
+     */"""
+
+    directory, base = os.path.split(path)
+    try:
+        entries = os.scandir(directory or ".")
+    except OSError:
+        return None
+    with entries:
+        for entry in entries:
+            if entry.name == base or not entry.name.startswith(base):
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) == (dev, ino):
+                return entry.path
+    return None
+
+
+class Watcher:
+    """/**
+     * @class Watcher
+     * @description Follow several files with one Notifier; each file has its own detector.
+     *
+     * @param {Array<string>} paths
+     * @param {ErrmailConfig} cfg
+     * @param {Notifier} notifier
+     * @param {string} state_path checkpoint file
+     * @param {?RuleSet} rules
+     * @param {boolean} from_start read files without a checkpoint from the beginning
+     */"""
+
+    def __init__(
+        self,
+        paths: list[str],
+        *,
+        cfg: ErrmailConfig,
+        notifier: Notifier,
+        state_path: str,
+        rules: RuleSet | None = None,
+        from_start: bool = False,
+    ) -> None:
+        self._cfg = cfg
+        self._notifier = notifier
+        self._state_path = state_path
+        self._state = _load_state(state_path)
+        self._buf = bytearray(_READ_SIZE)
+        self._files = [_WatchedFile(os.path.abspath(os.path.expanduser(p)), detector_for(cfg, rules)) for p in paths]
+        self._from_start = from_start
+        self._last_save = time.monotonic()
+        # Offsets moved since the last save().
+        self._dirty = False
+
+    def start(self) -> None:
+        """/**
+         * @description Open every file at its checkpoint (draining a rotated copy first).
+         */"""
+
+        for wf in self._files:
+            saved = self._state.get(wf.path)
+            if saved is None:
+                if wf.open(0) and not self._from_start:
+                    wf.pos = wf.committed = os.lseek(wf.fd, 0, os.SEEK_END)  # type: ignore[arg-type]
+                continue
+            self._resume(wf, saved)
+
+    def _resume(self, wf: _WatchedFile, saved: dict) -> None:
+        """/**
+         * @param {_WatchedFile} wf
+         * @param {Object} saved checkpoint
+         */"""
+
+        offset = int(saved.get("offset", 0))
+        try:
+            st = os.stat(wf.path)
+            same = (st.st_dev, st.st_ino) == (saved.get("dev"), saved.get("ino"))
+        except OSError:
+            same = False
+        if not same:
+            old = _find_rotated(wf.path, saved.get("dev", -1), saved.get("ino", -1))
+            if old is not None:
+                # Lines written after our checkpoint but before the rotation.
+                drained = _WatchedFile(old, wf.detector)
+                if drained.open(offset):
+                    self._dispatch(wf, drained.read_available(self._buf))
+                    drained.close()
+                self._dispatch(wf, wf.detector.finish())
+            wf.open(0)
+            return
+        if not wf.open(offset):
+            return
+        head_len = int(saved.get("head_len", 0))
+        if wf.pos < offset or (head_len and _head_hash(wf.fd, head_len) != saved.get("head")):  # type: ignore[arg-type]
+            # Same inode but shorter or rewritten: truncated while we were down.
+            os.lseek(wf.fd, 0, os.SEEK_SET)  # type: ignore[arg-type]
+            wf.pos = wf.committed = 0
+            wf.head_len, wf.head = 0, ""
+
+    def poll(self) -> bool:
+        """/**
+         * @description One pass over all files.
+         * @returns {boolean} true if any file had new data
+         */"""
+
+        busy = False
+        for wf in self._files:
+            if wf.fd is None:
+                # Not there at startup, or rotated away: a new file starts at 0.
+                if not wf.open(0):
+                    continue
+            before = wf.pos
+            # Check before reading: reading extends the head hash to the new content.
+            change = wf.check_replaced()
+            if change == "rotated":
+                # Drain the old inode to EOF, then start the new file from 0.
+                self._dispatch(wf, wf.read_available(self._buf))
+                wf.close()
+                wf.open(0)
+            if change:
+                # The old content ends here: its partial line, decoder state and open trace
+                # must not run on into the new content.
+                self._dispatch(wf, wf.detector.finish())
+            if change == "truncated":
+                os.lseek(wf.fd, 0, os.SEEK_SET)  # type: ignore[arg-type]
+                wf.pos = wf.committed = 0
+                wf.head_len, wf.head = 0, ""
+            self._dispatch(wf, wf.read_available(self._buf))
+            if wf.pos != before or change:
+                busy = True
+            elif wf.detector.pending:
+                # A Java/Go trace has no end marker: emit it once the file went quiet.
+                self._dispatch(wf, wf.detector.flush_pending())
+        self._dirty = self._dirty or busy
+        # Also on a quiet poll: the last burst before a lull must not wait for more input.
+        if self._dirty and time.monotonic() - self._last_save >= _CHECKPOINT_SECONDS:
+            self.save()
+        return busy
+
+    def _dispatch(self, wf: _WatchedFile, events: list[ErrorEvent]) -> None:
+        """/**
+         * @param {_WatchedFile} wf
+         * @param {Array<ErrorEvent>} events
+         */"""
+
+        for evt in events:
+            self._notifier.enqueue(
+                evt,
+                pid=None,
+                exit_code=None,
+                tail=wf.detector.tail_snapshot,
+                command=["errmail", "watch", wf.path],
+            )
+
+    def save(self) -> None:
+        """/**
+         * @returns {void}
+         */"""
+
+        for wf in self._files:
+            if wf.fd is not None:
+                self._state[wf.path] = wf.checkpoint()
+        _save_state(self._state_path, self._state)
+        self._last_save = time.monotonic()
+        self._dirty = False
+
+    def close(self) -> None:
+        """/**
+         * @description Emit open traces, checkpoint, close files. A trailing partial line is
+         * not consumed: it is read again (complete) by the next run.
+         */"""
+
+        for wf in self._files:
+            self._dispatch(wf, wf.detector.flush_pending())
+        self.save()
+        for wf in self._files:
+            wf.close()
+
+
+def watch(
+    paths: list[str],
+    *,
+    cfg: ErrmailConfig,
+    state_path: str | None = None,
+    interval: float = 1.0,
+    from_start: bool = False,
+    once: bool = False,
+    verbose: bool = False,
+) -> int:
+    """/**
+     * @description Follow files until SIGINT/SIGTERM (or one pass with once=true).
+     * @param {Array<string>} paths
+     * @param {ErrmailConfig} cfg
+     * @param {?string} state_path checkpoint file (default: cfg.watch_state_path or ~/.local/state/errmail/watch-offsets.json)
+     * @param {number} interval seconds between polls
+     * @param {boolean} from_start read files without a checkpoint from the beginning
+     * @param {boolean} once read everything available, then exit
+     * @param {boolean} verbose
+     * @returns {number} exit code
+     */"""
+
+    exporter = start_exporter(cfg, verbose=verbose)
+    profiler = start_profiler(cfg)
+    rules = load_ruleset_quietly(cfg, verbose=verbose)
+    notifier = Notifier(
+        cfg, command=["errmail", "watch", *paths], cwd=os.getcwd(), verbose=verbose, routes=rules.routes if rules else ()
+    )
+    watcher = Watcher(
+        paths,
+        cfg=cfg,
+        notifier=notifier,
+        state_path=state_path or cfg.watch_state_path or default_watch_state_path(),
+        rules=rules,
+        from_start=from_start,
+    )
+    stop = threading.Event()
+    previous = signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        watcher.start()
+        while True:
+            watcher.poll()
+            if once or stop.wait(interval):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        watcher.close()
+        # Best-effort: allow background email thread to process queued notifications.
+        notifier.flush(timeout_seconds=2.0)
+        notifier.close()
+        stop_profiler(profiler, verbose=verbose)
+        if exporter is not None:
+            exporter.close()
+    return 0
@@ -0,0 +1,27 @@
+"""/**
+ * @file test_bench.py
+ * @description `errmail bench` end to end on a few hundred lines per workload.
+ */"""
+
+from __future__ import annotations
+
+import json
+
+from errmail.bench import format_report, run_bench
+
+
+def test_small_run() -> None:
+    report = run_bench(["noise", "mixed"], lines=400)
+    # The report is what --json writes.
+    json.dumps(report)
+    assert list(report["workloads"]) == ["noise", "mixed"]
+    noise, mixed = report["workloads"]["noise"], report["workloads"]["mixed"]
+    assert noise["lines"] == mixed["lines"] == 400
+    assert noise["wrapped"]["events"] == 0
+    assert mixed["wrapped"]["events"] > 0
+    assert mixed["wrapped"]["emit_to_enqueue_ms"]["p50"] is not None
+    assert noise["throughput_ratio"] > 0
+    # Delivered to the stub relay; the repeats were held back by cooldown.
+    assert report["emails_delivered"] >= 1
+    text = format_report(report)
+    assert text.splitlines()[2].startswith("noise ")
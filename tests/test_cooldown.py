@@ -0,0 +1,61 @@
+"""/**
+ * @file test_cooldown.py
+ * @description Cooldown stores: bounded in memory, shared on disk.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+
+from errmail.config import load_config
+from errmail.cooldown import MemoryCooldownStore, SqliteCooldownStore, open_cooldown_store
+
+
+def test_memory_store_cooldown_and_forget() -> None:
+    store = MemoryCooldownStore(ttl_seconds=300)
+    assert store.should_send("k", 1000.0, 60)
+    assert not store.should_send("k", 1030.0, 60)
+    assert store.should_send("k", 1061.0, 60)
+    # forget() only undoes the send it names.
+    store.forget("k", 1000.0)
+    assert store.last_sent("k") == 1061.0
+    store.forget("k", 1061.0)
+    assert store.should_send("k", 1062.0, 60)
+
+
+def test_memory_store_is_bounded() -> None:
+    store = MemoryCooldownStore(max_entries=3, ttl_seconds=100)
+    for i in range(5):
+        store.mark(f"k{i}", 1000.0 + i)
+    assert len(store) == 3
+    assert store.last_sent("k0") is None and store.last_sent("k4") == 1004.0
+    # Past the TTL everything older goes at the next mark.
+    store.mark("late", 1200.0)
+    assert len(store) == 1
+
+
+def test_sqlite_store_is_shared(tmp_path) -> None:
+    path = str(tmp_path / "cooldown.sqlite3")
+    a = SqliteCooldownStore(path, ttl_seconds=300)
+    b = SqliteCooldownStore(path, ttl_seconds=300)
+    try:
+        assert a.should_send("k", 1000.0, 60)
+        # Another process (or the next run) sees the send.
+        assert not b.should_send("k", 1010.0, 60)
+        a.forget("k", 1000.0)
+        c = SqliteCooldownStore(path, ttl_seconds=300)
+        assert c.should_send("k", 1020.0, 60)
+        c.close()
+    finally:
+        a.close()
+        b.close()
+
+
+def test_open_store_falls_back_to_memory(tmp_path) -> None:
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cfg = replace(load_config(service="t"), cooldown_store="sqlite", cooldown_path=str(blocker / "cooldown.sqlite3"))
+    assert isinstance(open_cooldown_store(cfg), MemoryCooldownStore)
+    store = open_cooldown_store(replace(cfg, cooldown_path=str(tmp_path / "db" / "cooldown.sqlite3")))
+    assert isinstance(store, SqliteCooldownStore)
+    store.close()
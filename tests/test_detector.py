@@ -0,0 +1,141 @@
+"""/**
+ * @file test_detector.py
+ * @description Stack trace grouping and the batch prefilter: push_chunk() must find
+ * exactly the events push_line() finds, however the stream is cut into chunks.
+ */"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from errmail.detector import StderrDetector
+from errmail.rules import RuleSet, parse_rules
+
+_PYTHON = (
+    "Traceback (most recent call last):\n"
+    '  File "app.py", line 3, in <module>\n'
+    "    main()\n"
+    "ValueError: bad input\n"
+)
+_JAVA = (
+    'Exception in thread "main" java.lang.IllegalStateException: boom\n'
+    "\tat com.example.Foo.bar(Foo.java:12)\n"
+    "Caused by: java.io.IOException: closed\n"
+    "\t... 3 more\n"
+)
+_NODE = "TypeError: x is not a function\n    at f (/srv/app.js:1:5)\n    at main (/srv/app.js:9:1)\n"
+_GO = "panic: runtime error: index out of range\n\ngoroutine 1 [running]:\nmain.main()\n\t/srv/main.go:5 +0x1d\nexit status 2\n"
+_RUST = "thread 'main' panicked at src/main.rs:2:5:\nexplicit panic\nnote: run with `RUST_BACKTRACE=1`\n"
+
+
+def _kinds(events) -> list[tuple[str, str]]:
+    return [(e.kind, e.message) for e in events]
+
+
+@pytest.mark.parametrize(
+    "text, kind, message",
+    [
+        (_PYTHON, "python-traceback", "ValueError: bad input"),
+        (_JAVA, "java-exception", 'Exception in thread "main" java.lang.IllegalStateException: boom'),
+        (_NODE, "node-error", "TypeError: x is not a function"),
+        (_GO, "go-panic", "panic: runtime error: index out of range"),
+        (_RUST, "rust-panic", "thread 'main' panicked at src/main.rs:2:5: explicit panic"),
+    ],
+)
+def test_trace_is_one_event(text: str, kind: str, message: str) -> None:
+    det = StderrDetector()
+    events = det.push_chunk((text + "server listening\n").encode())
+    assert _kinds(events) == [(kind, message)]
+    assert events[0].excerpt.startswith(text.splitlines(keepends=True)[0])
+    assert "server listening" not in events[0].excerpt
+    assert not det.pending
+    assert det.finish() == []
+
+
+def test_trace_without_end_marker_waits_for_idle() -> None:
+    det = StderrDetector()
+    assert det.push_chunk(_NODE.encode()) == []
+    assert det.pending
+    assert _kinds(det.flush_pending()) == [("node-error", "TypeError: x is not a function")]
+
+
+def test_one_line_node_style_error_is_not_held_back() -> None:
+    det = StderrDetector()
+    # Followed by an ordinary line in the same read: judged as a single line at once.
+    events = det.push_chunk(b"ValueError: bad port\nretrying\n")
+    assert _kinds(events) == [("stderr-line", "ValueError: bad port")]
+    assert not det.pending
+    # With nothing after it yet, it might still be a header: it waits for the next line.
+    assert det.push_chunk(b"FooError: nope\n") == []
+    assert _kinds(det.push_chunk(b"ok\n")) == [("stderr-line", "FooError: nope")]
+
+
+_NOISE = [
+    "INFO request served in 12 ms\n",
+    "DEBUG cache hit\n",
+    "WARN slow query\n",
+    "ERROR db connection lost\n",
+    "ValueError: bad port\n",
+    "2024-01-01 FATAL out of memory\n",
+    "    at not.a.trace\n",
+    "ERR-1234 custom failure\n",
+    "DeprecationWarning: old api is deprecated\n",
+    "café ✓ déjà vu\n",
+    "\n",
+]
+
+
+def _corpus(rng: random.Random) -> str:
+    parts = [rng.choice(_NOISE + [_PYTHON, _JAVA, _NODE, _GO, _RUST]) for _ in range(400)]
+    return "".join(parts)
+
+
+def _by_line(det: StderrDetector, text: str) -> list:
+    events = []
+    for line in text.splitlines(keepends=True):
+        evt = det.push_line(line)
+        if evt is not None:
+            events.append(evt)
+    return events + det.flush_pending()
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("with_rules", [False, True])
+def test_push_chunk_matches_push_line(seed: int, with_rules: bool) -> None:
+    rng = random.Random(seed)
+    text = _corpus(rng)
+    rules = (
+        RuleSet(parse_rules("match kind=app /ERR-[0-9]{4}/\nignore /DeprecationWarning: .* is deprecated/\n", "t"))
+        if with_rules
+        else None
+    )
+
+    expected = _by_line(StderrDetector(rules=rules), text)
+
+    data = text.encode()
+    by_chunk = StderrDetector(rules=rules, encoding="utf-8")
+    got = []
+    pos = 0
+    while pos < len(data):
+        step = rng.randint(1, 4096)
+        got += by_chunk.push_chunk(data[pos : pos + step])
+        pos += step
+    got += by_chunk.finish()
+
+    assert [(e.kind, e.fp, e.message) for e in got] == [(e.kind, e.fp, e.message) for e in expected]
+    assert any(e.kind == "node-error" for e in got)
+    assert any(e.kind == "stderr-line" and e.message == "ValueError: bad port" for e in got)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_prefilter_skips_only_lines_that_cannot_match(seed: int) -> None:
+    text = _corpus(random.Random(seed))
+    unfiltered = StderrDetector()
+    # Every line through the detection regexes, as before the keyword prefilter.
+    unfiltered._full_scan = True
+    expected = _by_line(unfiltered, text)
+    got = _by_line(StderrDetector(), text)
+    assert [(e.kind, e.fp) for e in got] == [(e.kind, e.fp) for e in expected]
+    assert got
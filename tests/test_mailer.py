@@ -0,0 +1,91 @@
+"""/**
+ * @file test_mailer.py
+ * @description clip_lines: the clipped text never exceeds its byte budget. SmtpSession:
+ * one connection for many messages, re-established when the relay drops it.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import random
+import time
+
+from smtp_stub import StubSmtpServer
+
+from errmail.config import load_config
+from errmail.mailer import MailPayload, SmtpSession, clip_lines, send_mail
+
+
+def _text(rng: random.Random) -> list[str]:
+    """/**
+     * @param {random.Random} rng
+     * @returns {Array<string>} lines of mixed widths, ASCII and multi-byte
+     */"""
+
+    alphabet = ["x", "é", "错", "🙂"]
+    lines = []
+    for _ in range(rng.randint(0, 300)):
+        width = rng.choice((0, 1, 80, 120, 2000, 20000))
+        lines.append(rng.choice(alphabet) * width + "\n")
+    if lines and rng.random() < 0.5:
+        # Last line without its newline, as in a tail cut mid-line.
+        lines[-1] = lines[-1].rstrip("\n")
+    return lines
+
+
+def test_clip_lines_stays_within_budget() -> None:
+    rng = random.Random(1234)
+    for _ in range(500):
+        lines = _text(rng)
+        max_bytes = rng.choice((1024, 4096, 10000, 65536))
+        note = rng.choice(("", "; the full text is attached as stderr-tail.txt.gz"))
+        text, clipped = clip_lines(lines, max_bytes, note)
+        assert len(text.encode("utf-8")) <= max_bytes
+        if not clipped:
+            assert text == "".join(lines)
+
+
+def test_clip_lines_long_last_line() -> None:
+    lines = ["x" * 99 + "\n"] * 100 + ["y" * 50000 + "\n"]
+    text, clipped = clip_lines(lines, 10000)
+    assert clipped
+    assert len(text.encode("utf-8")) <= 10000
+    assert text.startswith("x" * 99 + "\n")
+    assert text.endswith("y" * 100 + "\n")
+
+
+def _smtp_cfg(port: int):
+    return replace(
+        load_config(service="t"),
+        smtp_host="127.0.0.1",
+        smtp_port=port,
+        smtp_tls=False,
+        mail_from="errmail@example.com",
+        mail_to="ops@example.com",
+    )
+
+
+def test_smtp_session_reuses_its_connection() -> None:
+    with StubSmtpServer() as srv:
+        cfg = _smtp_cfg(srv.port)
+        session = SmtpSession(cfg)
+        try:
+            for i in range(5):
+                assert send_mail(cfg, MailPayload(subject=f"s{i}", body="b"), session=session) is None
+        finally:
+            session.close()
+        assert (srv.connections, srv.messages, session.connects) == (1, 5, 1)
+
+
+def test_smtp_session_reconnects_after_idle_drop() -> None:
+    with StubSmtpServer(idle_timeout=0.2) as srv:
+        cfg = _smtp_cfg(srv.port)
+        # Not probed with NOOP first: the dropped connection is found out by the send itself.
+        session = SmtpSession(cfg, noop_after_seconds=60)
+        try:
+            assert send_mail(cfg, MailPayload(subject="s1", body="b"), session=session) is None
+            time.sleep(0.5)
+            assert send_mail(cfg, MailPayload(subject="s2", body="b"), session=session) is None
+        finally:
+            session.close()
+        assert (srv.connections, srv.messages, session.connects) == (2, 2, 2)
@@ -0,0 +1,88 @@
+"""/**
+ * @file test_metrics.py
+ * @description Prometheus text rendering, the /metrics endpoint and the stats file.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import urllib.error
+import urllib.request
+
+import pytest
+
+from errmail.config import load_config
+from errmail.metrics import Metrics, _Exporter, start_exporter
+
+
+def _samples(text: str) -> dict[str, str]:
+    """/**
+     * @param {string} text Prometheus exposition
+     * @returns {Object<string, string>} sample (name + labels) -> value
+     */"""
+
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+
+def test_render() -> None:
+    m = Metrics()
+    m.stderr_lines = 7
+    m.stdout_bytes = 100
+    m.send_seconds.observe(0.03)
+    m.send_seconds.observe(20.0)
+    m.detect_seconds.observe(2e-6, n=10)
+    m.register_gauge("errmail_queue_depth", "notifications waiting to be sent", lambda: 3)
+    m.register_gauge("errmail_broken", "a gauge that raises is left out", lambda: 1 / 0)
+    m.labeled_histogram("errmail_queue_seconds", "enqueue to delivered", "route", 'ops "a"').observe(0.2)
+    text = m.render()
+    s = _samples(text)
+    assert s["errmail_stderr_lines_total"] == "7"
+    assert s['errmail_forwarded_bytes_total{stream="stdout"}'] == "100"
+    # Buckets are cumulative.
+    assert s['errmail_send_seconds_bucket{le="0.025"}'] == "0"
+    assert s['errmail_send_seconds_bucket{le="0.05"}'] == "1"
+    assert s['errmail_send_seconds_bucket{le="30"}'] == "2"
+    assert s['errmail_send_seconds_bucket{le="+Inf"}'] == "2"
+    assert s["errmail_send_seconds_count"] == "2"
+    assert s["errmail_detect_seconds_per_line_count"] == "10"
+    assert s["errmail_queue_depth"] == "3"
+    assert "errmail_broken" not in text
+    assert s['errmail_queue_seconds_bucket{route="ops \\"a\\"",le="0.25"}'] == "1"
+    assert s['errmail_queue_seconds_count{route="ops \\"a\\""}'] == "1"
+    assert "# TYPE errmail_queue_seconds histogram" in text
+
+
+def test_not_configured() -> None:
+    assert start_exporter(load_config(service="t")) is None
+
+
+def test_http_endpoint() -> None:
+    m = Metrics()
+    m.events_detected = 4
+    exporter = _Exporter(replace(load_config(service="t"), metrics_addr="127.0.0.1:0"), m)
+    try:
+        port = exporter._server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert _samples(resp.read().decode())["errmail_events_detected_total"] == "4"
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+    finally:
+        exporter.close()
+
+
+def test_stats_file_is_written_on_close(tmp_path) -> None:
+    (tmp_path / "stats").mkdir()
+    path = tmp_path / "stats" / "errmail.prom"
+    m = Metrics()
+    exporter = _Exporter(replace(load_config(service="t"), metrics_file=str(path), metrics_interval=3600), m)
+    m.send_failures = 2
+    exporter.close()
+    assert _samples(path.read_text())["errmail_send_failures_total"] == "2"
+    # No temp file left behind.
+    assert [p.name for p in path.parent.iterdir()] == ["errmail.prom"]
+
+
+def test_bad_address_does_not_raise() -> None:
+    cfg = replace(load_config(service="t"), metrics_addr="127.0.0.1:notaport")
+    assert start_exporter(cfg) is None
@@ -0,0 +1,232 @@
+"""/**
+ * @file test_notifier.py
+ * @description Notifier admission (cooldown, the global rate limit, the bounded queue's
+ * overload policies) and what gets delivered, into a Maildir.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import email
+from email.message import EmailMessage
+import email.policy
+import gzip
+import queue
+import time
+
+import pytest
+
+from errmail.config import load_config
+from errmail.detector import ErrorEvent
+from errmail.notifier import _ITEM_OVERHEAD, Notifier, _BoundedQueue, _Pending, _TokenBucket
+from errmail.mailer import TAIL_ATTACHMENT
+from errmail.rules import Route
+
+
+def _cfg(**overrides):
+    base = {"mail_to": None, "spool": False, "cooldown_store": "memory", "digest_seconds": 0}
+    return replace(load_config(service="t"), **{**base, **overrides})
+
+
+def _mail_cfg(tmp_path, **overrides):
+    # Delivered into a Maildir: no network.
+    return _cfg(transport="maildir", sink_path=str(tmp_path / "mail"), mail_to="ops@example.com", **overrides)
+
+
+def _messages(tmp_path) -> list[EmailMessage]:
+    """/**
+     * @returns {Array<EmailMessage>} every delivered message, oldest first
+     */"""
+
+    paths = sorted((tmp_path / "mail" / "new").iterdir(), key=lambda p: p.stat().st_mtime_ns)
+    return [email.message_from_bytes(p.read_bytes(), policy=email.policy.default) for p in paths]
+
+
+def _delivered(tmp_path) -> list[tuple[str, str]]:
+    """/**
+     * @returns {Array<[string, string]>} (To, body) of every message, oldest first
+     */"""
+
+    return [(msg["To"], msg.get_body(("plain",)).get_content()) for msg in _messages(tmp_path)]
+
+
+def _event(i: int, excerpt: str = "e\n") -> ErrorEvent:
+    return ErrorEvent(kind="k", fp=f"f{i}", message=f"m{i}", excerpt=excerpt, ts=time.time())
+
+
+def test_rate_limit_off_by_default() -> None:
+    assert load_config(service="t").rate_limit_per_hour == 0
+    bucket = _TokenBucket(0, 1)
+    assert bucket.unlimited
+    assert all(bucket.take() for _ in range(1000))
+
+
+def test_token_bucket() -> None:
+    bucket = _TokenBucket(3600, 2)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    assert 0 < bucket.wait_seconds() <= 1.0
+
+
+def test_rate_limited_events_keep_their_cooldown_free() -> None:
+    n = Notifier(_cfg(rate_limit_per_hour=60, rate_limit_burst=2), command=["t"], cwd="/")
+    try:
+        for _ in range(3):
+            for i in range(5):
+                n.enqueue(_event(i), pid=1, exit_code=None, tail="")
+        # Two got a token and an email; the rest were never emailed.
+        assert sorted(n._cooldown._last) == ["t:f0", "t:f1"]
+        suppressed = n._default.suppressed
+        assert [suppressed.is_limited(f"t:f{i}") for i in range(5)] == [False, False, True, True, True]
+        report = suppressed.take_limited_report(n._bucket)
+        assert "9 occurrence(s) of 3 error(s)" in report
+        # Once a token is due, the next occurrence gets its own email.
+        n._bucket._tokens = 1.0
+        n.enqueue(_event(3), pid=1, exit_code=None, tail="")
+        assert "t:f3" in n._cooldown._last
+    finally:
+        n.close()
+
+
+def test_rate_limit_report_is_delivered(tmp_path) -> None:
+    n = Notifier(_mail_cfg(tmp_path, rate_limit_per_hour=60, rate_limit_burst=1), command=["t"], cwd="/")
+    try:
+        for i in (1, 2, 3, 2, 4):
+            n.enqueue(_event(i), pid=1, exit_code=None, tail="")
+        n.flush(5.0)
+    finally:
+        n.close()
+    bodies = [body for _, body in _delivered(tmp_path)]
+    # m1's own email, which carries the report if it was still queued; else the report
+    # goes out on its own at exit.
+    assert 1 <= len(bodies) <= 2
+    assert "Error Message: m1" in bodies[0]
+    assert not any(f"Error Message: m{i}" in body for body in bodies for i in (2, 3, 4))
+    reports = [body for body in bodies if "4 occurrence(s) of 3 error(s) not emailed" in body]
+    assert len(reports) == 1
+    assert "x2  [t] k: m2" in reports[0]
+
+def _pending(i: int) -> _Pending:
+    # Each costs _ITEM_OVERHEAD + 4 ("mN" + "e\n") bytes.
+    return _Pending(event=_event(i), pid=1, exit_code=None, tail="", service="svc", command=["t"], cwd="/")
+
+
+_ITEM = _ITEM_OVERHEAD + 4
+
+
+def _drain(q: _BoundedQueue) -> list:
+    out = []
+    while True:
+        try:
+            item = q.get(timeout=0)
+        except queue.Empty:
+            return out
+        out.append(item and item.event.fp)
+
+
+@pytest.mark.parametrize(
+    "policy, kept",
+    [
+        ("drop-oldest", [None, "f2", "f3", "f4"]),
+        ("drop-newest", ["f0", "f1", None, "f2"]),
+        ("merge", ["f0", "f1", None, "f2"]),
+    ],
+)
+def test_queue_policies(policy: str, kept: list) -> None:
+    q = _BoundedQueue(3 * _ITEM, policy)
+    accepted = [q.put_nowait(_pending(i)) for i in range(2)]
+    # The flush sentinel is free and never evicted.
+    assert q.put_nowait(None)
+    accepted += [q.put_nowait(_pending(i)) for i in range(2, 5)]
+    assert _drain(q) == kept
+    assert q.nbytes == 0
+    report = q.take_overload_report()
+    if policy == "drop-oldest":
+        assert accepted == [True] * 5 and q.dropped == 2
+        assert "2 notification(s) dropped" in report
+    elif policy == "drop-newest":
+        assert accepted == [True, True, True, False, False] and q.dropped == 2
+    else:
+        assert q.merged == 2 and q.dropped == 0
+        assert "x1  [svc] k: m3" in report and "x1  [svc] k: m4" in report
+    assert q.take_overload_report() == ""
+
+
+def test_queue_tracks_unfinished_tasks() -> None:
+    q = _BoundedQueue(2 * _ITEM, "drop-oldest")
+    for i in range(3):
+        q.put_nowait(_pending(i))
+    # The evicted one no longer counts: flush() does not wait for it.
+    assert q.unfinished_tasks == 2
+    q.get()
+    q.task_done()
+    assert q.unfinished_tasks == 1
+
+
+def test_digest_is_one_email_per_window(tmp_path) -> None:
+    n = Notifier(_mail_cfg(tmp_path, digest_seconds=60, digest_max_events=3), command=["t"], cwd="/")
+    try:
+        for i in (1, 2, 1, 3, 4):
+            n.enqueue(_event(i), pid=1, exit_code=None, tail="")
+        # The window is cut short at exit instead of holding the last events back.
+        n.flush(5.0)
+    finally:
+        n.close()
+    mails = _delivered(tmp_path)
+    assert len(mails) == 2
+    first, second = mails[0][1], mails[1][1]
+    assert "3 events, 3 distinct errors" in first
+    assert "m1" in first and "m3" in first and "m4" not in first
+    # A window holding a single event is sent as that event's own report.
+    assert "Error Message: m4" in second and "Digest" not in second
+    # The repeat of f1 was held back by cooldown and shows up as a count.
+    assert "(+1 more occurrences" in first
+
+
+def test_routes_pick_recipients(tmp_path) -> None:
+    routes = [
+        Route(mail_to="oncall@example.com", severity="critical"),
+        Route(mail_to="pay@example.com", service="payments-*"),
+        # Same recipients as the default: shares its queue instead of getting one.
+        Route(mail_to="ops@example.com", service="batch-*"),
+    ]
+    n = Notifier(_mail_cfg(tmp_path), command=["t"], cwd="/", routes=routes)
+    try:
+        assert len(n._routes) == 3
+        n.enqueue(_event(1), pid=1, exit_code=None, tail="", service="payments-api")
+        n.enqueue(replace(_event(2), severity="critical"), pid=1, exit_code=None, tail="", service="payments-api")
+        n.enqueue(_event(3), pid=1, exit_code=None, tail="", service="web")
+        n.enqueue(_event(4), pid=1, exit_code=None, tail="", service="batch-nightly")
+        n.flush(5.0)
+    finally:
+        n.close()
+    by_to: dict[str, list[str]] = {}
+    for to, body in _delivered(tmp_path):
+        by_to.setdefault(to, []).append(next(line for line in body.splitlines() if line.startswith("Error Message:")))
+    assert {to: sorted(msgs) for to, msgs in by_to.items()} == {
+        "pay@example.com": ["Error Message: m1"],
+        "oncall@example.com": ["Error Message: m2"],
+        "ops@example.com": ["Error Message: m3", "Error Message: m4"],
+    }
+
+
+@pytest.mark.parametrize("attach", [True, False])
+def test_long_tail_is_clipped_and_attached(tmp_path, attach: bool) -> None:
+    tail = "".join(f"{i:05d} " + "x" * 94 + "\n" for i in range(2000))
+    n = Notifier(_mail_cfg(tmp_path, body_max_bytes=8192, attach_tail=attach), command=["t"], cwd="/")
+    try:
+        n.enqueue(_event(1), pid=1, exit_code=None, tail=tail)
+        n.flush(5.0)
+    finally:
+        n.close()
+    (msg,) = _messages(tmp_path)
+    body = msg.get_body(("plain",)).get_content()
+    assert len(body.encode("utf-8")) <= 8192
+    # The first and the newest lines stay inline, the middle is cut.
+    assert "00000 " in body and "01999 " in body and "01000 " not in body
+    files = {part.get_filename(): part.get_content() for part in msg.iter_attachments()}
+    if attach:
+        assert TAIL_ATTACHMENT in body
+        assert gzip.decompress(files[TAIL_ATTACHMENT]).decode("utf-8") == tail
+    else:
+        assert files == {}
@@ -0,0 +1,48 @@
+"""/**
+ * @file test_profiling.py
+ * @description ERRMAIL_PROFILE: a run dumps per-thread profiles and allocation sites.
+ */"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = """
+import sys, time
+for i in range(3000):
+    sys.stderr.write(f"line {i}\\n")
+sys.stderr.write("Traceback (most recent call last):\\nValueError: x\\n")
+time.sleep(0.3)
+"""
+
+
+def test_profile_dump(tmp_path) -> None:
+    out = tmp_path / "prof"
+    # In a process of its own: tracemalloc and the sampler are process-wide.
+    env = {**os.environ, "ERRMAIL_PROFILE": str(out)}
+    proc = subprocess.run(
+        [sys.executable, "-m", "errmail", "run", "--", sys.executable, "-c", _CHILD],
+        cwd=_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr
+    (session,) = out.iterdir()
+    names = {p.name for p in session.iterdir()}
+    assert {"threads.txt", "memory.txt", "MainThread.folded", "errmail-notifier-default.folded"} <= names
+    threads = (session / "threads.txt").read_text()
+    assert threads.startswith("samples: ")
+    assert "== errmail-notifier-default:" in threads
+    assert "-- errmail (ring buffer, queue, detector, mailer)" in (session / "memory.txt").read_text()
+    # Collapsed stacks: "frame;frame;... count".
+    for line in (session / "MainThread.folded").read_text().splitlines():
+        stack, _, count = line.rpartition(" ")
+        assert stack and int(count) > 0
+
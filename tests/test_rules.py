@@ -0,0 +1,110 @@
+"""/**
+ * @file test_rules.py
+ * @description Rules files: parsing, loading order and errors, keyword extraction and the
+ * keyword-indexed matcher.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import re
+
+import pytest
+
+from errmail import rules as rules_mod
+from errmail.cli import main
+from errmail.config import load_config
+from errmail.rules import Route, RuleSet, _required_literal, keyword_regex, load_ruleset, load_ruleset_quietly, parse_rules
+
+_TEXT = """
+# comment
+match  kind=oom severity=critical  OOMKilled
+match  kind=app-error              /ERR-[0-9]{4}/
+match  kind=any-timeout            /[0-9]+ (timeout|refused)/
+ignore                             /DeprecationWarning: .* is deprecated/
+route  service=payments-* severity=critical  to=pay@example.com
+"""
+
+
+def test_parse_rules() -> None:
+    parsed = parse_rules(_TEXT, "t")
+    assert [r.keyword for r in parsed if not isinstance(r, Route)] == ["OOMKilled", "ERR-", None, "DeprecationWarning: "]
+    route = [r for r in parsed if isinstance(r, Route)][0]
+    assert route.matches("payments-api", "oom", "critical")
+    assert not route.matches("payments-api", "oom", "error")
+    with pytest.raises(ValueError):
+        parse_rules("match /[unclosed/", "t")
+    with pytest.raises(ValueError):
+        parse_rules("match severity=loud x", "t")
+
+
+def test_matcher_earliest_wins() -> None:
+    rs = RuleSet(parse_rules(_TEXT, "t"))
+    assert rs.full_scan
+    assert rs.match("pod OOMKilled after ERR-1234").kind == "oom"
+    assert rs.match("ERR-1234 then OOMKilled").kind == "app-error"
+    assert rs.match("3 timeout in a row").kind == "any-timeout"
+    assert rs.match("ERR-12 is too short") is None
+    assert rs.ignored("DeprecationWarning: foo is deprecated")
+    assert not rs.ignored("DeprecationWarning: foo")
+
+
+def test_keyword_regex_prefers_longer_words() -> None:
+    rx = re.compile(keyword_regex(["ERR", "ERROR", "Fatal"]))
+    assert rx.search("an ERROR here").group(0) == "ERROR"
+    assert rx.search("ERR-1").group(0) == "ERR"
+    assert rx.search("nothing") is None
+
+
+def test_required_literal() -> None:
+    assert _required_literal(r"ERR-[0-9]{4}") == "ERR-"
+    assert _required_literal(r"connection (reset|refused)") == "connection "
+    assert _required_literal(r"(?i)fatal error") is None
+    assert _required_literal(r"a|b") is None
+
+
+class _BrokenParser:
+    """/**
+     * @description Stand-in for a CPython release whose private regex parser changed.
+     */"""
+
+    LITERAL = object()
+
+    @staticmethod
+    def parse(pattern: str):
+        raise AttributeError("no such API")
+
+
+@pytest.mark.parametrize("parser", [None, _BrokenParser])
+def test_required_literal_falls_back_without_the_parser(monkeypatch: pytest.MonkeyPatch, parser) -> None:
+    monkeypatch.setattr(rules_mod, "_sre_parse", parser)
+    assert _required_literal(r"ERR-[0-9]{4}") is None
+    rs = RuleSet(parse_rules("match kind=app-error /ERR-[0-9]{4}/", "t"))
+    # No keyword: the regex runs on every line, nothing is missed.
+    assert rs.full_scan
+    assert rs.match("failed with ERR-1234").kind == "app-error"
+
+
+def test_rules_files(tmp_path, monkeypatch: pytest.MonkeyPatch, capsys) -> None:
+    (tmp_path / "etc").mkdir()
+    system, user, own = tmp_path / "etc" / "system.rules", tmp_path / "etc" / "user.rules", tmp_path / "etc" / "own.rules"
+    system.write_text("match kind=system Timeout\n", encoding="utf-8")
+    own.write_text("match kind=own Timeout\nmatch kind=own-only Overheated\n", encoding="utf-8")
+    # The user file does not exist: skipped.
+    monkeypatch.setattr(rules_mod, "DEFAULT_RULES_PATHS", (str(system), str(user)))
+    cfg = replace(load_config(service="t"), rules_file=str(own))
+    rs = load_ruleset(cfg)
+    # Loaded in order, and the first matching rule wins: the system file comes first.
+    assert rs.match("Timeout talking to db").kind == "system"
+    assert rs.match("Overheated").kind == "own-only"
+
+    own.write_text("match kind=own Timeout\nmatch /[broken/\n", encoding="utf-8")
+    with pytest.raises(ValueError, match=f"{re.escape(str(own))}:2: invalid regex"):
+        load_ruleset(cfg)
+    assert load_ruleset_quietly(cfg) is None
+    # The CLI refuses to run with rules it cannot load rather than running without them.
+    monkeypatch.setenv("ERRMAIL_RULES_FILE", str(own))
+    assert main(["run", "--", "true"]) == 2
+    assert "invalid rules" in capsys.readouterr().err
+    with pytest.raises(OSError):
+        load_ruleset(replace(cfg, rules_file=str(tmp_path / "missing.rules")))
@@ -0,0 +1,117 @@
+"""/**
+ * @file test_runner.py
+ * @description stderr pumps: passthrough, detection, and emitting an open trace when idle.
+ * run_command: the same passthrough, events and exit codes with every runner and pump.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+from errmail import runner
+from errmail.config import load_config
+from errmail.detector import StderrDetector
+
+_JAVA = b'Exception in thread "main" java.lang.IllegalStateException: boom\n\tat Foo.bar(Foo.java:1)\n'
+
+
+@pytest.mark.parametrize("select_pipes", [True, False])
+def test_binary_pump_emits_an_idle_trace(monkeypatch: pytest.MonkeyPatch, capfd, select_pipes: bool) -> None:
+    # False: the Windows path, where select() cannot wait on a pipe.
+    monkeypatch.setattr(runner, "_SELECT_PIPES", select_pipes)
+    r, w = os.pipe()
+    events: queue.Queue = queue.Queue()
+    with os.fdopen(r, "rb", buffering=0) as stream:
+        pump = threading.Thread(target=runner._pump_stderr_binary, args=(stream, StderrDetector(), events.put))
+        pump.start()
+        os.write(w, _JAVA)
+        # The trace has no end marker: it goes out once stderr is quiet, before EOF.
+        evt = events.get(timeout=3.0)
+        assert "IllegalStateException" in evt.message
+        os.write(w, b"plain output\n")
+        os.close(w)
+        pump.join(3.0)
+        assert not pump.is_alive()
+    assert events.empty()
+    assert capfd.readouterr().err.encode() == _JAVA + b"plain output\n"
+
+
+def test_text_pump_emits_an_idle_trace(capfd) -> None:
+    r, w = os.pipe()
+    events: queue.Queue = queue.Queue()
+    with os.fdopen(r, "r", encoding="utf-8") as stream:
+        pump = threading.Thread(target=runner._pump_stderr, args=(stream, StderrDetector(), events.put))
+        pump.start()
+        os.write(w, _JAVA)
+        assert "IllegalStateException" in events.get(timeout=3.0).message
+        os.close(w)
+        pump.join(3.0)
+        assert not pump.is_alive()
+    assert events.empty()
+
+
+class _Recorder:
+    """/**
+     * @description Stands in for Notifier: keeps (kind, message, exit_code) of enqueued events.
+     */"""
+
+    def __init__(self) -> None:
+        self.events: list[tuple[str, str, "int | None"]] = []
+        self.closed = False
+
+    def enqueue(self, event, *, exit_code=None, **_kwargs) -> None:
+        self.events.append((event.kind, event.message, exit_code))
+
+    def flush(self, timeout_seconds: float = 0.0) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+_MODES = [
+    pytest.param("asyncio", "binary", False, id="asyncio"),
+    pytest.param("thread", "binary", False, id="thread"),
+    pytest.param("thread", "text", False, id="thread-text"),
+    pytest.param("asyncio", "binary", True, id="asyncio-pty"),
+    pytest.param("thread", "binary", True, id="thread-pty"),
+]
+
+_CHILD = """
+import sys
+sys.stdout.write("out 1\\n")
+sys.stdout.flush()
+sys.stderr.write("Traceback (most recent call last):\\n  File \\"x.py\\", line 1, in <module>\\nValueError: bad\\n")
+sys.stderr.flush()
+print("isatty", sys.stdout.isatty(), sys.stderr.isatty())
+sys.exit(int(sys.argv[1]))
+"""
+
+
+@pytest.mark.parametrize("runner_name, pump_mode, pty", _MODES)
+def test_run_command(capfd, runner_name: str, pump_mode: str, pty: bool) -> None:
+    cfg = replace(load_config(service="t"), runner=runner_name, pump_mode=pump_mode, pty=pty)
+    notifier = _Recorder()
+    assert runner.run_command([sys.executable, "-c", _CHILD, "3"], cfg=cfg, notifier=notifier) == 3
+    assert notifier.closed
+    # The traceback is the event; the non-zero exit is not reported on top of it.
+    assert notifier.events == [("python-traceback", "ValueError: bad", None)]
+    out, err = capfd.readouterr()
+    # A pty's line discipline turns "\n" into "\r\n".
+    assert out.replace("\r\n", "\n") == f"out 1\nisatty {pty} {pty}\n"
+    assert "ValueError: bad" in err
+
+
+@pytest.mark.parametrize("runner_name, pump_mode, pty", _MODES)
+def test_nonzero_exit_without_error_output(capfd, runner_name: str, pump_mode: str, pty: bool) -> None:
+    cfg = replace(load_config(service="t"), runner=runner_name, pump_mode=pump_mode, pty=pty)
+    notifier = _Recorder()
+    assert runner.run_command([sys.executable, "-c", "import sys; sys.exit(5)"], cfg=cfg, notifier=notifier) == 5
+    assert notifier.events == [("exit-nonzero", "process exited with code 5", 5)]
+    assert runner.run_command([sys.executable, "-c", "pass"], cfg=cfg, notifier=_Recorder()) == 0
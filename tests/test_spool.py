@@ -0,0 +1,150 @@
+"""/**
+ * @file test_spool.py
+ * @description Durable outbox: spooling, acks, crash recovery and platform fallback.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from errmail import spool
+from errmail.config import load_config
+from errmail.detector import ErrorEvent
+from errmail.notifier import Notifier
+from errmail.spool import Outbox
+
+
+def test_cli_imports_without_fcntl() -> None:
+    # As on Windows: every subcommand imports the spool through the notifier.
+    code = "import sys; sys.modules['fcntl'] = None; import errmail.cli, errmail.spool as s; print(s.Outbox('x').durable)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_no_flock_means_memory_outbox(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(spool, "fcntl", None)
+    directory = tmp_path / "spool"
+    outbox = Outbox(str(directory))
+    assert not outbox.durable
+    outbox.put("s", "b", "to@example.com")
+    outbox.commit()
+    assert outbox.pending() == 1
+    assert not directory.exists()
+
+
+def _cfg(directory, **overrides):
+    return replace(
+        load_config(service="t"),
+        mail_to="ops@example.com",
+        mail_from="errmail@example.com",
+        smtp_host="127.0.0.1",
+        smtp_tls=False,
+        spool=True,
+        spool_dir=str(directory),
+        cooldown_store="memory",
+        digest_seconds=0,
+        **overrides,
+    )
+
+
+def _messages(directory) -> list[dict]:
+    recs = [json.loads(line) for path in directory.glob("*.jsonl") for line in path.read_text().splitlines()]
+    acked = {r["ack"] for r in recs if "ack" in r}
+    return [r for r in recs if "id" in r and r["id"] not in acked]
+
+
+def test_crash_recovery(tmp_path) -> None:
+    directory = tmp_path / "spool"
+    code = (
+        "import os, sys; from errmail.spool import Outbox\n"
+        "o = Outbox(sys.argv[1]); o.put('s1', 'b1', None); o.put('s2', 'b2', None); o.commit(); os._exit(1)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code, str(directory)], cwd=root, check=False)
+    assert [r["subject"] for r in _messages(directory)] == ["s1", "s2"]
+
+    outbox = Outbox(str(directory))
+    assert outbox.adopt_orphans() == 0
+    sent: list[str] = []
+    assert outbox.send_due(lambda entry: sent.append(entry.subject)) == 2
+    assert sent == ["s1", "s2"]
+    assert outbox.close(handoff=False) == 0
+    assert list(directory.iterdir()) == []
+
+
+def test_close_does_not_wait_for_a_slow_relay(tmp_path, monkeypatch) -> None:
+    # A relay that accepts the connection but never greets: every send hangs.
+    relay = socket.socket()
+    relay.bind(("127.0.0.1", 0))
+    relay.listen()
+    drains: list[str] = []
+    monkeypatch.setattr(spool, "spawn_drain", lambda directory, verbose=False: drains.append(directory))
+    directory = tmp_path / "spool"
+    n = Notifier(_cfg(directory, smtp_port=relay.getsockname()[1]), command=["t"], cwd="/")
+    try:
+        event = ErrorEvent(kind="k", fp="f1", message="first", excerpt="e\n", ts=time.time())
+        n.enqueue(event, pid=1, exit_code=None, tail="")
+        n.flush(2.0)
+        time.sleep(0.2)
+        # Queued behind the hung send: close() has to spool it itself.
+        n.enqueue(replace(event, fp="f2", message="second"), pid=1, exit_code=None, tail="")
+        start = time.monotonic()
+        n.close()
+        assert time.monotonic() - start < 1.0
+    finally:
+        relay.close()
+    assert drains == [str(directory)]
+    assert len(_messages(directory)) == 2
+
+
+def test_spool_is_opt_in(monkeypatch) -> None:
+    assert not spool.open_outbox(load_config(service="t")).durable
+    monkeypatch.setenv("ERRMAIL_SPOOL", "1")
+    assert load_config(service="t").spool
+
+
+def test_backoff_and_retry(tmp_path) -> None:
+    directory = tmp_path / "spool"
+    outbox = Outbox(str(directory))
+    for i in range(3):
+        outbox.put(f"s{i}", "b", "ops@example.com")
+    outbox.commit()
+    tried: list[str] = []
+
+    def down(entry) -> str:
+        tried.append(entry.subject)
+        return "ConnectionRefusedError"
+
+    assert outbox.send_due(down) == 0
+    # The first failure defers the rest too: the relay is probably down.
+    assert tried == ["s0"]
+    assert 29 < outbox.next_due() <= spool.backoff_seconds(1) == 30.0
+    assert outbox.send_due(down) == 0 and tried == ["s0"]
+    assert [spool.backoff_seconds(n) for n in (1, 2, 3, 7, 20)] == [30.0, 60.0, 120.0, 1800.0, 1800.0]
+    assert len(_messages(directory)) == 3
+
+    for entry in outbox._waiting:
+        entry.due = 0.0
+    assert outbox.send_due(lambda entry: None) == 3
+    assert outbox.pending() == 0
+    assert _messages(directory) == []
+    outbox.close(handoff=False)
+
+
+def test_gives_up_after_a_day(tmp_path) -> None:
+    outbox = Outbox(str(tmp_path / "spool"))
+    outbox.put("s", "b", "ops@example.com")
+    outbox.commit()
+    outbox._waiting[0].ts -= 25 * 3600
+    assert outbox.send_due(lambda entry: "SMTPServerDisconnected") == 0
+    assert outbox.expired == 1
+    assert outbox.pending() == 0
+    assert _messages(tmp_path / "spool") == []
+    outbox.close(handoff=False)
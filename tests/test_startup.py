@@ -0,0 +1,49 @@
+"""/**
+ * @file test_startup.py
+ * @description A run that sends no mail never loads the mail stack or the profiler.
+ */"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+from bench_startup import LAZY_MODULES
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_RUN = f"""
+import sys
+from errmail.cli import main
+code = main(["run", "--", sys.executable, "-c", "import sys; sys.stderr.write('Traceback (most recent call last):\\\\nValueError: x\\\\n')"])
+print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))
+sys.exit(code)
+"""
+
+
+def test_run_without_mail_keeps_lazy_modules_unloaded() -> None:
+    # An error is detected, but with no recipients nothing is sent.
+    proc = subprocess.run([sys.executable, "-c", _RUN], cwd=_ROOT, capture_output=True, text=True, timeout=60, check=False)
+    assert proc.returncode == 0, proc.stderr
+    assert "ValueError: x" in proc.stderr
+    assert proc.stdout.strip() == ""
+
+
+def test_sending_loads_the_mail_stack(tmp_path) -> None:
+    code = (
+        "import sys\n"
+        "from dataclasses import replace\n"
+        "from errmail.config import load_config\n"
+        "from errmail.mailer import MailPayload, send_mail\n"
+        "cfg = replace(load_config(service='t'), transport='maildir', sink_path=sys.argv[1],\n"
+        "              mail_to='ops@example.com', mail_from='errmail@example.com')\n"
+        "assert send_mail(cfg, MailPayload(subject='s', body='b')) is None\n"
+        "print('smtplib' in sys.modules, 'email.message' in sys.modules)\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code, str(tmp_path / "mail")], cwd=_ROOT, capture_output=True, text=True, timeout=60, check=False
+    )
+    assert proc.returncode == 0, proc.stderr
+    # A file transport builds the message but never needs smtplib.
+    assert proc.stdout.split() == ["False", "True"]
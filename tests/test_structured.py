@@ -0,0 +1,77 @@
+"""/**
+ * @file test_structured.py
+ * @description JSON-lines ingestion: which records are errors, and what is kept of them.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import json
+
+from errmail.config import load_config
+from errmail.detector import detector_for
+from errmail.structured import error_line_indexes, may_be_error, parse_error_record
+
+
+def test_level_and_stack_decide() -> None:
+    assert parse_error_record('{"level": "error", "msg": "db down"}').message == "db down"
+    assert parse_error_record('{"level": 60, "msg": "boom"}').severity == "critical"
+    assert parse_error_record('{"level": 50, "msg": "boom"}').severity == "error"
+    assert parse_error_record('{"level": "info", "msg": "retrying after ERROR"}') is None
+    rec = parse_error_record('{"msg": "x", "stack": "Error: x\\n    at f (a.js:1:1)"}')
+    assert rec is not None and rec.stack.startswith("Error: x")
+    assert parse_error_record('{"msg": "x", "stack": null}') is None
+
+
+def test_zero_is_a_value() -> None:
+    # "level": 0 is an explicit (low) level, not a missing one.
+    assert parse_error_record('{"level": 0, "severity": "error", "msg": "x"}') is None
+    rec = parse_error_record('{"level": "error", "msg": 0, "code": 0}')
+    assert rec is not None
+    assert rec.message == "0"
+    assert ("code", "0") in rec.fields
+
+
+def test_prefilter_never_hides_an_error() -> None:
+    lines = [
+        {"level": "error", "msg": "a"},
+        {"severity": "FATAL", "message": "b"},
+        {"lvl": 55, "msg": "c"},
+        {"exception": "Traceback ...", "msg": "d"},
+        {"level": "warn", "msg": "e"},
+        {"msg": "level error in text"},
+        {"error": {"stack": "Error: f"}, "msg": "f"},
+    ]
+    texts = [json.dumps(obj) for obj in lines]
+    for text in texts:
+        if parse_error_record(text) is not None:
+            assert may_be_error(text)
+    body = "\n".join(texts) + "\n"
+    wanted = [i for i, text in enumerate(texts) if parse_error_record(text) is not None]
+    assert set(wanted) <= set(error_line_indexes(body))
+
+
+_LOG = [
+    {"level": "info", "msg": "retrying after ERROR 503", "time": "10:00:00"},
+    {"level": "error", "logger": "db", "msg": "connection lost", "request_id": "r1", "time": "10:00:01"},
+    {"level": "error", "logger": "db", "msg": "connection lost", "request_id": "r2", "time": "10:00:02"},
+    {"level": "fatal", "msg": "crash", "exception": "Traceback (most recent call last):\n  File \"a.py\"\nKeyError: 'k'"},
+]
+
+
+def test_json_mode_detector() -> None:
+    det = detector_for(replace(load_config(service="t"), input_format="json"))
+    text = "".join(json.dumps(obj) + "\n" for obj in _LOG) + "ValueError: not json\n"
+    events = det.push_chunk(text.encode()) + det.finish()
+    assert [(e.kind, e.message, e.severity) for e in events] == [
+        ("json-error", "connection lost", "error"),
+        ("json-error", "connection lost", "error"),
+        ("json-exception", "crash", "critical"),
+        # Not JSON: judged by the text heuristics.
+        ("stderr-line", "ValueError: not json", "error"),
+    ]
+    # Fingerprinted on logger/message/exception: request ids and times do not split them.
+    assert events[0].fp == events[1].fp
+    assert ("request_id", "r1") in events[0].fields
+    assert events[2].excerpt.startswith("Traceback (most recent call last):\n")
+    assert events[2].excerpt.endswith("KeyError: 'k'\n")
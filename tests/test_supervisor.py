@@ -0,0 +1,102 @@
+"""/**
+ * @file test_supervisor.py
+ * @description `errmail supervise`: commands file parsing, exit codes, per-service
+ * detection and signal forwarding.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import email
+import email.policy
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from errmail.config import load_config
+from errmail.supervisor import ChildSpec, parse_commands_file, supervise
+
+
+def test_parse_commands_file(tmp_path) -> None:
+    path = tmp_path / "commands"
+    path.write_text("# services\n\napi = python -m http.server 'port 8000'\nworker=./run.sh --queue jobs\n", encoding="utf-8")
+    assert parse_commands_file(str(path)) == [
+        ChildSpec("api", ["python", "-m", "http.server", "port 8000"]),
+        ChildSpec("worker", ["./run.sh", "--queue", "jobs"]),
+    ]
+    path.write_text("no equals sign\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        parse_commands_file(str(path))
+
+
+def test_supervise_returns_first_failure_in_file_order(tmp_path) -> None:
+    cfg = replace(load_config(service="t"), mail_to=None, spool=False, cooldown_store="memory")
+    specs = [
+        ChildSpec("ok", [sys.executable, "-c", "pass"]),
+        ChildSpec("slow-fail", [sys.executable, "-c", "import time; time.sleep(0.2); raise SystemExit(3)"]),
+        ChildSpec("fail", [sys.executable, "-c", "raise SystemExit(4)"]),
+    ]
+    assert supervise(specs, cfg=cfg, cwd=str(tmp_path)) == 3
+    assert supervise(specs[:1], cfg=cfg, cwd=str(tmp_path)) == 0
+    assert supervise([ChildSpec("missing", [str(tmp_path / "nope")])], cfg=cfg, cwd=str(tmp_path)) == 127
+
+
+# Writes a traceback a line at a time, interleaved with the other children's.
+_TRACE = """
+import sys, time
+name = sys.argv[1]
+for line in ["Traceback (most recent call last):", f'  File "{name}.py", line 1, in <module>', f"RuntimeError: {name} broke"]:
+    sys.stderr.write(line + "\\n")
+    sys.stderr.flush()
+    time.sleep(0.05)
+"""
+
+
+def test_each_child_has_its_own_detector(tmp_path) -> None:
+    cfg = replace(
+        load_config(service="t"),
+        mail_to="ops@example.com",
+        transport="maildir",
+        sink_path=str(tmp_path / "mail"),
+        spool=False,
+        cooldown_store="memory",
+        digest_seconds=0,
+    )
+    specs = [ChildSpec(name, [sys.executable, "-c", _TRACE, name]) for name in ("api", "worker")]
+    specs.append(ChildSpec("cron", [sys.executable, "-c", "raise SystemExit(2)"]))
+    assert supervise(specs, cfg=cfg, cwd=str(tmp_path)) == 2
+    got = {}
+    for path in (tmp_path / "mail" / "new").iterdir():
+        body = email.message_from_bytes(path.read_bytes(), policy=email.policy.default).get_content()
+        fields = dict(line.split(":", 1) for line in body.splitlines() if line.startswith(("Service:", "Error Message:")))
+        got[fields["Service"].strip()] = (fields["Error Message"].strip(), body)
+    assert {svc: msg for svc, (msg, _) in got.items()} == {
+        "api": "RuntimeError: api broke",
+        "worker": "RuntimeError: worker broke",
+        "cron": "process exited with code 2",
+    }
+    assert "worker.py" not in got["api"][1] and "api.py" not in got["worker"][1]
+
+
+def test_signals_are_forwarded_to_the_children(tmp_path) -> None:
+    commands = tmp_path / "commands"
+    # One write() for the line, so the two children's lines cannot interleave.
+    child = "import os, signal, sys, time; signal.signal(signal.SIGTERM, lambda *a: sys.exit(7)); os.write(1, b'up\\n'); time.sleep(30)"
+    commands.write_text(f'a = {sys.executable} -c "{child}"\nb = {sys.executable} -c "{child}"\n', encoding="utf-8")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "errmail", "supervise", str(commands)], cwd=root, stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert proc.stdout.readline() == "up\n" and proc.stdout.readline() == "up\n"
+        start = time.monotonic()
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=10) == 7
+        assert time.monotonic() - start < 5
+    finally:
+        proc.kill()
+        proc.wait()
@@ -0,0 +1,135 @@
+"""/**
+ * @file test_transports.py
+ * @description Delivery transports (ERRMAIL_TRANSPORT) against the stub servers.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import json
+import mailbox
+import os
+import subprocess
+import sys
+import threading
+
+from smtp_stub import StubLmtpServer
+
+from errmail.config import load_config
+from errmail.mailer import MailPayload, send_mail
+from errmail.spool import drain
+from errmail.transports import LmtpSession, open_transport
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TO = "a@one.example, b@two.example"
+
+
+def _lmtp_cfg(sock: str):
+    return replace(
+        load_config(service="t"), transport="lmtp", lmtp_socket=sock, mail_from="errmail@example.com", mail_to=_TO
+    )
+
+
+def test_lmtp_reports_refused_recipients(tmp_path) -> None:
+    sock = str(tmp_path / "lmtp.sock")
+    with StubLmtpServer(sock) as srv:
+        srv.reject = {"b@two.example"}
+        session = LmtpSession(_lmtp_cfg(sock))
+        err = send_mail(_lmtp_cfg(sock), MailPayload(subject="s", body="b"), session=session)
+        assert err is not None and "SMTPRecipientsRefused" in err
+        assert session.refused == ["b@two.example"]
+        assert srv.by_domain == {"one.example": 1}
+        # Nobody has it: no partial status, the whole message is retried.
+        srv.reject = {"a@one.example", "b@two.example"}
+        assert send_mail(_lmtp_cfg(sock), MailPayload(subject="s", body="b"), session=session)
+        assert session.refused == []
+        srv.reject = set()
+        assert send_mail(_lmtp_cfg(sock), MailPayload(subject="s", body="b"), session=session) is None
+        assert session.refused == []
+        session.close()
+
+
+def test_lmtp_retry_goes_to_refused_recipients_only(tmp_path) -> None:
+    spool_dir = tmp_path / "spool"
+    # A spooled email left behind by an exited process.
+    code = "import os, sys; from errmail.spool import Outbox\no = Outbox(sys.argv[1]); o.put('s', 'b', sys.argv[2]); o.commit(); os._exit(1)\n"
+    subprocess.run([sys.executable, "-c", code, str(spool_dir), _TO], cwd=_ROOT, check=False)
+    sock = str(tmp_path / "lmtp.sock")
+    cfg = _lmtp_cfg(sock)
+    with StubLmtpServer(sock) as srv:
+        srv.reject = {"b@two.example"}
+        assert drain(cfg, str(spool_dir)) == (0, 1)
+        records = [json.loads(line) for path in spool_dir.glob("*.jsonl") for line in path.read_text().splitlines()]
+        assert {"rcpt": 1, "to": "b@two.example"} in records
+        srv.reject = set()
+        assert drain(cfg, str(spool_dir)) == (1, 0)
+    assert srv.by_domain == {"one.example": 1, "two.example": 1}
+    assert list(spool_dir.iterdir()) == []
+
+
+def _sink_cfg(transport: str, path: str):
+    return replace(
+        load_config(service="t"), transport=transport, sink_path=path, mail_from="errmail@example.com", mail_to=_TO
+    )
+
+
+def test_maildir(tmp_path) -> None:
+    cfg = _sink_cfg("maildir", str(tmp_path / "Maildir"))
+    session = open_transport(cfg)
+    for i in range(3):
+        assert send_mail(cfg, MailPayload(subject=f"s{i}", body="b"), session=session) is None
+    session.close()
+    box = mailbox.Maildir(str(tmp_path / "Maildir"), factory=None, create=False)
+    assert len(box) == 3
+    assert list((tmp_path / "Maildir" / "tmp").iterdir()) == []
+
+
+def test_maildir_created_concurrently(tmp_path) -> None:
+    # Several routes (or processes) opening the same Maildir for the first time.
+    cfg = _sink_cfg("maildir", str(tmp_path / "Maildir"))
+    errors: list = []
+
+    def send() -> None:
+        errors.append(send_mail(cfg, MailPayload(subject="s", body="b"), session=open_transport(cfg)))
+
+    for _ in range(20):
+        threads = [threading.Thread(target=send) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert errors == [None] * 80
+    assert len(mailbox.Maildir(str(tmp_path / "Maildir"), factory=None, create=False)) == 80
+
+def test_mbox_escapes_from_lines(tmp_path) -> None:
+    path = tmp_path / "sub" / "errors.mbox"
+    cfg = _sink_cfg("mbox", str(path))
+    session = open_transport(cfg)
+    body = "line one\nFrom the top\nlast\n"
+    for i in range(2):
+        assert send_mail(cfg, MailPayload(subject=f"s{i}", body=body), session=session) is None
+    box = mailbox.mbox(str(path), create=False)
+    messages = list(box)
+    assert len(messages) == 2
+    assert [m["To"] for m in messages] == [_TO, _TO]
+    # Without the escape the second line would have started a third message.
+    assert ">From the top" in messages[0].get_payload(decode=True).decode()
+
+
+def test_sendmail(tmp_path) -> None:
+    out = tmp_path / "sent"
+    fake = tmp_path / "sendmail"
+    fake.write_text(f'#!/bin/sh\n[ "$1 $2" = "-t -oi" ] || exit 64\ncat >> {out}\n')
+    fake.chmod(0o755)
+    cfg = replace(_sink_cfg("sendmail", ""), sendmail_path=str(fake))
+    assert send_mail(cfg, MailPayload(subject="s", body="b"), session=open_transport(cfg)) is None
+    assert f"To: {_TO}" in out.read_text()
+
+
+def test_sendmail_failure(tmp_path) -> None:
+    fake = tmp_path / "sendmail"
+    fake.write_text("#!/bin/sh\necho 'queue full' >&2\nexit 75\n")
+    fake.chmod(0o755)
+    cfg = replace(_sink_cfg("sendmail", ""), sendmail_path=str(fake))
+    err = send_mail(cfg, MailPayload(subject="s", body="b"), session=open_transport(cfg))
+    assert err is not None and "exited with 75: queue full" in err
@@ -0,0 +1,84 @@
+"""/**
+ * @file test_utils.py
+ * @description Fingerprinting (the single-pass normalizer must give byte-for-byte the
+ * output of the three substitutions it replaced, or every stored cooldown key changes)
+ * and tail snapshots.
+ */"""
+
+from __future__ import annotations
+
+import hashlib
+import random
+import re
+
+import pytest
+
+from errmail.utils import RingBuffer, TailSnapshot, fingerprint, normalize_for_fingerprint, tail_text
+
+_RE_HEX_ADDR = re.compile(r"0x[0-9a-fA-F]+")
+_RE_LINE_NO = re.compile(r"\bline\s+\d+\b")
+_RE_INT = re.compile(r"\b\d+\b")
+
+
+def _legacy_normalize(text: str) -> str:
+    s = text.strip()
+    s = _RE_HEX_ADDR.sub("0x?", s)
+    s = _RE_LINE_NO.sub("line ?", s)
+    s = _RE_INT.sub("?", s)
+    return s
+
+
+def _legacy_fingerprint(text: str) -> str:
+    return hashlib.sha1(_legacy_normalize(text).encode("utf-8", errors="replace")).hexdigest()[:12]
+
+
+# Fragments chosen to hit the tricky spots: adjacent hex/"line"/digits, word boundaries,
+# non-ASCII digits (matched by \d but not by the hex class), whitespace runs.
+_TOKENS = [
+    "0x", "0X", "0x1f", "0xdeadBEEF", "line", "line ", "line\t", "Line ", " ", "  ", "\t", "\n",
+    "0", "1", "42", "007", "9", "a", "f", "F", "g", "x", "z", "_", ".", ":", ",", "(", ")", "'",
+    "٣", "०", "é", "é1", "Error", "at ", "File \"x.py\", ", "port=", "ms",
+]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "  line 12  ",
+        "0xfline 5",
+        "0x1f42 and 0xdeadBEEF7",
+        "0x1fline\t9x",
+        "x0x12 line 3",
+        "at 0x7f00000001 after 21 ms",
+        "port=8080 line 0 ٣ ०1",
+        'File "/srv/app/worker.py", line 101, in handle\n    raise TimeoutError(7)',
+    ],
+)
+def test_normalizer_matches_the_substitution_chain(text: str) -> None:
+    assert normalize_for_fingerprint(text) == _legacy_normalize(text)
+    assert fingerprint(text) == _legacy_fingerprint(text)
+
+
+def test_normalizer_matches_the_substitution_chain_randomized() -> None:
+    rng = random.Random(0)
+    for _ in range(20_000):
+        text = "".join(rng.choice(_TOKENS) for _ in range(rng.randint(0, 24)))
+        assert normalize_for_fingerprint(text) == _legacy_normalize(text), text
+
+
+def test_tail_snapshot_is_frozen_and_shared() -> None:
+    ring = RingBuffer(max_lines=3)
+    ring.extend(["a\n", "b\n"])
+    snap = ring.snapshot()
+    # Unchanged buffer: every event of a batch gets the same snapshot.
+    assert ring.snapshot() is snap
+    ring.push("c\n")
+    ring.push("d\n")
+    assert snap.text == "a\nb\n" and snap.nbytes == 4
+    later = ring.snapshot()
+    assert later is not snap
+    assert later.lines == ("b\n", "c\n", "d\n")
+    assert tail_text(later) == ring.tail() == "b\nc\nd\n"
+    assert tail_text("plain") == "plain"
+    assert TailSnapshot(("x",) * 3).nbytes == 3
@@ -0,0 +1,129 @@
+"""/**
+ * @file test_watcher.py
+ * @description `errmail watch`: checkpointed offsets, rotation and truncation.
+ */"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import os
+
+from errmail.config import load_config
+from errmail.watcher import Watcher
+
+
+class _Recorder:
+    """/**
+     * @description Stands in for Notifier: keeps the messages of enqueued events.
+     */"""
+
+    def __init__(self) -> None:
+        self.messages: list[str] = []
+
+    def enqueue(self, event, **_kwargs) -> None:
+        self.messages.append(event.message)
+
+
+def _watcher(tmp_path, log, notifier: _Recorder, from_start: bool = True) -> Watcher:
+    cfg = replace(load_config(service="t"), mail_to=None)
+    w = Watcher([str(log)], cfg=cfg, notifier=notifier, state_path=str(tmp_path / "state.json"), from_start=from_start)
+    w.start()
+    return w
+
+
+def _append(path, text: str) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_restart_resumes_at_the_checkpoint(tmp_path) -> None:
+    log = tmp_path / "app.log"
+    log.write_text("INFO start\nERROR one\n")
+    seen = _Recorder()
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    # A partial line is not consumed: the next run reads it complete.
+    _append(log, "ERROR tw")
+    w.poll()
+    w.close()
+    assert seen.messages == ["ERROR one"]
+
+    _append(log, "o\nERROR three\n")
+    seen = _Recorder()
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    w.close()
+    assert seen.messages == ["ERROR two", "ERROR three"]
+
+
+def test_new_files_start_at_their_end(tmp_path) -> None:
+    log = tmp_path / "app.log"
+    log.write_text("ERROR old\n")
+    seen = _Recorder()
+    w = _watcher(tmp_path, log, seen, from_start=False)
+    _append(log, "ERROR new\n")
+    w.poll()
+    w.close()
+    assert seen.messages == ["ERROR new"]
+
+
+def test_rotation_while_running(tmp_path) -> None:
+    log = tmp_path / "app.log"
+    log.write_text("ERROR one\n")
+    seen = _Recorder()
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    os.rename(log, tmp_path / "app.log.1")
+    # Written by the app before it reopened its log.
+    _append(tmp_path / "app.log.1", "ERROR late\n")
+    log.write_text("ERROR fresh\n")
+    w.poll()
+    w.close()
+    assert seen.messages == ["ERROR one", "ERROR late", "ERROR fresh"]
+
+
+def test_rotation_while_down(tmp_path) -> None:
+    log = tmp_path / "app.log"
+    log.write_text("ERROR one\n")
+    seen = _Recorder()
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    w.close()
+    _append(log, "ERROR missed\n")
+    os.rename(log, tmp_path / "app.log-20240501")
+    log.write_text("ERROR fresh\n")
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    w.close()
+    assert seen.messages == ["ERROR one", "ERROR missed", "ERROR fresh"]
+
+
+def test_truncation(tmp_path) -> None:
+    log = tmp_path / "app.log"
+    log.write_text("INFO a long first line that is not an error\nERROR one\n")
+    seen = _Recorder()
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    # copytruncate, then less than before: the size gives it away.
+    log.write_text("ERROR two\n")
+    w.poll()
+    # Truncated and rewritten past our offset between two polls: the head hash does.
+    log.write_text("ERROR three\n" + "INFO padding padding padding\n" * 4)
+    w.poll()
+    w.close()
+    assert seen.messages == ["ERROR one", "ERROR two", "ERROR three"]
+
+
+def test_truncation_while_down(tmp_path) -> None:
+    log = tmp_path / "app.log"
+    log.write_text("ERROR one\n")
+    seen = _Recorder()
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    w.close()
+    with open(log, "w", encoding="utf-8") as f:
+        f.write("ERROR rewritten\n" + "INFO padding\n" * 4)
+    w = _watcher(tmp_path, log, seen)
+    w.poll()
+    w.close()
+    assert seen.messages == ["ERROR one", "ERROR rewritten"]